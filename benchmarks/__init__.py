@@ -0,0 +1,6 @@
+'''
+Benchmarks of parallelogram, run on a cluster of servers started inside a
+single process (see cluster.py). Run them with:
+
+python -m benchmarks.run
+'''
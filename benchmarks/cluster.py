@@ -0,0 +1,134 @@
+'''
+This file defines the Loopback_Cluster class, which starts servers inside
+the calling process so jobs can be benchmarked on a single machine.
+
+A job talks to all of its servers on the same port, so servers on one
+machine can't be told apart by their port. Each server listens on an
+address of its own on the loopback network instead (127.0.0.2, 127.0.0.3,
+...), which Linux routes without any setup. Discovery broadcasts can't be
+told apart either, since every server answers from the same address, so
+each server also listens for discovery on a port of its own and the
+cluster asks each of them directly. Their answers are the availability
+reports real servers multicast.
+'''
+
+import socket # asks the servers whether they are there
+import time # waits for servers to start
+import timeit # times discovery round trips
+from parallelogram import helpers # discovery we replace
+from parallelogram import parallelogram_server # the servers we start
+
+# somtimes Python can't find the actual variables inside of config,
+# so it's safer to just assign variables this way
+from parallelogram import config
+DISCOVERY_TIMEOUT = config.DISCOVERY_TIMEOUT
+MULTICAST_PORT = config.MULTICAST_PORT
+NETWORK_CHUNK_SIZE = config.NETWORK_CHUNK_SIZE
+PORT = config.PORT
+
+class Loopback_Cluster(object):
+    '''
+    Servers running in this process, each on an address of its own on the
+    loopback network. Jobs started while the cluster runs find the servers
+    that are in use (see use()) and no others
+
+    servers: the parallelogram_server.Server of every server, in order
+    addresses: ip address of every server, in order
+    in_use: number of servers jobs find
+    '''
+    def __init__(self, servers, workers = 1, port = PORT,
+        discovery_port = MULTICAST_PORT + 100):
+        '''
+        :param servers: number of servers to start
+        :param workers: number of worker processes per server
+        :param port: port the servers listen for chunks on
+        :param discovery_port: port the first server listens for discovery
+            on, and the others on the ports after it
+        '''
+        self.workers = workers
+        self.port = port
+        self.addresses = ['127.0.0.%d' % (index + 2)
+            for index in xrange(servers)]
+        self.discovery_ports = [discovery_port + index
+            for index in xrange(servers)]
+        self.servers = list()
+        self.in_use = servers
+
+    def start(self):
+        '''
+        Starts the servers, one at a time since each reads its address and
+        discovery port from the parallelogram_server module as it starts,
+        and makes this process find them rather than broadcast for servers
+        '''
+        for address, discovery_port in zip(self.addresses,
+            self.discovery_ports):
+            parallelogram_server.IP_ADDRESS = address
+            parallelogram_server.MULTICAST_PORT = discovery_port
+            server = parallelogram_server.Server(self.port, self.workers)
+            server.daemon = True
+            server.start()
+            # the server is listening once it has its receiving thread
+            while not hasattr(server, 'sstr'):
+                time.sleep(0.01)
+            self.servers.append(server)
+        # heartbeats come from the machine's address, which doesn't tell
+        # our servers apart, so don't listen to them
+        helpers._membership = False
+        helpers._broadcast_client_thread = self.discover
+        self.use(len(self.servers))
+
+    def use(self, servers):
+        '''
+        :param servers: number of servers jobs find from now on, the first
+            ones started
+        '''
+        self.in_use = servers
+        # forget what was found before
+        helpers._discovery = (None, list())
+
+    def discover(self, mult_group_ip, mult_port, server_list):
+        '''
+        Asks each server in use for its availability report, like
+        helpers._broadcast_client_thread() asks all servers at once, but
+        only waits until they have all answered
+
+        :param mult_group_ip: unused, since the servers are asked directly
+        :param mult_port: unused, since each server has a port of its own
+        :param server_list: empty list to add (server, avaliability metric,
+            round trip time, availability report) tuples to
+        '''
+        addresses = dict(zip(self.discovery_ports[:self.in_use],
+            self.addresses))
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.settimeout(DISCOVERY_TIMEOUT)
+        try:
+            sent = timeit.default_timer()
+            for discovery_port in addresses:
+                sock.sendto('job', ('127.0.0.1', discovery_port))
+            while addresses:
+                try:
+                    reply, (_, discovery_port) = sock.recvfrom(
+                        NETWORK_CHUNK_SIZE)
+                except socket.timeout:
+                    break
+                if discovery_port not in addresses:
+                    continue
+                avaliability, report = helpers._parse_report(reply)
+                server_list.append((addresses.pop(discovery_port),
+                    avaliability, timeit.default_timer() - sent, report))
+        finally:
+            sock.close()
+
+    def stop(self):
+        '''
+        Stops the servers
+        '''
+        for server in self.servers:
+            server.stop()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,160 @@
+'''
+This file benchmarks whole jobs on a Loopback_Cluster: how many elements
+and megabytes per second they get through, how long their chunks take to
+come back (the median and 99th percentile), how long discovering the
+servers takes, and how all of that scales with the size of the elements,
+the size of the chunks, the number of servers and what foo() costs.
+
+Jobs are always distributed (backend = 'distributed'), even where running
+them locally would be faster, since the servers are what is measured.
+'''
+
+import os # makes elements that don't compress
+import timeit # times the jobs
+import cPickle # measures the bytes a job sends out
+from parallelogram import helpers # discovers the servers
+from parallelogram import planner # plans the jobs
+from parallelogram import parallelogram # runs the jobs
+
+class _Fixed_Plan(planner.Plan):
+    '''
+    A plan that cuts every chunk to the same size, so jobs can be compared
+    by their chunk size
+    '''
+    def __init__(self, chunk_size, *args, **kwargs):
+        '''
+        :param chunk_size: number of elements per chunk
+        '''
+        # set first, since planning already asks for a chunk size
+        self.chunk_size = chunk_size
+        planner.Plan.__init__(self, *args, **kwargs)
+
+    def next_chunk_size(self, remaining):
+        if remaining is None:
+            return self.chunk_size
+        return max(min(self.chunk_size, remaining), 1)
+
+def _costing(seconds):
+    '''
+    :param seconds: how long foo() takes per element
+    :return: foo(), which keeps a core busy for that long and then returns
+             its element as is
+    '''
+    def foo(elt, index):
+        end = timeit.default_timer() + seconds
+        while timeit.default_timer() < end:
+            pass
+        return elt
+    return foo
+
+def _percentile(values, fraction):
+    '''
+    :param values: list of numbers
+    :param fraction: which percentile, between 0 and 1
+    :return: the value below which that fraction of values lie, or None if
+             there aren't any
+    '''
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(int(fraction * len(values)), len(values) - 1)]
+
+def measure(cluster, foo, data, op = 'map', chunk_size = None,
+    compression = 'auto', timeout = 60):
+    '''
+    Runs a job on the cluster and measures it
+
+    :param cluster: the Loopback_Cluster to run on
+    :param foo: function to map or filter with
+    :param data: list to run over
+    :param op: 'map' or 'filter'
+    :param chunk_size: number of elements per chunk, or None to let the
+                       planner decide
+    :param compression: whether to compress what is sent (see p_map())
+    :param timeout: seconds a chunk may take to come back
+    :return: the measurements, as a dict
+    '''
+    if chunk_size is None:
+        plan = planner.Plan(foo, data, op, compression = compression)
+    else:
+        plan = _Fixed_Plan(chunk_size, foo, data, op,
+            compression = compression)
+    started = timeit.default_timer()
+    parallelogram._run(foo, data, cluster.port, op, timeout, plan,
+        'distributed')
+    seconds = timeit.default_timer() - started
+    sent = len(cPickle.dumps(data, cPickle.HIGHEST_PROTOCOL))
+    return {'elements': len(data), 'bytes': sent, 'seconds': seconds,
+        'elements_per_second': len(data) / seconds,
+        'megabytes_per_second': sent / seconds / 2 ** 20,
+        'chunks': len(plan.chunk_seconds),
+        'chunk_seconds_p50': _percentile(plan.chunk_seconds, 0.5),
+        'chunk_seconds_p99': _percentile(plan.chunk_seconds, 0.99),
+        'backend': plan.backend, 'servers': plan.servers,
+        'bytes_before_compression': plan.bytes_before,
+        'bytes_after_compression': plan.bytes_after}
+
+def discovery(cluster, rounds = 5):
+    '''
+    Times discovering the cluster's servers
+
+    :param cluster: the Loopback_Cluster to discover
+    :param rounds: number of times to discover them
+    :return: the median and slowest discovery, in seconds, and the number
+             of servers found, as a dict
+    '''
+    times = list()
+    for _ in xrange(rounds):
+        servers = list()
+        started = timeit.default_timer()
+        helpers._discover(servers, fresh = True)
+        times.append(timeit.default_timer() - started)
+    return {'seconds_p50': _percentile(times, 0.5),
+        'seconds_max': max(times), 'servers': len(servers)}
+
+def run(cluster, quick = False):
+    '''
+    Runs every end to end benchmark
+
+    :param cluster: the Loopback_Cluster to run on, which is left using
+                    all of its servers
+    :param quick: if True, run smaller jobs, for a rough idea in seconds
+    :return: dict of the discovery times and, for every sweep, a list of
+             the measurements of its jobs, each with the 'value' swept over
+    '''
+    scale = 10 if quick else 1
+    sweeps = dict()
+    results = {'discovery': discovery(cluster), 'sweeps': sweeps}
+    identity = _costing(0)
+
+    # the same megabytes of data, in elements of growing size. Random bytes
+    # don't compress, so what is measured is what goes over the wire
+    sweeps['payload_bytes'] = list()
+    for size in (16, 1024, 65536):
+        data = [os.urandom(size) for _ in xrange(2 ** 25 // scale //
+            (size + 64))]
+        sweeps['payload_bytes'].append(dict(measure(cluster, identity, data,
+            compression = None), value = size))
+
+    data = range(10 ** 6 // scale)
+    sweeps['chunk_size'] = list()
+    for size in (100, 1000, 10000, 100000):
+        sweeps['chunk_size'].append(dict(measure(cluster, identity, data,
+            chunk_size = size), value = size))
+
+    sweeps['foo_seconds'] = list()
+    for seconds in (0, 1e-5, 1e-4, 1e-3):
+        elements = int(min(10 ** 6, 2.0 / max(seconds, 1e-6)) // scale)
+        sweeps['foo_seconds'].append(dict(measure(cluster,
+            _costing(seconds), range(elements)), value = seconds))
+
+    # the same job on more and more of the servers
+    sweeps['servers'] = list()
+    foo = _costing(1e-3)
+    data = range(4000 // scale)
+    for servers in xrange(1, len(cluster.servers) + 1):
+        cluster.use(servers)
+        sweeps['servers'].append(dict(measure(cluster, foo, data),
+            value = servers))
+    cluster.use(len(cluster.servers))
+    return results
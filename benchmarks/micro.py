@@ -0,0 +1,61 @@
+'''
+This file benchmarks the kernels every job goes through on a single core:
+cutting data into chunks (helpers._chunk_list), joining the processed
+chunks back together (helpers._flatten) and processing a chunk
+(helpers._single_map, _single_filter and _single_reduce).
+'''
+
+import timeit # times the kernels
+from parallelogram import helpers # exposes the kernels to benchmark
+
+#:number of elements each kernel runs over
+ELEMENTS = 10**6
+
+def _time(run, repeat):
+    '''
+    :param run: function to time, called without arguments
+    :param repeat: number of times to run it
+    :return: the fastest of the runs, in seconds, which is the one least
+             disturbed by the rest of the machine
+    '''
+    return min(timeit.repeat(run, number = 1, repeat = repeat))
+
+def _result(name, elements, seconds):
+    '''
+    :return: the result of a benchmark, as a dict
+    '''
+    return {'name': name, 'elements': elements, 'seconds': seconds,
+        'elements_per_second': elements / seconds if seconds else None}
+
+def run(elements = ELEMENTS, repeat = 5):
+    '''
+    Runs every microbenchmark
+
+    :param elements: number of elements each kernel runs over
+    :param repeat: number of times to run each kernel, of which the fastest
+                   counts
+    :return: list of results, as dicts
+    '''
+    data = range(elements)
+    results = list()
+    for size in (10, 1000, 100000):
+        results.append(_result('_chunk_list(size = %d)' % size, elements,
+            _time(lambda: helpers._chunk_list(data, size), repeat)))
+        chunks = helpers._chunk_list(data, size)
+        results.append(_result('_flatten(size = %d)' % size, elements,
+            _time(lambda: helpers._flatten(chunks), repeat)))
+    # _single_map() and _single_filter() change their chunk in place, so
+    # they get a copy and every run starts from the same data
+    results.append(_result('_single_map', elements, _time(
+        lambda: helpers._single_map(lambda elt, index: elt + 1, data[:]),
+        repeat)))
+    results.append(_result('_single_filter', elements, _time(
+        lambda: helpers._single_filter(lambda elt, index: elt % 2, data[:]),
+        repeat)))
+    # _single_reduce() shrinks its chunk in place a pop() at a time, which
+    # costs time in the square of its length, so it gets a shorter copy
+    reduced = data[:elements // 100]
+    results.append(_result('_single_reduce', len(reduced), _time(
+        lambda: helpers._single_reduce(lambda a, b: a + b, reduced[:]),
+        repeat)))
+    return results
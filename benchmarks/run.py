@@ -0,0 +1,100 @@
+'''
+Runs the benchmarks and saves their results as JSON, so runs can be
+compared later. From the root of the repository:
+
+python -m benchmarks.run --output before.json
+python -m benchmarks.run --output after.json
+python -m benchmarks.run --compare before.json after.json
+
+Servers listen on 127.0.0.2 and the addresses after it, which Linux routes
+to the loopback interface as is (other platforms may need them set up).
+'''
+
+import sys # tells which Python the benchmarks ran on
+import json # saves the results
+import time # dates the results
+import argparse # reads the command line
+import platform # tells which machine the benchmarks ran on
+import multiprocessing # counts the cores of the machine
+import micro # benchmarks the kernels of a job
+import end_to_end # benchmarks whole jobs
+from cluster import Loopback_Cluster # the servers jobs run on
+
+def run(suite, servers, workers, quick):
+    '''
+    :param suite: 'micro', 'end_to_end' or 'all'
+    :param servers: number of servers to start for end to end benchmarks
+    :param workers: number of worker processes per server
+    :param quick: if True, run smaller jobs
+    :return: the results, as a dict
+    '''
+    results = {'machine': {'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'cores': multiprocessing.cpu_count(), 'time': time.time(),
+        'servers': servers, 'workers': workers, 'quick': quick}}
+    if suite in ('micro', 'all'):
+        results['micro'] = micro.run(micro.ELEMENTS // (10 if quick else 1))
+    if suite in ('end_to_end', 'all'):
+        with Loopback_Cluster(servers, workers) as cluster:
+            results['end_to_end'] = end_to_end.run(cluster, quick)
+    return results
+
+def _rates(results):
+    '''
+    :param results: results saved by run()
+    :return: dict of the elements per second of every benchmark, keyed by
+             its name
+    '''
+    rates = dict()
+    for result in results.get('micro', list()):
+        rates[result['name']] = result['elements_per_second']
+    sweeps = results.get('end_to_end', dict()).get('sweeps', dict())
+    for sweep, measurements in sweeps.items():
+        for measurement in measurements:
+            rates['%s = %s' % (sweep, measurement['value'])] = \
+                measurement['elements_per_second']
+    return rates
+
+def compare(before, after):
+    '''
+    Prints how many times faster every benchmark got from one run to the
+    next
+
+    :param before: results saved by the earlier run
+    :param after: results saved by the later run
+    '''
+    old, new = _rates(before), _rates(after)
+    for name in sorted(set(old) & set(new)):
+        if old[name] and new[name]:
+            print('%-40s %12.0f -> %12.0f elements/s  x%.2f' % (name,
+                old[name], new[name], new[name] / old[name]))
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Benchmarks parallelogram '
+        'on servers started in this process.')
+    parser.add_argument('--suite', choices = ('micro', 'end_to_end', 'all'),
+        default = 'all')
+    parser.add_argument('--servers', type = int, default = 4,
+        help = 'number of servers to start')
+    parser.add_argument('--workers', type = int, default = 1,
+        help = 'number of worker processes per server')
+    parser.add_argument('--quick', action = 'store_true',
+        help = 'run smaller jobs, for a rough idea in seconds')
+    parser.add_argument('--output', help = 'file to save the results to, '
+        'rather than printing them')
+    parser.add_argument('--compare', nargs = 2, metavar = ('BEFORE', 'AFTER'),
+        help = 'compare two saved runs instead of running the benchmarks')
+    args = parser.parse_args()
+    if args.compare:
+        with open(args.compare[0]) as before, open(args.compare[1]) as after:
+            compare(json.load(before), json.load(after))
+        return
+    results = run(args.suite, args.servers, args.workers, args.quick)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent = 2, sort_keys = True)
+    else:
+        print(json.dumps(results, indent = 2, sort_keys = True))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+'''
+This file defines the Handle class, which stands for data cached on the
+servers by p_cache().
+
+Iterative jobs, like the steps of k-means, run over the same data again and
+again. Rather than sending all of it out with every job, p_cache() sends it
+once: each chunk is kept by the server it was sent to, and jobs that are
+given the handle in place of the data send every chunk to the server
+holding it, with only the function and the chunk's key.
+'''
+
+import helpers # cuts the data into its cached chunks and drops them
+
+# somtimes Python can't find the actual variables inside of config,
+# so it's safer to just assign variables this way
+import config
+DEFAULT_TIMEOUT = config.DEFAULT_TIMEOUT
+
+class Handle(object):
+    '''
+    Data cached on the servers (see p_cache()). It can be passed to p_map(),
+    p_filter(), p_reduce() and the other p_ functions in place of the data,
+    and reads like the data otherwise. A chunk whose server is gone, or
+    evicted it, is sent along with its job like any other chunk, and cached
+    again on the server that gets it.
+
+    dataset_id: id the chunks are cached under, or None once dropped
+    data: the data itself, which chunks are sent from when their server
+        doesn't have them
+    sizes: number of elements in each cached chunk
+    owners: ip address of the server holding each chunk, or None
+    '''
+    def __init__(self, data, dataset_id, sizes, owners, port):
+        '''
+        :param data: the cached list (or NumPy array)
+        :param dataset_id: id the chunks are cached under
+        :param sizes: number of elements in each chunk
+        :param owners: ip address of the server holding each chunk, or None
+        :param port: port the servers listen on
+        '''
+        self.data = data
+        self.dataset_id = dataset_id
+        self.sizes = sizes
+        self.owners = owners
+        self.port = port
+
+    def chunker(self):
+        '''
+        :return: helpers._Cached_Chunker cutting a job's chunks from the data
+        '''
+        return helpers._Cached_Chunker(self.data, self.dataset_id,
+            self.sizes, self.owners)
+
+    def drop(self, timeout = DEFAULT_TIMEOUT):
+        '''
+        Tells the servers to forget the data. Jobs can still be given the
+        handle, but they send their chunks along like jobs over uncached
+        data do
+
+        :param timeout: how long in seconds to wait for each server
+        '''
+        servers = set(owner for owner in self.owners if owner is not None)
+        helpers._drop_dataset(self.dataset_id, servers, self.port, timeout)
+        self.dataset_id = None
+        self.owners[:] = [None] * len(self.owners)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, key):
+        return self.data[key]
@@ -7,9 +7,95 @@ PORT = 1001
 MULTICAST_GROUP_IP = '224.15.35.42'
 #:port to use for multicast communications
 MULTICAST_PORT = 10000
+#:port servers multicast their heartbeats to
+HEARTBEAT_PORT = 10001
+#:seconds between two heartbeats of a server
+HEARTBEAT_SECONDS = 1
+#:heartbeats in a row a server can miss before clients stop counting on it
+HEARTBEATS_MISSED = 3
+#:port servers answer HTTP requests for their metrics on, or None to not
+METRICS_PORT = 10002
+#:seconds between two samples of how many chunks a server has waiting
+METRICS_SAMPLE_SECONDS = 1
+#:number of those samples a server keeps
+METRICS_SAMPLES = 300
 #:the default timeout for all sockets
 DEFAULT_TIMEOUT = 10
 #:the max size of a queue for socket requests
 MAX_CONNECT_REQUESTS = 5
 #:the max buffer size for socket data
-NETWORK_CHUNK_SIZE = 8192 #max buffer size to read
\ No newline at end of file
+NETWORK_CHUNK_SIZE = 8192 #max buffer size to read
+#:version of the framed wire protocol spoken between clients and servers
+PROTOCOL_VERSION = 7
+#:seconds the client listens for servers answering a discovery broadcast
+DISCOVERY_TIMEOUT = 2
+#:the most sample elements foo() is timed on when planning a job
+PLAN_SAMPLE_SIZE = 16
+#:the most seconds spent timing foo() on sample elements when planning a job
+PLAN_SAMPLE_SECONDS = 0.05
+#:the largest share of a chunk's round trip we accept spending on overhead
+PLAN_OVERHEAD_FRACTION = 0.1
+#:chunks each server should get, so faster servers can take up the slack
+PLAN_CHUNKS_PER_SERVER = 4
+#:fixed cost in seconds of sending one chunk, on top of the round trip time
+PLAN_MESSAGE_SECONDS = 0.001
+#:network bandwidth in bytes per second assumed by the planner
+PLAN_BANDWIDTH = 10**8
+#:upper bound on the serialized size of a single chunk, in bytes
+MAX_CHUNK_BYTES = 2**26
+#:how many chunks the client keeps in flight per server
+CHUNKS_IN_FLIGHT_PER_SERVER = 2
+#:weight of the latest chunk in a server's measured throughput (between 0 
+#:and 1, higher follows changes faster)
+SCHEDULER_SMOOTHING = 0.3
+#:free memory in bytes a server needs per chunk it processes at once
+MEMORY_PER_SLOT = 2**28
+#:seconds a server spends benchmarking itself when it starts
+BENCHMARK_SECONDS = 0.1
+#:seconds over which servers report how many chunks per second they processed
+THROUGHPUT_SECONDS = 10
+#:how many bytes of pickled functions a server keeps cached
+FUNCTION_CACHE_BYTES = 2**28
+#:number of worker processes a server runs chunks in (None means one per core)
+SERVER_WORKERS = None
+#:children per server in the tree that servers combine reductions in
+REDUCE_TREE_FANOUT = 2
+#:seconds a server keeps the partial reductions of a job it hasn't heard from,
+#:in case the client failed or gave up before collecting them
+REDUCTION_SECONDS = 600
+#:number of worker processes jobs run in locally (None means one per core)
+LOCAL_WORKERS = None
+#:jobs estimated to take fewer seconds than this run in the calling process
+LOCAL_POOL_SECONDS = 0.2
+#:seconds jobs started one after another share the servers one discovery found
+DISCOVERY_CACHE_SECONDS = 1
+#:percentile of the completed chunks' round trip times (per element) that the
+#:chunks still in flight are judged by
+LATENCY_PERCENTILE = 90
+#:completed chunks a job needs before that percentile replaces the caller's
+#:timeout
+LATENCY_SAMPLES = 5
+#:once all chunks are sent out, a chunk taking this many times longer than
+#:expected is copied onto an idle server, and whichever copy finishes first wins
+SPECULATION_FACTOR = 2
+#:a chunk taking this many times longer than expected is given up on
+CHUNK_TIMEOUT_FACTOR = 8
+#:shortest timeout in seconds the latency percentile can give a chunk
+MIN_CHUNK_TIMEOUT = 1
+#:messages smaller than this many bytes are never compressed
+COMPRESSION_MIN_BYTES = 4096
+#:bytes off the front of a message compressed to see how well a job's data
+#:compresses
+COMPRESSION_SAMPLE_BYTES = 2**16
+#:jobs that compress automatically take a new sample every this many messages
+COMPRESSION_RESAMPLE = 32
+#:codec jobs that compress automatically compress with
+COMPRESSION_CODEC = 'zlib'
+#:bytes a connection has to send in one go before it trusts the bandwidth it
+#:measures over the planner's assumed one
+BANDWIDTH_SAMPLE_BYTES = 2**20
+#:how many bytes of cached datasets (see p_cache()) a server keeps in memory
+DATASET_CACHE_BYTES = 2**30
+#:directory servers spill cached chunks to once they don't fit in memory
+#:anymore, or None to drop those chunks instead
+DATASET_SPILL_DIR = None
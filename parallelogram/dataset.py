@@ -0,0 +1,162 @@
+'''
+This file defines the Dataset class, which chains map, filter and reduce
+steps into a single job.
+
+Chaining p_map() into p_filter() into p_reduce() runs three jobs, each of
+which discovers servers, cuts the data into chunks and sends all of it out
+and back again. A Dataset only records its steps until its result is asked
+for, and then runs them as one fused pipeline: every chunk is sent out
+once, goes through all of the steps on the server it lands on, and only
+what is left of it at the end (often a single value) comes back.
+'''
+
+import copy # so adding a step leaves the Dataset it was added to as is
+import helpers # runs the steps on each chunk
+import planner # decides whether and how to distribute the pipeline
+import parallelogram # runs the pipeline where its plan says
+import sinks # writes the result to disk as it arrives
+
+class Dataset(object):
+    '''
+    A list (or NumPy array) with the steps it is to go through. map() and
+    filter() return a new Dataset with the step added, and nothing runs
+    until collect(), reduce() or iterating over the Dataset asks for the
+    result:
+
+        total = Dataset(range(10**6), 1001, 30).map(square).filter(
+            is_even).reduce(add)
+
+    Steps get the same arguments as with p_map(), p_filter() and p_reduce():
+    map and filter functions get an element and its index in data (which
+    filtering doesn't change), or with batch = True a whole chunk and its
+    indices.
+    '''
+    def __init__(self, data, port, timeout, backend = 'auto',
+        compression = 'auto'):
+        '''
+        :param data: a list (or NumPy array) of data. Iterating over a
+            Dataset also works for any iterable (see p_imap())
+        :param port: a port by which to send over distributed operations
+        :param timeout: timeout, in seconds, that function should wait
+                        for chunks to be returned
+        :param backend: 'auto', 'local' or 'distributed' (see p_map())
+        :param compression: whether to compress what is sent over the
+                            network (see p_map())
+        '''
+        self.data = data
+        self.port = port
+        self.timeout = timeout
+        self.backend = backend
+        self.compression = compression
+        # (op, function, batch) tuples, in order
+        self.stages = list()
+
+    def _then(self, op, foo, batch):
+        '''
+        :return: a copy of this Dataset with a step added
+        '''
+        dataset = copy.copy(self)
+        dataset.stages = self.stages + [(op, foo, batch)]
+        return dataset
+
+    def map(self, foo, batch = False):
+        '''
+        :param foo: function to map over the data (see p_map())
+        :param batch: whether foo() takes whole chunks at once
+        :return: a Dataset of the mapped data
+        '''
+        return self._then('map', foo, batch)
+
+    def filter(self, foo, batch = False):
+        '''
+        :param foo: function to filter the data with (see p_filter())
+        :param batch: whether foo() takes whole chunks at once, and returns
+                      a mask of the elements to keep
+        :return: a Dataset of the elements foo() keeps
+        '''
+        return self._then('filter', foo, batch)
+
+    def _run(self, stages, sink = None):
+        '''
+        Runs the data through the given steps as a single job
+
+        :param sink: sinks.Sink to write the processed chunks to, or None
+        :return: tuple of the processed chunks, in order (None if they were
+                 written to sink), and the planner.Plan the job was run with
+        '''
+        plan = planner.Plan(stages, self.data, 'pipeline', True,
+            compression = self.compression)
+        chunks = parallelogram._run(stages, self.data, self.port,
+            'pipeline', self.timeout, plan, self.backend, batch = True,
+            sink = sink)
+        return chunks, plan
+
+    def collect(self, explain = False, out = None):
+        '''
+        Runs every step on the data
+
+        :param explain: if True, return a (result, plan) tuple instead,
+                        where plan is the planner.Plan the job was run with
+        :param out: where to write the processed data as it arrives instead
+                    of returning it (see p_map())
+        :return: the processed data, as a list (or a NumPy array if the
+                 chunks came back as arrays), or the number of elements
+                 written to out
+        '''
+        if out is None:
+            chunks, plan = self._run(self.stages)
+            result = helpers._join(chunks)
+        else:
+            # filters leave an unknown number of elements, so the chunks
+            # are written in order
+            sink = sinks._sink(out)
+            sink.start(None)
+            try:
+                _, plan = self._run(self.stages, sink)
+            finally:
+                sink.close()
+            result = sink.written
+        if explain:
+            return result, plan
+        return result
+
+    def reduce(self, foo, explain = False):
+        '''
+        Runs every step on the data and reduces what is left. Each chunk
+        is reduced on the server that ran its steps, so only a single value
+        per chunk comes back
+
+        :param foo: function to reduce with (see p_reduce())
+        :param explain: if True, return a (result, plan) tuple instead,
+                        where plan is the planner.Plan the job was run with
+        :return: the reduced result. Raises a TypeError if the steps leave
+                 nothing to reduce
+        '''
+        chunks, plan = self._run(self.stages + [('reduce', foo, False)])
+        # a list holding the reduced value of every chunk that had any
+        # elements left
+        reduced = helpers._flatten(chunks)
+        if len(reduced) == 0:
+            raise TypeError("reduce() of an empty Dataset")
+        if len(reduced) == 1:
+            result = reduced[0]
+        elif plan.backend == 'distributed':
+            result = parallelogram.p_reduce(foo, reduced, self.port,
+                self.timeout, compression = self.compression)
+        else:
+            result = helpers._single_reduce(foo, reduced)
+        if explain:
+            return result, plan
+        return result
+
+    def __iter__(self):
+        '''
+        Runs every step on the data lazily, like p_imap() does
+
+        :return: generator of the processed elements, in order
+        '''
+        for chunk in parallelogram._stream(self.stages, self.data, self.port,
+            'pipeline', self.timeout, None, True, self.backend, True,
+            self.compression):
+            for elt in chunk:
+                yield elt
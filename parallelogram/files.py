@@ -0,0 +1,203 @@
+'''
+This file defines the Source classes, which stand for files jobs run over
+without reading them into memory first: Lines of text, fixed-width binary
+Records and NumPy .npy arrays.
+
+Giving p_map() a list means reading the whole file into it on the client,
+and then sending all of it over the network. A Source is cut into ranges of
+bytes instead, without reading the file, and each chunk of the job is just
+the path and the byte range. Servers that have the file at the same path
+(on a shared filesystem, or a copy of it) map it into memory and read their
+range themselves. Servers that don't have it ask for the range's bytes,
+which the client then sends along with every chunk of the file it gives
+them.
+'''
+
+import os # finds the size of files
+import helpers # cuts files into ranges and reads them
+try:
+    import numpy # reads the headers of .npy files
+except ImportError:
+    numpy = None
+
+# somtimes Python can't find the actual variables inside of config,
+# so it's safer to just assign variables this way
+import config
+PLAN_SAMPLE_SIZE = config.PLAN_SAMPLE_SIZE
+
+class Source(object):
+    '''
+    A file a job runs over. It can be passed to p_map(), p_filter(),
+    p_reduce() and the other p_ functions in place of the data. Slicing it
+    reads the records in the slice
+
+    source: description of the file sent with every chunk. The 'path',
+        'format' ('lines', 'records' or 'npy'), 'size' in bytes, 'offset'
+        the records begin at, bytes per 'record', NumPy 'dtype' of the
+        records (or None) and 'shape' of each record
+    '''
+    def __init__(self, path, format, offset = 0, record = None,
+        dtype = None, shape = ()):
+        '''
+        :param path: path to the file, which is the same on servers that
+            have it
+        :param format: 'lines', 'records' or 'npy'
+        :param offset: byte offset the records begin at
+        :param record: bytes per record, or None for lines
+        :param dtype: NumPy dtype of the records, or None
+        :param shape: shape of each record, if it is a NumPy array
+        '''
+        if dtype is not None:
+            dtype = numpy.lib.format.dtype_to_descr(numpy.dtype(dtype))
+        self.source = {'path': os.path.abspath(path), 'format': format,
+            'size': os.path.getsize(path), 'offset': offset,
+            'record': record, 'dtype': dtype, 'shape': tuple(shape)}
+
+    def _record_bytes(self):
+        '''
+        :return: bytes per record
+        '''
+        return self.source['record']
+
+    def chunker(self):
+        '''
+        :return: helpers._File_Chunker cutting a job's chunks from the file
+        '''
+        return helpers._File_Chunker(self.source, self._record_bytes())
+
+    def whole(self):
+        '''
+        :return: helpers._File_Range of the whole file, for jobs run in one
+                 go, whose records are indexed like those of jobs cut into
+                 chunks
+        '''
+        return helpers._File_Range(dict(self.source, 
+            start = self.source['offset'], stop = self.source['size']), 
+            len(self))
+
+    def __len__(self):
+        return max(self.source['size'] - self.source['offset'], 0) // \
+            self._record_bytes()
+
+    def __getitem__(self, key):
+        '''
+        :param key: a slice of records, without a step
+        :return: the records in the slice, read from the file
+        '''
+        if not isinstance(key, slice) or key.step not in (None, 1):
+            raise TypeError("Files can only be read a slice at a time.")
+        start, stop, _ = key.indices(len(self))
+        stop = max(start, stop)
+        record = self._record_bytes()
+        offset = self.source['offset']
+        return helpers._read_source(dict(self.source,
+            start = offset + start * record, stop = offset + stop * record))
+
+class Lines(Source):
+    '''
+    A text file, whose records are its lines (without their newline).
+    Ranges of the file are cut at the start of a line. Since the file isn't
+    read through to count its lines, the index foo() gets with each line is
+    the byte offset it starts at in the file: unique and increasing, and 
+    the same wherever the job runs, but not the line number. len() is 
+    estimated from the lines at the front of the file
+    '''
+    def __init__(self, path):
+        '''
+        :param path: path to the file, which is the same on servers that
+            have it
+        '''
+        Source.__init__(self, path, 'lines')
+        # bytes per line, on average, at the front of the file
+        lines, size = 0, 0
+        with open(path, 'rb') as text_file:
+            for line in text_file:
+                lines += 1
+                size += len(line)
+                if lines == PLAN_SAMPLE_SIZE:
+                    break
+        self.line_bytes = float(size) / lines if lines else 1.0
+
+    def _record_bytes(self):
+        return self.line_bytes
+
+    def __len__(self):
+        return int(round(self.source['size'] / self.line_bytes))
+
+    def __getitem__(self, key):
+        '''
+        :param key: a slice of lines from the front of the file, like [:10]
+        :return: the lines in the slice
+        '''
+        if (not isinstance(key, slice) or key.start not in (None, 0) or
+            key.step not in (None, 1) or
+            (key.stop is not None and key.stop < 0)):
+            raise TypeError("Lines can only be read from the front of the "
+                "file.")
+        lines = list()
+        with open(self.source['path'], 'rb') as text_file:
+            for line in text_file:
+                if key.stop is not None and len(lines) >= key.stop:
+                    break
+                lines.append(line[:-1] if line.endswith('\n') else line)
+        return lines
+
+class Records(Source):
+    '''
+    A binary file of fixed-width records, which are strings, or rows of a
+    NumPy array if the records have a dtype
+    '''
+    def __init__(self, path, size = None, dtype = None):
+        '''
+        :param path: path to the file, which is the same on servers that
+            have it
+        :param size: bytes per record, or None to take the size of dtype
+        :param dtype: NumPy dtype of the records, or None to read them as
+            strings
+        '''
+        if size is None and dtype is None:
+            raise ValueError("Records need a size or a dtype.")
+        shape = ()
+        if dtype is not None:
+            itemsize = numpy.dtype(dtype).itemsize
+            size = size or itemsize
+            if size % itemsize:
+                raise ValueError("A record of %d bytes can not hold items "
+                    "of %d bytes." % (size, itemsize))
+            if size != itemsize:
+                shape = (size // itemsize,)
+        Source.__init__(self, path, 'records', record = size, dtype = dtype,
+            shape = shape)
+
+class Npy(Source):
+    '''
+    A NumPy array saved to a .npy file (see numpy.save()), whose records are
+    its rows. The array can't be in Fortran order or hold Python objects
+    '''
+    def __init__(self, path):
+        '''
+        :param path: path to the file, which is the same on servers that
+            have it
+        '''
+        with open(path, 'rb') as npy_file:
+            version = numpy.lib.format.read_magic(npy_file)
+            if version == (1, 0):
+                shape, fortran_order, dtype = \
+                    numpy.lib.format.read_array_header_1_0(npy_file)
+            else:
+                shape, fortran_order, dtype = \
+                    numpy.lib.format.read_array_header_2_0(npy_file)
+            offset = npy_file.tell()
+        if fortran_order or dtype.hasobject or len(shape) == 0:
+            raise ValueError("%s does not hold a C ordered array of rows "
+                "that aren't Python objects." % path)
+        rows = shape[1:]
+        record = dtype.itemsize
+        for length in rows:
+            record *= length
+        Source.__init__(self, path, 'npy', offset, max(record, 1), dtype,
+            rows)
+        self.rows = shape[0]
+
+    def __len__(self):
+        return self.rows
@@ -0,0 +1,180 @@
+'''
+This file defines the Future class returned by p_map_async(),
+p_filter_async() and p_reduce_async(), which stands for the result of a job
+that is still running.
+
+Futures follow concurrent.futures.Future (which Python 2 doesn't ship), so
+code written against either reads the same: result() waits for the job,
+done() and cancelled() tell how it went, and cancel() stops it.
+'''
+
+import sys # keeps the traceback of a job's error
+import threading # lets callers wait on the job's thread
+
+class Error(Exception):
+    '''
+    Base class of the errors raised by futures
+    '''
+
+class CancelledError(Error):
+    '''
+    Raised by result() when the job was cancelled
+    '''
+
+class TimeoutError(Error):
+    '''
+    Raised by result() when the job doesn't finish in time
+    '''
+
+#:states a future can be in
+PENDING, RUNNING, CANCELLED, FINISHED = 'pending', 'running', 'cancelled', \
+    'finished'
+
+class Future(object):
+    '''
+    The result of a job running in the background. A job that is cancelled
+    (or runs over its time) sends out no more chunks, though chunks already
+    on servers are still processed there
+
+    plan: the planner.Plan of the job, once it has been planned
+    '''
+    def __init__(self):
+        self.plan = None
+        self._state = PENDING
+        self._result = None
+        self._exc_info = None
+        self._callbacks = list()
+        self._condition = threading.Condition()
+
+    def cancel(self):
+        '''
+        Stops the job, unless it is already done
+
+        :return: whether the job was cancelled
+        '''
+        return self._finish(CANCELLED, None, None, True)
+
+    def cancelled(self):
+        '''
+        :return: whether the job was cancelled
+        '''
+        return self._state == CANCELLED
+
+    def running(self):
+        '''
+        :return: whether the job is running
+        '''
+        return self._state == RUNNING
+
+    def done(self):
+        '''
+        :return: whether the job finished or was cancelled
+        '''
+        return self._state in (CANCELLED, FINISHED)
+
+    def result(self, timeout = None):
+        '''
+        Waits for the job to finish
+
+        :param timeout: seconds to wait at most, or None to wait as long as
+                        the job takes
+        :return: what the job returned. Raises the job's error if it failed,
+                 CancelledError if it was cancelled and TimeoutError if it
+                 didn't finish in time
+        '''
+        self._wait(timeout)
+        if self._exc_info is not None:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self._result
+
+    def exception(self, timeout = None):
+        '''
+        Waits for the job to finish, like result()
+
+        :return: the job's error, or None if it succeeded
+        '''
+        self._wait(timeout)
+        if self._exc_info is None:
+            return None
+        return self._exc_info[1]
+
+    def add_done_callback(self, fn):
+        '''
+        :param fn: called with the future once the job is done, or right 
+                   away if it already is
+        '''
+        with self._condition:
+            if not self.done():
+                self._callbacks.append(fn)
+                return
+        fn(self)
+
+    def _wait(self, timeout):
+        '''
+        waits for the job to finish, raising CancelledError or TimeoutError
+        '''
+        with self._condition:
+            if not self.done():
+                self._condition.wait(timeout)
+            if self._state == CANCELLED:
+                raise CancelledError()
+            if self._state != FINISHED:
+                raise TimeoutError()
+
+    def _start(self, plan):
+        '''
+        Called by the job once it is planned
+
+        :param plan: the planner.Plan of the job
+        :return: whether the job should run, as it may be cancelled already
+        '''
+        with self._condition:
+            self.plan = plan
+            if self.done():
+                plan.cancelled = True
+                return False
+            self._state = RUNNING
+            return True
+
+    def _expire(self):
+        '''
+        Called when the job runs over its time, which stops it
+        '''
+        error = TimeoutError('The job ran over its time')
+        self._finish(FINISHED, None, (TimeoutError, error, None), True)
+
+    def _set_result(self, result):
+        '''
+        Called by the job when it succeeds
+        '''
+        self._finish(FINISHED, result, None)
+
+    def _set_exception(self, exc_info = None):
+        '''
+        Called by the job when it fails
+
+        :param exc_info: the job's error, as returned by sys.exc_info()
+        '''
+        self._finish(FINISHED, None, exc_info or sys.exc_info())
+
+    def _finish(self, state, result, exc_info, stop = False):
+        '''
+        Moves the future to a done state, unless it is already done
+
+        :param stop: whether to stop the job, if it is still running
+        :return: whether it wasn't done yet
+        '''
+        with self._condition:
+            if self.done():
+                return False
+            self._state = state
+            self._result = result
+            self._exc_info = exc_info
+            if stop and self.plan is not None:
+                # stops the job at its next chunk
+                self.plan.cancelled = True
+            callbacks, self._callbacks = self._callbacks, list()
+            self._condition.notify_all()
+        for fn in callbacks:
+            fn(self)
+        return True
@@ -4,6 +4,8 @@ our implementations of p_map(), p_filter(), and p_reduce(), in addition
 to our server implementation.
 
 Included in this file:
+A single-threaded event loop that does all of a client's network I/O 
+(_Client_Loop)
 2D array flattening (_flatten)
 Code to chunk the data for sending over the network (_chunk_list)
 Single machine versions of the parallelized functions for the server to run
@@ -12,7 +14,11 @@ single_filter, single_reduce)
 Matching algorithms to implement the uber model, one for the servers to
 calculate their availability (calc_avaliability) which is included in
 networking code, and one for the client to assign chunks based on this
-(_get_chunk_assignments)
+and on how fast each server turns out to be (_Scheduler)
+A pool of worker processes that runs jobs on this machine when they aren't
+distributed (_submit_local)
+Heartbeats servers multicast (_Heartbeat_Thread) and the list of servers
+clients keep from them (_Membership)
 Remaining functions, labeled using the terms client/server,
 socket/broadcast, and send/receive perform the described networking
 function for the described entity
@@ -20,15 +26,43 @@ function for the described entity
 
 Three of the methods in this file are prefixed by "_single_", indicating
 that they will be used as helper functions for single chunks of data (as
-opposed to large lists that comprise multiple chunks)
+opposed to large lists that comprise multiple chunks). The "_batch_" ones
+do the same for functions that take a whole chunk at once
 '''
 import Queue # allows machines to hold multiple chunks at one
+import os # names the errors of non-blocking socket calls
+import mmap # reads the byte ranges of files jobs run over
+import errno # tells non-blocking socket calls that would wait from failures
+import select # waits on every client socket at once
 import struct # helps us with object serialization and packing
 import socket # allows for communication between machines
 import threading # allows us to have multiple threads on clients/servers
 import itertools # exposes helpful data manipulation methods
+import traceback # reports errors raised by foo() back to the client
+import functools # binds per-chunk arguments to pool callbacks
+import multiprocessing # runs chunks on every core of a machine
+import timeit # times discovery round trips
+import hashlib # content-addresses pickled functions
+import collections # ordered dicts keep our caches in LRU order
+import heapq # finds the server to send a chunk to quickly
+import cStringIO # lets us unpickle straight out of a receive buffer
+import json # encodes availability reports
+import BaseHTTPServer # answers requests for a server's metrics
+import zlib # compresses messages when that gets them across sooner
+import bz2 # compresses tighter than zlib, but slower
+import cProfile # profiles foo() on the chunks of profiled jobs
 import psutil as ps # exposes system metrics for calcing availabilities  
+import cPickle # (de)serializes data much faster than cloudpickle can
 import cloudpickle as pickle # allows for (de)serialization
+import timing # breaks down where the time of a job went
+try:
+    import numpy # lets batch jobs keep their chunks as arrays
+except ImportError:
+    numpy = None
+try:
+    import lzma # compresses tightest, where the standard library has it
+except ImportError:
+    lzma = None
 
 # somtimes Python can't find the actual variables inside of config, 
 # so it's safer to just assign variables this way
@@ -36,6 +70,56 @@ import config
 DEFAULT_TIMEOUT = config.DEFAULT_TIMEOUT
 MAX_CONNECT_REQUESTS = config.MAX_CONNECT_REQUESTS
 NETWORK_CHUNK_SIZE = config.NETWORK_CHUNK_SIZE
+PROTOCOL_VERSION = config.PROTOCOL_VERSION
+DISCOVERY_TIMEOUT = config.DISCOVERY_TIMEOUT
+DISCOVERY_CACHE_SECONDS = config.DISCOVERY_CACHE_SECONDS
+FUNCTION_CACHE_BYTES = config.FUNCTION_CACHE_BYTES
+MULTICAST_GROUP_IP = config.MULTICAST_GROUP_IP
+MULTICAST_PORT = config.MULTICAST_PORT
+REDUCE_TREE_FANOUT = config.REDUCE_TREE_FANOUT
+HEARTBEAT_PORT = config.HEARTBEAT_PORT
+HEARTBEAT_SECONDS = config.HEARTBEAT_SECONDS
+HEARTBEATS_MISSED = config.HEARTBEATS_MISSED
+METRICS_SAMPLE_SECONDS = config.METRICS_SAMPLE_SECONDS
+SCHEDULER_SMOOTHING = config.SCHEDULER_SMOOTHING
+MEMORY_PER_SLOT = config.MEMORY_PER_SLOT
+BENCHMARK_SECONDS = config.BENCHMARK_SECONDS
+THROUGHPUT_SECONDS = config.THROUGHPUT_SECONDS
+PLAN_BANDWIDTH = config.PLAN_BANDWIDTH
+COMPRESSION_MIN_BYTES = config.COMPRESSION_MIN_BYTES
+COMPRESSION_SAMPLE_BYTES = config.COMPRESSION_SAMPLE_BYTES
+COMPRESSION_RESAMPLE = config.COMPRESSION_RESAMPLE
+COMPRESSION_CODEC = config.COMPRESSION_CODEC
+BANDWIDTH_SAMPLE_BYTES = config.BANDWIDTH_SAMPLE_BYTES
+
+#:message type of a frame carrying a chunk from a client to a server
+MSG_CHUNK = 1
+#:message type of a frame carrying a processed chunk back to the client
+MSG_RESULT = 2
+#:message type of a (payload-less) frame telling the client that the server
+#:doesn't have the function a chunk referred to by digest only
+MSG_FUNC_MISSING = 3
+#:message type of a frame asking a server to combine the partial reductions
+#:it kept for a job and pass them on up the reduction tree
+MSG_COLLECT = 4
+#:message type of a frame carrying partial reductions from a server to its
+#:parent in the reduction tree
+MSG_PARTIAL = 5
+#:message type of a frame carrying a chunk for a server to cache (see 
+#:p_cache())
+MSG_STORE = 6
+#:message type of a (payload-less) frame telling the client that the server
+#:doesn't have the cached chunk a chunk message referred to
+MSG_DATA_MISSING = 7
+#:message type of a frame asking a server to forget a cached dataset
+MSG_DROP = 8
+#:layout of every frame header: protocol version, message type, flags
+#:(which codec the payload is compressed with, 0 if it isn't), job id, 
+#:request id (matches a result to the chunk it answers on a shared 
+#:connection) and payload length in bytes
+FRAME_HEADER = struct.Struct('!BBHIIQ')
+#:length of the pickle in front of the arrays it refers to (see _dump_parts)
+PICKLE_LENGTH = struct.Struct('!Q')
 
 def _flatten(multiarray):
     '''
@@ -43,168 +127,2257 @@ def _flatten(multiarray):
 
     flatten([[1,2,3],[4,5,6],[7,8,9]]) = [1,2,3,4,5,6,7,8,9]
 
-    :param multiarray: a 2D array to be flattened
-    :return: a 1D representation of multiarray
-    '''
-    return list(itertools.chain.from_iterable(multiarray))
+    :param multiarray: a 2D array to be flattened
+    :return: a 1D representation of multiarray
+    '''
+    return list(itertools.chain.from_iterable(multiarray))
+
+def _join(chunks):
+    '''
+    Joins processed chunks back together. Chunks that are NumPy arrays are
+    concatenated into a single array, everything else is flattened into a
+    list
+
+    :param chunks: list of processed chunks, in order
+    :return: the joined chunks
+    '''
+    if numpy is not None and any(isinstance(chunk, numpy.ndarray) 
+        for chunk in chunks):
+        return numpy.concatenate(chunks)
+    return _flatten(chunks)
+
+def _chunk_list(data, sz):
+    '''
+    Creates chunks of size `sz` from data. Returns a list of chunks, 
+    which are also lists.
+
+    These chunks will be sent to other machines on the network for processing.
+
+    :param data: the data (of type list) to be split into chunks
+    :param sz: the desired chunk size
+    :return: a 2D array of chunks
+    '''
+    chunks = []
+    for i in xrange(0, len(data), sz):
+        chunk = data[i:i + sz]
+        chunks.append(chunk)
+    return chunks
+
+def _sliceable(data):
+    '''
+    :param data: a job's data
+    :return: whether data is a sequence chunks can be sliced off, like a 
+             list or a NumPy array (rather than, say, a generator)
+    '''
+    try:
+        len(data)
+        data[0:0]
+    except TypeError:
+        return False
+    return True
+
+class _Chunker(object):
+    '''
+    Cuts chunks off the front of a job's data as they are needed. Data can
+    be a list (or a NumPy array), which is sliced, or any other iterable, 
+    which is read a chunk at a time, so it never has to be in memory as a
+    whole
+    '''
+    #:id of the cached dataset the chunks come from, if they do
+    dataset_id = None
+
+    def __init__(self, data):
+        '''
+        :param data: the data to cut chunks from
+        '''
+        if _sliceable(data):
+            self._data = data
+            self._iterator = None
+            #:number of elements left, or None if it isn't known
+            self.remaining = len(data)
+        else:
+            self._data = None
+            self._iterator = iter(data)
+            self.remaining = None
+        #:index of the first element of the next chunk
+        self.cut = 0
+
+    def next_chunk(self, plan):
+        '''
+        :param plan: the planner.Plan that sizes the chunk
+        :return: tuple of the index of the chunk's first element and the
+                 chunk, or None if the data has run out
+        '''
+        if self.remaining == 0:
+            return None
+        size = plan.next_chunk_size(self.remaining)
+        if self._iterator is None:
+            chunk = self._data[self.cut:self.cut + size]
+            self.remaining -= len(chunk)
+        else:
+            chunk = list(itertools.islice(self._iterator, size))
+            if not chunk:
+                self.remaining = 0
+                return None
+        start = self.cut
+        self.cut += len(chunk)
+        return start, chunk
+
+    def owner(self, index):
+        '''
+        :param index: chunk number
+        :return: ip address of the server holding the chunk cached, if any
+        '''
+        return None
+
+    def set_owner(self, index, server):
+        '''
+        Records that a server now holds a chunk cached
+
+        :param index: chunk number
+        :param server: ip address of the server
+        '''
+        pass
+
+class _File_Range(object):
+    '''
+    A chunk of a job over a file (see files.py): a range of the file's 
+    bytes, which servers that have the file read themselves
+    '''
+    def __init__(self, source, records):
+        '''
+        :param source: description of the file (see files.Source), with
+            the 'start' and 'stop' byte offsets of the range added. A range
+            of a text file holds the lines that start within it
+        :param records: number of records in the range (an estimate, for 
+            text files)
+        '''
+        self.source = source
+        self.records = records
+
+    def __len__(self):
+        return self.records
+
+    def read(self):
+        '''
+        :return: the records in the range, read from the file
+        '''
+        return _read_source(self.source)
+
+    def raw(self):
+        '''
+        :return: the bytes the records in the range take in the file, for
+                 servers that don't have the file
+        '''
+        mapped = _map_file(self.source)
+        begin, end = _range_span(self.source, mapped)
+        return mapped[begin:end]
+
+def _map_file(source):
+    '''
+    :param source: description of a file (see files.Source)
+    :return: the file mapped into memory read-only, or an empty string if 
+             the file is empty (which can't be mapped)
+    '''
+    if source['size'] == 0:
+        return ''
+    with open(source['path'], 'rb') as mapped_file:
+        return mmap.mmap(mapped_file.fileno(), 0, access = mmap.ACCESS_READ)
+
+def _has_file(source):
+    '''
+    :param source: description of a file (see files.Source)
+    :return: whether this machine has the file at the same path (going by
+             its size, since copies on other machines differ in everything
+             else)
+    '''
+    try:
+        return os.path.getsize(source['path']) == source['size']
+    except OSError:
+        return False
+
+def _line_start(buf, position, size):
+    '''
+    :param buf: the bytes of a text file
+    :param position: a byte offset in the file
+    :param size: size of the file
+    :return: byte offset of the first line starting at or after position
+    '''
+    if position <= 0:
+        return 0
+    if position >= size:
+        return size
+    newline = buf.find('\n', position - 1)
+    if newline == -1:
+        return size
+    return newline + 1
+
+def _range_span(source, buf):
+    '''
+    :param source: description of a range of a file (see _File_Range)
+    :param buf: the bytes of the file (mapped into memory)
+    :return: tuple of the byte offsets where the range's records begin and
+             end. Text ranges don't end halfway through a line, and don't 
+             begin halfway through the line the previous range ended with
+    '''
+    if source['format'] == 'lines':
+        return (_line_start(buf, source['start'], source['size']),
+            _line_start(buf, source['stop'], source['size']))
+    return source['start'], source['stop']
+
+def _parse_range(source, buf, begin, end):
+    '''
+    :param source: description of the file the bytes come from
+    :param buf: the bytes (a mapped file, string or buffer)
+    :param begin: byte offset in buf the records begin at
+    :param end: byte offset in buf the records end at
+    :return: the records: a list of lines (without their newline), a list
+             of fixed-width records, or a NumPy array with a row per record
+             if the file has a dtype
+    '''
+    if source['format'] == 'lines':
+        lines = buf[begin:end].split('\n')
+        if lines[-1] == '':
+            # the last line ends with a newline (or there are no lines)
+            lines.pop()
+        return lines
+    record = source['record']
+    count = (end - begin) // record
+    if source['dtype'] is None:
+        records = buf[begin:begin + count * record]
+        return [records[offset:offset + record] 
+            for offset in xrange(0, len(records), record)]
+    dtype = numpy.dtype(source['dtype'])
+    shape = tuple(source['shape'])
+    items = count * int(numpy.prod(shape, dtype = numpy.int64))
+    # a copy, since arrays over a mapped file or a message are read-only
+    return numpy.frombuffer(buf, dtype, items, begin).reshape(
+        (count,) + shape).copy()
+
+def _read_source(source, raw = None):
+    '''
+    Reads the records of a range of a file
+
+    :param source: description of the range (see _File_Range)
+    :param raw: the bytes of the range's records, if they were sent along
+        rather than read from the file
+    :return: the records (see _parse_range)
+    '''
+    if raw is not None:
+        return _parse_range(source, raw, 0, len(raw))
+    mapped = _map_file(source)
+    begin, end = _range_span(source, mapped)
+    return _parse_range(source, mapped, begin, end)
+
+def _record_indices(source, records, start):
+    '''
+    :param source: description of the range the records were read from
+        (see _File_Range)
+    :param records: the records read from it
+    :param start: index of the range's first record
+    :return: what foo() indexes the records from (see _indices()): start,
+             or for lines the list of the byte offsets every line starts at
+             in the file, which are the same however the file is cut
+    '''
+    if source['format'] != 'lines':
+        return start
+    indices = list()
+    # ranges of text files start at the start of a line (see _File_Chunker)
+    offset = source['start']
+    for line in records:
+        indices.append(offset)
+        offset += len(line) + 1
+    return indices
+
+class _File_Chunker(_Chunker):
+    '''
+    Cuts a file (see files.py) into ranges of bytes, without reading it. 
+    Ranges of fixed-width records are cut at record boundaries, and ranges
+    of text files at the start of the first line after where they would 
+    end, which only reads the file around the cut
+    '''
+    def __init__(self, source, record_bytes):
+        '''
+        :param source: description of the file (see files.Source)
+        :param record_bytes: bytes per record (on average, for text files)
+        '''
+        self.source = source
+        self.record_bytes = max(int(record_bytes), 1)
+        # the file mapped into memory, once a text file is cut
+        self._mapped = None
+        self.cut = 0
+        self._position = source['offset']
+        self.remaining = self._remaining()
+
+    def _remaining(self):
+        '''
+        :return: number of records left (an estimate, for text files)
+        '''
+        left = self.source['size'] - self._position
+        if left <= 0:
+            return 0
+        return max(left // self.record_bytes, 1)
+
+    def next_chunk(self, plan):
+        '''
+        :param plan: the planner.Plan that sizes the chunk
+        :return: tuple of the index of the range's first record and the 
+                 _File_Range, or None if the file has run out. Lines are
+                 indexed by the byte offset they start at
+        '''
+        if self.remaining == 0:
+            return None
+        size = plan.next_chunk_size(self.remaining)
+        start = self._position
+        stop = min(start + size * self.record_bytes, self.source['size'])
+        if self.source['format'] == 'lines':
+            if self._mapped is None:
+                self._mapped = _map_file(self.source)
+            stop = _line_start(self._mapped, stop, self.source['size'])
+        piece = dict(self.source, start = start, stop = stop)
+        self._position = stop
+        self.remaining = self._remaining()
+        if self.source['format'] == 'lines':
+            index = start
+        else:
+            index = (start - self.source['offset']) // self.record_bytes
+        return index, _File_Range(piece, 
+            max((stop - start) // self.record_bytes, 1))
+
+class _Cached_Chunker(_Chunker):
+    '''
+    Cuts a cached dataset (see p_cache()) into the chunks it is cached in,
+    whatever the plan says, and knows which server holds each of them
+    '''
+    def __init__(self, data, dataset_id, sizes, owners):
+        '''
+        :param data: the dataset (a list or NumPy array)
+        :param dataset_id: id the dataset is cached under
+        :param sizes: number of elements in each of its chunks
+        :param owners: ip address of the server holding each chunk, or 
+            None. It is kept up to date as chunks get cached elsewhere
+        '''
+        _Chunker.__init__(self, data)
+        self.dataset_id = dataset_id
+        self.sizes = sizes
+        self.owners = owners
+        self._index = 0
+
+    def next_chunk(self, plan):
+        '''
+        :param plan: the planner.Plan of the job, which records the chunk
+        :return: tuple of the index of the chunk's first element and the
+                 chunk, or None if the data has run out
+        '''
+        if self._index == len(self.sizes):
+            return None
+        size = self.sizes[self._index]
+        self._index += 1
+        start = self.cut
+        self.cut += size
+        self.remaining -= size
+        return start, self._data[start:self.cut]
+
+    def owner(self, index):
+        return self.owners[index]
+
+    def set_owner(self, index, server):
+        self.owners[index] = server
+
+def _indices(start, data):
+    '''
+    :param start: index of data's first element in the whole list, or the
+        list of the indices of all of its elements, for chunks whose 
+        indices don't follow one another (lines of text files, see 
+        _record_indices())
+    :return: the indices of data's elements
+    '''
+    if isinstance(start, list):
+        return start
+    return xrange(start, start + len(data))
+
+def _single_map(foo, data, start = 0):
+    '''
+    Map a function foo() over data (of type list). Map modifies data in place
+    and supplies foo() with both the current element of the list and its
+    respective index.
+
+    This function is meant to be used on a chunk, which is a portion of 
+    a list designated for a single machine. This function is called by 
+    parallelogram.p_map()
+
+    :param foo: the function to map over data
+    :param data: the data to be mapped
+    :param start: index of data's first element in the whole list, or the
+        list of the indices of all of its elements (see _indices())
+    :return: the mapped data
+    '''
+    indices = _indices(start, data)
+    if (numpy is not None and isinstance(data, numpy.ndarray) and 
+        not data.flags.writeable):
+        # arrays rebuilt straight from a received message are read-only
+        data = data.copy()
+    for index, elt in enumerate(data):
+        data[index] = foo(elt, indices[index])
+    return data
+
+def _single_filter(foo, data, start = 0):
+    '''
+    Filter data (of type list) via a predicate formatted as a function. For 
+    example, if data is a list of natural numbers from 1 to N:
+
+        [1, 2, 3, ..., N]
+
+    And you'd like to filter this list so that it contains only even numbers, 
+    then simply define foo(elt, index) to be:
+
+        return elt % 2 == 0
+
+    This function is meant to be used on a chunk, which is a portion of 
+    a list designated for a single machine. This function is called by 
+    parallelogram.p_filter()
+
+    :param foo: the function to filter over data
+    :param data: the data to be filtered
+    :param start: index of data's first element in the whole list, or the
+        list of the indices of all of its elements (see _indices())
+    :return: the filtered data
+    '''
+    indices = _indices(start, data)
+    for index, elt in reversed(list(enumerate(data))):
+        if not foo(elt, indices[index]):
+            data.pop(index)
+    return data
+
+def _single_reduce(foo, data):
+    '''
+    Reduce data (of type list) by continually applying foo() to subsequent
+    elements of data. For exmaple, if data is a list of elements e_1 to e_N:
+
+        [e_1, e_2, e_3, ..., e_N]
+
+    And you'd like to reduce this list to the sum of all the elements, then 
+    simply define foo() to be:
+
+        def foo(elt1, elt2):
+            return elt1 + elt2
+
+    foo() is applied to data in the following way:
+
+        1. [foo(e_1, e_2), e_3, ..., e_N]
+        2. [foo(foo(e_1, e_2), e_3), ..., e_N]
+        ...
+        N - 1. [foo(foo(foo(e_1, e_2), e_3), ..., e_N)]
+
+    This function is meant to be used on a chunk, which is a portion of 
+    a list designated for a single machine. This function is called by 
+    parallelogram.p_reduce()
+
+    Note: this function assumes non-empty data. An exception will be thrown
+    if an empty list is passed in.
+
+    :param foo: the function to reduce over data
+    :param data: the data to be reduced
+    :return: a single reduction value
+    '''
+    # ensure that data actually exists
+    assert(len(data) > 0)
+
+    # as explained above, we need to apply foo() N-1 times
+    for _ in range(len(data) - 1):
+        data[0] = foo(data[0], data[1])
+        # once the function has been applied, remove the old element
+        data.pop(1)
+    return data[0]
+
+def _batch_map(foo, data, start = 0):
+    '''
+    Map a function foo() over a whole chunk at once. foo() gets the chunk
+    and the range of its indices in the whole list, and returns the mapped
+    chunk, so a NumPy array can be mapped without calling foo() per element:
+
+        def foo(chunk, indices):
+            return chunk * 2
+
+    :param foo: the function to map over data
+    :param data: the data to be mapped (a list or NumPy array)
+    :param start: index of data's first element in the whole list, or the
+        list of the indices of all of its elements (see _indices())
+    :return: the mapped data
+    '''
+    mapped = foo(data, _indices(start, data))
+    if len(mapped) != len(data):
+        raise ValueError("foo() mapped %d elements to %d." % 
+            (len(data), len(mapped)))
+    return mapped
+
+def _batch_filter(foo, data, start = 0):
+    '''
+    Filter a whole chunk at once. foo() gets the chunk and the range of its
+    indices in the whole list, and returns a mask of the elements to keep,
+    such as a boolean NumPy array:
+
+        def foo(chunk, indices):
+            return chunk % 2 == 0
+
+    :param foo: the function to filter data with
+    :param data: the data to be filtered (a list or NumPy array)
+    :param start: index of data's first element in the whole list, or the
+        list of the indices of all of its elements (see _indices())
+    :return: the filtered data, of the same type as data
+    '''
+    mask = foo(data, _indices(start, data))
+    if numpy is not None and isinstance(data, numpy.ndarray):
+        return data[numpy.asarray(mask, dtype = bool)]
+    return list(itertools.compress(data, mask))
+
+def _run_pipeline(stages, data, start = 0):
+    '''
+    Runs a chunk through every step of a fused pipeline (see 
+    dataset.Dataset) in one go, so the chunk only goes out and comes back 
+    once however many steps there are. Elements keep the index they had in
+    the whole list, however many elements before them were filtered out,
+    so batch steps after a filter get a list of indices rather than an 
+    xrange
+
+    :param stages: list of (op, function, batch) tuples, where op is 'map',
+        'filter' or, for the last step only, 'reduce'
+    :param data: the chunk (a list or NumPy array)
+    :param start: index of data's first element in the whole list, or the
+        list of the indices of all of its elements (see _indices())
+    :return: the processed chunk. A pipeline ending in a reduction returns
+             a list holding the chunk's reduced value, or an empty list if
+             no elements were left to reduce
+    '''
+    indices = _indices(start, data)
+    for op, foo, batch in stages:
+        if op == 'reduce':
+            if len(data) == 0:
+                return list()
+            return [_single_reduce(foo, list(data))]
+        if op == 'map' and batch:
+            mapped = foo(data, indices)
+            if len(mapped) != len(data):
+                raise ValueError("foo() mapped %d elements to %d." % 
+                    (len(data), len(mapped)))
+            data = mapped
+        elif op == 'map':
+            data = [foo(elt, index) for elt, index in 
+                itertools.izip(data, indices)]
+        else:
+            if batch:
+                mask = list(foo(data, indices))
+            else:
+                mask = [foo(elt, index) for elt, index in 
+                    itertools.izip(data, indices)]
+            if numpy is not None and isinstance(data, numpy.ndarray):
+                data = data[numpy.asarray(mask, dtype = bool)]
+            else:
+                data = list(itertools.compress(data, mask))
+            indices = list(itertools.compress(indices, mask))
+    return data
+
+class _LRU_Cache(object):
+    '''
+    A cache bounded by the total size of what it holds. Once full, the
+    least recently used entries are evicted to make room for new ones
+    '''
+    def __init__(self, max_bytes, on_evict = None):
+        '''
+        :param max_bytes: how many bytes worth of entries the cache may hold
+        :param on_evict: called with the key and value of every entry that
+            is evicted, or that is too big to be cached at all
+        '''
+        self.max_bytes = max_bytes
+        self.on_evict = on_evict
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        '''
+        :param key: key of the entry to look up
+        :return: the cached value, or None if it isn't cached
+        '''
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                self.misses += 1
+                return None
+            # reinserting marks the entry as the most recently used
+            self._entries[key] = entry
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, nbytes):
+        '''
+        Caches a value, evicting least recently used entries if needed. A
+        value bigger than the whole cache isn't cached at all
+
+        :param key: key to cache the value under
+        :param value: the value to cache
+        :param nbytes: how many bytes the value counts as
+        '''
+        evicted = list()
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.nbytes -= old[1]
+            if nbytes > self.max_bytes:
+                evicted.append((key, value))
+            else:
+                while self.nbytes + nbytes > self.max_bytes:
+                    evicted_key, (evicted_value, evicted_bytes) = \
+                        self._entries.popitem(last = False)
+                    self.nbytes -= evicted_bytes
+                    evicted.append((evicted_key, evicted_value))
+                self._entries[key] = (value, nbytes)
+                self.nbytes += nbytes
+        if self.on_evict is not None:
+            for evicted_key, evicted_value in evicted:
+                self.on_evict(evicted_key, evicted_value)
+
+    def discard(self, key):
+        '''
+        :param key: key of the entry to remove, if it is cached
+        '''
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.nbytes -= entry[1]
+
+    def keys(self):
+        '''
+        :return: list of the keys of every cached entry
+        '''
+        with self._lock:
+            return self._entries.keys()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+class _Chunk_Store(object):
+    '''
+    The chunks of cached datasets (see p_cache()) a server holds, keyed by
+    (dataset id, chunk number). Once they don't fit in memory anymore, the
+    least recently used chunks are spilled to files, or dropped if there is
+    nowhere to spill them to
+    '''
+    def __init__(self, max_bytes, spill_dir = None):
+        '''
+        :param max_bytes: how many bytes of chunks to keep in memory
+        :param spill_dir: directory to spill chunks to, or None
+        '''
+        self.spill_dir = spill_dir
+        # lookups of chunks we held (in memory or spilled) and didn't
+        self.hits = 0
+        self.misses = 0
+        self._memory = _LRU_Cache(max_bytes, self._spill)
+        # key -> path of every spilled chunk
+        self._spilled = dict()
+        self._lock = threading.Lock()
+
+    def put(self, key, chunk):
+        '''
+        :param key: (dataset id, chunk number) of the chunk
+        :param chunk: the pickled chunk (a string)
+        '''
+        self._forget_spilled(key)
+        self._memory.put(key, chunk, len(chunk))
+
+    def get(self, key):
+        '''
+        :param key: (dataset id, chunk number) of the chunk
+        :return: the pickled chunk, or None if we don't hold it (anymore)
+        '''
+        chunk = self._memory.get(key)
+        if chunk is None:
+            chunk = self._unspill(key)
+        with self._lock:
+            if chunk is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return chunk
+
+    def spilled(self):
+        '''
+        :return: number of chunks spilled to files
+        '''
+        with self._lock:
+            return len(self._spilled)
+
+    def _unspill(self, key):
+        '''
+        Reads a spilled chunk back into memory
+
+        :return: the pickled chunk, or None if it wasn't spilled
+        '''
+        with self._lock:
+            path = self._spilled.get(key)
+        if path is None:
+            return None
+        try:
+            with open(path, 'rb') as spilled:
+                chunk = spilled.read()
+        except IOError:
+            return None
+        # the chunk is in use again, so it goes back into memory
+        self.put(key, chunk)
+        return chunk
+
+    def drop(self, dataset_id):
+        '''
+        Forgets every chunk of a dataset
+
+        :param dataset_id: id of the dataset, or None for every dataset
+        '''
+        for key in self._memory.keys():
+            if dataset_id is None or key[0] == dataset_id:
+                self._memory.discard(key)
+        with self._lock:
+            keys = [key for key in self._spilled 
+                if dataset_id is None or key[0] == dataset_id]
+        for key in keys:
+            self._forget_spilled(key)
+
+    def _spill(self, key, chunk):
+        '''
+        Writes a chunk evicted from memory to a file in spill_dir
+        '''
+        if self.spill_dir is None:
+            return
+        path = os.path.join(self.spill_dir, 'parallelogram-%08x-%d.chunk' %
+            key)
+        try:
+            with open(path, 'wb') as spilled:
+                spilled.write(chunk)
+        except IOError:
+            # a full disk loses the chunk, which the client can resend
+            return
+        with self._lock:
+            self._spilled[key] = path
+
+    def _forget_spilled(self, key):
+        '''
+        Deletes the file a chunk was spilled to, if it was
+        '''
+        with self._lock:
+            path = self._spilled.pop(key, None)
+        if path is not None:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+#:codec name -> (frame flags, compress function, decompress function)
+_CODECS = dict()
+#:frame flags -> codec name
+_CODEC_FLAGS = dict()
+
+def _register_codec(name, flags, compress, decompress):
+    '''
+    Makes a compression codec available to jobs (see the compression option
+    of p_map()). Clients and servers both need to have it registered
+
+    :param name: name jobs pick the codec by
+    :param flags: frame flags marking a payload compressed with the codec
+        (unique per codec, from 1 to 65535)
+    :param compress: function compressing a string
+    :param decompress: function undoing compress
+    '''
+    _CODECS[name] = (flags, compress, decompress)
+    _CODEC_FLAGS[flags] = name
+
+_register_codec('zlib', 1, lambda data: zlib.compress(data, 1), 
+    zlib.decompress)
+_register_codec('bz2', 2, bz2.compress, bz2.decompress)
+if lzma is not None:
+    _register_codec('lzma', 3, lzma.compress, lzma.decompress)
+
+def _compress(codec, data):
+    '''
+    :param codec: name of a registered codec
+    :param data: the serialized message body (a string)
+    :return: tuple of the frame flags and payload to send it with: the 
+             compressed message, or the message as is (with flags 0) if it 
+             is too small to bother or compressing didn't make it smaller
+    '''
+    if len(data) < COMPRESSION_MIN_BYTES:
+        return 0, data
+    flags, compress, _ = _CODECS[codec]
+    compressed = compress(data)
+    if len(compressed) < len(data):
+        return flags, compressed
+    return 0, data
+
+def _decompress(flags, payload):
+    '''
+    :param flags: flags of the frame the payload came in
+    :param payload: the payload as it came off the wire
+    :return: the payload, decompressed into a fresh bytearray if the flags
+             say it was compressed
+    '''
+    if not flags:
+        return payload
+    if flags not in _CODEC_FLAGS:
+        raise RuntimeError("Unsupported compression %d!" % flags)
+    name = _CODEC_FLAGS[flags]
+    try:
+        return bytearray(_CODECS[name][2](str(payload)))
+    except Exception:
+        # every codec has errors of its own
+        raise RuntimeError("Corrupt %s payload!" % name)
+
+def _frame_parts(msg_type, job_id, request_id, payload, flags = 0):
+    '''
+    Frames a message: every frame starts with a fixed size header (see 
+    FRAME_HEADER) that tells the receiver exactly how many payload bytes
+    follow, so messages of any size survive TCP splitting them up
+
+    :param msg_type: one of the MSG_ message types
+    :param job_id: id of the job this message belongs to
+    :param request_id: id matching a result to the chunk it answers
+    :param payload: the serialized message body, or a list of strings (or
+        buffers) that together make up the message body
+    :param flags: codec flags of a compressed payload (see _compress)
+    :return: list of strings (or buffers) to send, in order
+    '''
+    if isinstance(payload, list):
+        parts = payload
+    else:
+        parts = [payload]
+    length = sum(len(part) for part in parts)
+    header = FRAME_HEADER.pack(PROTOCOL_VERSION, msg_type, flags, job_id,
+        request_id, length)
+    # small parts are glued together so they go out in one segment, but
+    # big ones aren't copied just for that
+    frame = list()
+    pending = header
+    for part in parts:
+        if len(part) <= NETWORK_CHUNK_SIZE:
+            pending += str(part)
+            continue
+        if pending:
+            frame.append(pending)
+            pending = ''
+        frame.append(part)
+    if pending:
+        frame.append(pending)
+    return frame
+
+def _send_frame(sock, msg_type, job_id, request_id, payload, flags = 0):
+    '''
+    Sends a single framed message (see _frame_parts) over a connected 
+    streaming socket
+
+    :param sock: connected socket to send the frame over
+    :param msg_type: one of the MSG_ message types
+    :param job_id: id of the job this message belongs to
+    :param request_id: id matching a result to the chunk it answers
+    :param payload: the serialized message body, or a list of strings (or
+        buffers) that together make up the message body
+    :param flags: codec flags of a compressed payload (see _compress)
+    '''
+    for part in _frame_parts(msg_type, job_id, request_id, payload, flags):
+        sock.sendall(part)
+
+def _recv_exactly(sock, size):
+    '''
+    Reads exactly `size` bytes from a streaming socket. The bytes are read
+    straight into a preallocated buffer, so large messages are never built
+    up by concatenating smaller strings
+
+    :param sock: connected socket to read from
+    :param size: number of bytes to read
+    :return: a bytearray of length `size`
+    '''
+    buf = bytearray(size)
+    view = memoryview(buf)
+    received = 0
+    while received < size:
+        nbytes = sock.recv_into(view[received:], size - received)
+        if nbytes == 0:
+            raise RuntimeError("Socket connection broken!")
+        received += nbytes
+    return buf
+
+def _recv_frame(sock):
+    '''
+    Reads a single framed message (as sent by _send_frame) from a streaming 
+    socket, looping until the whole frame has arrived. Compressed payloads
+    are decompressed
+
+    :param sock: connected socket to read from
+    :return: tuple of the message type, job id, request id and payload 
+             (a bytearray)
+    '''
+    header = _recv_exactly(sock, FRAME_HEADER.size)
+    version, msg_type, flags, job_id, request_id, length = \
+        FRAME_HEADER.unpack_from(header)
+    if version != PROTOCOL_VERSION:
+        raise RuntimeError("Unsupported protocol version %d!" % version)
+    return msg_type, job_id, request_id, _decompress(flags, 
+        _recv_exactly(sock, length))
+
+def _loads(payload):
+    '''
+    Unpickles a received payload. cStringIO wraps the receive buffer 
+    without copying it, unlike converting the buffer to a string first
+
+    :param payload: bytearray (or string) holding a pickled object
+    :return: the unpickled object
+    '''
+    return pickle.load(cStringIO.StringIO(payload))
+
+def _load_envelope(payload):
+    '''
+    Unpickles the envelope in front of a chunk (see _send_op)
+
+    :param payload: bytearray (or string) holding the chunk message
+    :return: tuple of the envelope and the offset in payload at which the
+             chunk itself starts
+    '''
+    stream = cStringIO.StringIO(payload)
+    envelope = pickle.load(stream)
+    return envelope, stream.tell()
+
+def _array_id(buffers, obj):
+    '''
+    Takes big NumPy arrays out of a pickle (see _dump_parts). Arrays of 
+    objects or with fields, views with gaps between their elements and 
+    arrays small enough that copying them costs nothing are pickled as usual
+
+    :param buffers: list the memory of arrays taken out is appended to
+    :param obj: object about to be pickled
+    :return: a reference to where the array's memory goes among buffers,
+             or None to pickle obj as usual
+    '''
+    if (numpy is None or type(obj) is not numpy.ndarray or 
+        obj.nbytes <= NETWORK_CHUNK_SIZE or obj.dtype.hasobject or 
+        obj.dtype.fields is not None or not obj.flags.c_contiguous):
+        return None
+    offset = sum(len(buf) for buf in buffers)
+    buffers.append(buffer(obj))
+    return (offset, obj.nbytes, obj.dtype.str, obj.shape)
+
+def _dump_parts(obj):
+    '''
+    Pickles a chunk (or a result message) for sending. The memory of big
+    NumPy arrays doesn't go into the pickle, which would copy it twice, but
+    is sent as is right after it, and _load_parts() rebuilds the arrays 
+    straight from the receive buffer. Plain data is pickled with cPickle, 
+    which is many times faster than cloudpickle, and only what cPickle 
+    can't pickle (like lambdas, or anything defined in the caller's script)
+    falls back to cloudpickle
+
+    :param obj: the object to pickle
+    :return: list of strings and buffers that together make up the message
+    '''
+    buffers = list()
+    stream = cStringIO.StringIO()
+    try:
+        pickler = cPickle.Pickler(stream, 2)
+        # only called on objects that aren't of a built-in type
+        pickler.inst_persistent_id = functools.partial(_array_id, buffers)
+        pickler.dump(obj)
+        if '__main__' in stream.getvalue():
+            # cPickle refers to whatever the caller's script defines by
+            # name, which the servers can't look up
+            raise cPickle.PicklingError("%r refers to __main__" % type(obj))
+    except (cPickle.PicklingError, TypeError):
+        buffers = list()
+        stream = cStringIO.StringIO()
+        pickler = pickle.CloudPickler(stream, 2)
+        pickler.persistent_id = functools.partial(_array_id, buffers)
+        pickler.dump(obj)
+    dumped = stream.getvalue()
+    return [PICKLE_LENGTH.pack(len(dumped)), dumped] + buffers
+
+def _join_parts(parts):
+    '''
+    :param parts: list of strings and buffers from _dump_parts()
+    :return: the parts glued into a single string
+    '''
+    return ''.join(str(part) for part in parts)
+
+def _load_parts(payload, stream = None):
+    '''
+    Unpickles an object sent as parts by _dump_parts(). Its arrays are views
+    of payload rather than copies, so they are only writable if payload is 
+    (a bytearray, say, rather than a string)
+
+    :param payload: bytearray (or string) holding the object
+    :param stream: cStringIO stream over payload positioned where the object
+        starts, if other objects come first. It is left where the object 
+        ends
+    :return: the unpickled object
+    '''
+    if stream is None:
+        stream = cStringIO.StringIO(payload)
+    length, = PICKLE_LENGTH.unpack(stream.read(PICKLE_LENGTH.size))
+    # where the memory of the arrays taken out of the pickle starts
+    start = stream.tell() + length
+    end = [start]
+
+    def _rebuild(array_id):
+        '''
+        makes an array out of the memory array_id refers to
+        '''
+        offset, nbytes, dtype, shape = array_id
+        dtype = numpy.dtype(dtype)
+        end[0] = max(end[0], start + offset + nbytes)
+        return numpy.frombuffer(payload, dtype, nbytes // dtype.itemsize,
+            start + offset).reshape(shape)
+
+    unpickler = cPickle.Unpickler(stream)
+    unpickler.persistent_load = _rebuild
+    obj = unpickler.load()
+    stream.seek(end[0])
+    return obj
+
+def _socket_pair():
+    '''
+    Connects a pair of sockets to each other over the loopback interface,
+    since socket.socketpair() doesn't exist on Windows
+
+    :return: tuple of the two connected sockets
+    '''
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(1)
+        writer = socket.create_connection(listener.getsockname())
+        reader, _ = listener.accept()
+    finally:
+        listener.close()
+    return reader, writer
+
+def _callback(callback, *args):
+    '''
+    Runs a callback on the client loop's thread. A failing callback is 
+    reported, but mustn't take the loop (and every other job) down with it
+
+    :param callback: the function to call
+    :param args: arguments to call it with
+    '''
+    try:
+        callback(*args)
+    except Exception:
+        traceback.print_exc()
+
+class _Client_Loop(object):
+    '''
+    The one thread that does all of a client's network I/O. It connects
+    every _Connection, writes the frames queued on them, reads the results
+    and times out requests nobody answered, waiting on all sockets at once
+    with select(). The number of threads stays the same no matter how many
+    chunks are in flight, or on how many servers
+    '''
+    def __init__(self):
+        self._connections = list()
+        self._lock = threading.Lock()
+        self._woken = False
+        # writing a byte to the waker interrupts select(), so new frames
+        # and connections get picked up right away
+        self._wakeup, self._waker = _socket_pair()
+        self._wakeup.setblocking(0)
+        thread = threading.Thread(target = self._run)
+        thread.daemon = True
+        thread.start()
+
+    def add(self, connection):
+        '''
+        :param connection: a new _Connection for the loop to drive
+        '''
+        with self._lock:
+            self._connections.append(connection)
+        self.wake()
+
+    def wake(self):
+        '''
+        Interrupts the loop's select(), unless it was already interrupted
+        '''
+        with self._lock:
+            if self._woken:
+                return
+            self._woken = True
+        self._waker.send('x')
+
+    def _run(self):
+        while True:
+            with self._lock:
+                self._connections = [connection for connection in 
+                    self._connections if not connection.closed]
+                connections = list(self._connections)
+            sockets = dict((connection.sock, connection) 
+                for connection in connections)
+            readers = [self._wakeup] + [connection.sock for connection in 
+                connections if not connection.connecting]
+            writers = [connection.sock for connection in connections 
+                if connection.connecting or connection.wants_write()]
+            deadlines = [connection.next_deadline() 
+                for connection in connections]
+            deadlines = [deadline for deadline in deadlines 
+                if deadline is not None]
+            if deadlines:
+                timeout = max(min(deadlines) - timeit.default_timer(), 0)
+            else:
+                timeout = None
+            try:
+                readable, writable, _ = select.select(readers, writers, [],
+                    timeout)
+            except (select.error, socket.error):
+                # a connection was closed under us, and is dropped above
+                readable, writable = list(), list()
+            if self._wakeup in readable:
+                with self._lock:
+                    self._woken = False
+                try:
+                    self._wakeup.recv(NETWORK_CHUNK_SIZE)
+                except socket.error:
+                    pass
+            for sock in writable:
+                sockets[sock].on_writable()
+            for sock in readable:
+                if sock is not self._wakeup:
+                    sockets[sock].on_readable()
+            now = timeit.default_timer()
+            for connection in connections:
+                connection.expire(now)
+
+_client_loop = None
+_client_loop_lock = threading.Lock()
+
+def _get_client_loop():
+    '''
+    :return: the client loop of this process, started on first use
+    '''
+    global _client_loop
+    with _client_loop_lock:
+        if _client_loop is None:
+            _client_loop = _Client_Loop()
+        return _client_loop
+
+#:errno values of a non-blocking socket call that would have had to wait
+_WOULD_BLOCK = (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINPROGRESS,
+    getattr(errno, 'WSAEWOULDBLOCK', errno.EWOULDBLOCK))
+
+class _Connection(object):
+    '''
+    A long-lived client connection to a single server. Many chunks (from
+    any number of jobs and threads) can be in flight on one connection at
+    once: every request gets a fresh request id, and the client loop hands
+    each result to the callback registered for its request id
+    '''
+    def __init__(self, ip, port, timeout):
+        '''
+        Starts connecting to the server listening on the given ip address 
+        and port. Requests can be queued right away, they are sent once 
+        the connection is up
+
+        :param ip: ip address of the server
+        :param port: port the server listens on
+        :param timeout: how long in seconds to wait for the connection
+        '''
+        self.address = (ip, port)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setblocking(0)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        error = self.sock.connect_ex(self.address)
+        if error and error not in _WOULD_BLOCK:
+            self.sock.close()
+            raise socket.error(error, os.strerror(error))
+        self.connecting = True
+        self.closed = False
+        # digests of the functions the server has been sent, so chunks can
+        # refer to them by digest only
+        self.functions = set()
+        # paths of the files the server doesn't have (see files.py)
+        self.missing_files = set()
+        self._request_ids = itertools.count()
+        # request id -> (callback, deadline, compressor)
+        self._pending = dict()
+        # strings and buffers waiting to be sent, and how much of the first
+        # one already was
+        self._outgoing = collections.deque()
+        self._sent = 0
+        # bytes sent and seconds spent sending them, counting only while
+        # frames were waiting to go out (see bandwidth())
+        self._burst_started = None
+        self._burst_bytes = 0
+        self._sent_bytes = 0
+        self._sent_seconds = 0.0
+        # the frame being received: its header, then its payload
+        self._header = bytearray(FRAME_HEADER.size)
+        self._frame = None
+        self._payload = None
+        self._received = 0
+        self._connect_deadline = timeit.default_timer() + timeout
+        self._lock = threading.Lock()
+        _get_client_loop().add(self)
+
+    def request_async(self, job_id, payload, timeout, callback, 
+        msg_type = MSG_CHUNK, flags = 0, compressor = None):
+        '''
+        Queues a message for the client loop to send, without waiting for
+        the response
+
+        :param job_id: id of the job the message belongs to
+        :param payload: the pickled message, or a list of parts of it
+        :param timeout: how long in seconds to wait for the response
+        :param callback: called with the message type and payload of the
+            response, or with (None, None) if there was none in time. It
+            runs on the client loop's thread, so it should be quick
+        :param msg_type: type of the message, if it isn't a chunk
+        :param flags: codec flags of a compressed payload (see _compress)
+        :param compressor: the _Compressor of the message's job, which
+            counts the bytes of the response
+        '''
+        with self._lock:
+            if self.closed:
+                raise RuntimeError("Socket connection broken!")
+            request_id = next(self._request_ids) % 2**32
+            self._pending[request_id] = (callback, 
+                timeit.default_timer() + timeout, compressor)
+            if not self._outgoing and not self.connecting:
+                self._burst_started = timeit.default_timer()
+            self._outgoing.extend(_frame_parts(msg_type, job_id, request_id,
+                payload, flags))
+        _get_client_loop().wake()
+
+    def request(self, job_id, payload, timeout, msg_type = MSG_CHUNK):
+        '''
+        Sends a message to the server and blocks until its response arrives
+
+        :param job_id: id of the job the message belongs to
+        :param payload: the pickled message, or a list of parts of it
+        :param timeout: how long in seconds to wait for the response
+        :param msg_type: type of the message, if it isn't a chunk
+        :return: tuple of the message type and payload of the response
+        '''
+        waiter = Queue.Queue(maxsize = 1)
+        self.request_async(job_id, payload, timeout, 
+            lambda *response: waiter.put(response), msg_type)
+        msg_type, payload = waiter.get()
+        if msg_type is None:
+            raise RuntimeError("No result from %s:%d!" % self.address)
+        return msg_type, payload
+
+    def needs_function(self, digest):
+        '''
+        Tells the caller whether a chunk has to carry the pickled function
+        with the given digest, which is only the case for the first chunk
+        sent with it. Chunks sent after that one arrive after it on the same
+        stream, so they can refer to the function by its digest
+
+        :param digest: digest of the pickled function
+        :return: True the first time this is called for the digest
+        '''
+        with self._lock:
+            if digest in self.functions:
+                return False
+            self.functions.add(digest)
+            return True
+
+    def bandwidth(self):
+        '''
+        :return: bytes per second the connection sends at, measured only
+                 while frames were waiting to go out. Until enough bytes 
+                 have gone out to tell, the planner's PLAN_BANDWIDTH
+        '''
+        with self._lock:
+            if self._sent_bytes < BANDWIDTH_SAMPLE_BYTES:
+                return PLAN_BANDWIDTH
+            return self._sent_bytes / max(self._sent_seconds, 1e-9)
+
+    def wants_write(self):
+        '''
+        :return: whether there is anything waiting to be sent
+        '''
+        return bool(self._outgoing)
+
+    def next_deadline(self):
+        '''
+        :return: the time the next request (or the connection attempt) times
+                 out at, or None if nothing can time out
+        '''
+        with self._lock:
+            deadlines = [deadline for _, deadline, _ in 
+                self._pending.values()]
+        if self.connecting:
+            deadlines.append(self._connect_deadline)
+        if not deadlines:
+            return None
+        return min(deadlines)
+
+    def on_writable(self):
+        '''
+        Called by the client loop when the socket can take more bytes. 
+        Sends as much as it can without blocking, straight out of the 
+        queued strings and buffers
+        '''
+        try:
+            if self.connecting:
+                error = self.sock.getsockopt(socket.SOL_SOCKET, 
+                    socket.SO_ERROR)
+                if error:
+                    raise socket.error(error, os.strerror(error))
+                self.connecting = False
+                self._burst_started = timeit.default_timer()
+            while self._outgoing:
+                part = self._outgoing[0]
+                nbytes = self.sock.send(buffer(part, self._sent))
+                self._sent += nbytes
+                self._burst_bytes += nbytes
+                if self._sent < len(part):
+                    return
+                self._outgoing.popleft()
+                self._sent = 0
+            self._end_burst()
+        except socket.error as error:
+            if error.errno not in _WOULD_BLOCK:
+                self.close()
+
+    def _end_burst(self):
+        '''
+        Adds the bytes sent since the queue last ran dry to the measured
+        bandwidth. Bursts small enough to vanish into the socket's buffers
+        say nothing about the network, so they aren't counted
+        '''
+        with self._lock:
+            if self._outgoing or self._burst_started is None:
+                return
+            if self._burst_bytes >= BANDWIDTH_SAMPLE_BYTES:
+                self._sent_bytes += self._burst_bytes
+                self._sent_seconds += (timeit.default_timer() - 
+                    self._burst_started)
+            self._burst_bytes = 0
+            self._burst_started = None
+
+    def on_readable(self):
+        '''
+        Called by the client loop when the socket has bytes for us. Reads 
+        as much as it can without blocking, and hands every complete 
+        response to the callback of the request it answers. Responses 
+        nobody waits for anymore (their request timed out) are dropped
+        '''
+        try:
+            while True:
+                if self._payload is None:
+                    buf = self._header
+                else:
+                    buf = self._payload
+                if self._received < len(buf):
+                    nbytes = self.sock.recv_into(
+                        memoryview(buf)[self._received:])
+                    if nbytes == 0:
+                        raise RuntimeError("Socket connection broken!")
+                    self._received += nbytes
+                    continue
+                self._received = 0
+                if self._payload is None:
+                    version, msg_type, flags, _, request_id, length = \
+                        FRAME_HEADER.unpack_from(self._header)
+                    if version != PROTOCOL_VERSION:
+                        raise RuntimeError("Unsupported protocol version %d!"
+                            % version)
+                    self._frame = (msg_type, flags, request_id)
+                    self._payload = bytearray(length)
+                    continue
+                (msg_type, flags, request_id), payload = (self._frame, 
+                    self._payload)
+                self._payload = None
+                if msg_type not in (MSG_RESULT, MSG_FUNC_MISSING, 
+                    MSG_DATA_MISSING):
+                    continue
+                with self._lock:
+                    pending = self._pending.pop(request_id, None)
+                if pending is None:
+                    continue
+                callback, _, compressor = pending
+                received = _decompress(flags, payload)
+                if compressor is not None:
+                    compressor.received(received, len(payload))
+                _callback(callback, msg_type, received)
+        except socket.error as error:
+            if error.errno not in _WOULD_BLOCK:
+                self.close()
+        except RuntimeError:
+            self.close()
+
+    def expire(self, now):
+        '''
+        Fails the requests (and the connection attempt) that timed out
+
+        :param now: the current timeit.default_timer()
+        '''
+        if self.connecting and now >= self._connect_deadline:
+            self.close()
+            return
+        with self._lock:
+            expired = [request_id for request_id, (_, deadline, _) in 
+                self._pending.items() if deadline <= now]
+            callbacks = [self._pending.pop(request_id)[0] 
+                for request_id in expired]
+        for callback in callbacks:
+            _callback(callback, None, None)
+
+    def close(self):
+        '''
+        Closes the connection, failing every request still waiting on it
+        '''
+        with self._lock:
+            if self.closed:
+                return
+            self.closed = True
+            pending = self._pending.values()
+            self._pending.clear()
+            self._outgoing.clear()
+        for callback, _, _ in pending:
+            _callback(callback, None, None)
+        self.sock.close()
+
+class _Connection_Pool(object):
+    '''
+    Hands out one shared _Connection per server, opening it on first use and
+    reopening it if it broke
+    '''
+    def __init__(self):
+        self._connections = dict()
+        self._lock = threading.Lock()
+
+    def get(self, ip, port, timeout):
+        '''
+        :param ip: ip address of the server
+        :param port: port the server listens on
+        :param timeout: how long in seconds to wait when (re)connecting
+        :return: an open _Connection to the server
+        '''
+        with self._lock:
+            connection = self._connections.get((ip, port))
+            if connection is None or connection.closed:
+                connection = _Connection(ip, port, timeout)
+                self._connections[(ip, port)] = connection
+            return connection
+
+#:connections shared by every job run from this process
+_connection_pool = _Connection_Pool()
+
+def _run_op(op, foo, chunk, start = 0, batch = False):
+    '''
+    Runs a single chunk through the _single_ (or _batch_) version of an 
+    operation
+
+    :param op: 'map', 'filter', 'reduce' or 'pipeline'
+    :param foo: function to use for the operation, or for pipelines the
+        list of steps (see _run_pipeline)
+    :param chunk: chunk to perform operation on
+    :param start: index of the chunk's first element in the whole list
+    :param batch: whether foo() takes the whole chunk at once (map and
+        filter only)
+    :return: the processed chunk
+    '''
+    if isinstance(chunk, _File_Range):
+        records = chunk.read()
+        start = _record_indices(chunk.source, records, start)
+        chunk = records
+    if op == 'map':
+        if batch:
+            return _batch_map(foo, chunk, start)
+        return _single_map(foo, chunk, start)
+    elif op == 'filter':
+        if batch:
+            return _batch_filter(foo, chunk, start)
+        return _single_filter(foo, chunk, start)
+    elif op == 'reduce':
+        return _single_reduce(foo, chunk)
+    elif op == 'pipeline':
+        return _run_pipeline(foo, chunk, start)
+    raise ValueError("The operation %r does not exist." % op)
+
+def _profile_op(op, foo, chunk, start = 0, batch = False):
+    '''
+    Runs a single chunk like _run_op() does, under cProfile
+
+    :return: tuple of the processed chunk and the profile of the run, as 
+             the dict of raw stats timing.Profile merges
+    '''
+    profiler = cProfile.Profile()
+    processed_chunk = profiler.runcall(_run_op, op, foo, chunk, start, batch)
+    profiler.create_stats()
+    return processed_chunk, profiler.stats
+
+#:functions unpickled by this (worker) process, keyed by digest
+_worker_functions = _LRU_Cache(FUNCTION_CACHE_BYTES)
+
+def _process_chunk(digest, func_bytes, payload, received):
+    '''
+    Processes a chunk message inside a worker process. Unpickled functions
+    are cached per worker, so each worker only unpickles a function once.
+    Any error raised by the function, or by pickling what it returned, is
+    sent back instead of a result, so it never raises itself. The
+    result comes with how long the chunk waited for a worker, and how long
+    unpickling it and running the function on it took (see timing.py), and
+    for profiled jobs with the profile of the function's run
+
+    :param digest: digest of the pickled function
+    :param func_bytes: the pickled function
+    :param payload: the chunk message, as built by _send_op()
+    :param received: when the chunk arrived at the server
+    :return: tuple of the result message, as built by _dump_parts(), and a
+             dict of the seconds the chunk spent in the 'queue', 'loading',
+             'compute' and 'dumping' phases (see metrics.py), or None if 
+             foo() raised an error
+    '''
+    started = timeit.default_timer()
+    envelope = None
+    try:
+        message = cStringIO.StringIO(payload)
+        envelope = pickle.load(message)
+        func = _worker_functions.get(digest)
+        if func is None:
+            func = pickle.loads(func_bytes)
+            _worker_functions.put(digest, func, len(func_bytes))
+        if envelope['source'] is None:
+            chunk = _load_parts(payload, message)
+        elif envelope['raw']:
+            # the client sent the range's bytes along
+            chunk = _read_source(envelope['source'], 
+                buffer(payload, message.tell()))
+        else:
+            chunk = _read_source(envelope['source'])
+        start = envelope['start']
+        if envelope['source'] is not None:
+            start = _record_indices(envelope['source'], chunk, start)
+        loaded = timeit.default_timer()
+        profile = None
+        if envelope['profile']:
+            processed_chunk, profile = _profile_op(envelope['op'], func, 
+                chunk, start, envelope['batch'])
+        else:
+            processed_chunk = _run_op(envelope['op'], func, chunk, start,
+                envelope['batch'])
+        timing = {'queue': max(started - received, 0.0), 
+            'loading': loaded - started, 
+            'compute': timeit.default_timer() - loaded}
+        dict_sent = {'chunk': processed_chunk, 'index': envelope['index'],
+            'timing': timing, 'profile': profile}
+        dumped = timeit.default_timer()
+        # foo() may well return something that can't be pickled
+        message = _join_parts(_dump_parts(dict_sent))
+        # too late to go along with the result, but servers count it
+        timing['dumping'] = timeit.default_timer() - dumped
+        return message, timing
+    except Exception:
+        index = envelope['index'] if envelope is not None else None
+        return _worker_error(index), None
+
+def _worker_error(index):
+    '''
+    :param index: chunk number of the chunk that failed, if it is known
+    :return: result message reporting the error being handled, as 
+             _process_chunk() sends it
+    '''
+    return _join_parts(_dump_parts({'error': traceback.format_exc(),
+        'index': index}))
+
+class _Worker_Pool(object):
+    '''
+    A pool of worker processes that chunks are handed to, so that a machine
+    processes as many chunks at once as it has cores, no matter the GIL
+    '''
+    def __init__(self, workers = None):
+        '''
+        :param workers: number of worker processes, by default one per core
+        '''
+        self.workers = workers or multiprocessing.cpu_count()
+        self.busy = 0
+        self._pool = multiprocessing.Pool(self.workers)
+        self._lock = threading.Lock()
+        # (arguments of _process_chunk(), callback) of the chunks waiting 
+        # for a free worker, in the order they were submitted
+        self._waiting = collections.deque()
+        # when the latest chunks were done
+        self._finished = collections.deque(maxlen = 1024)
+
+    def submit(self, digest, func_bytes, payload, callback, received = None):
+        '''
+        Hands a chunk to a free worker, or queues it up until one is free.
+        It never blocks, so whoever submits chunks can go on with other 
+        messages while the workers are busy
+
+        :param digest: digest of the pickled function
+        :param func_bytes: the pickled function
+        :param payload: the chunk message (a string)
+        :param callback: called with the result of _process_chunk() once 
+            the chunk is processed
+        :param received: when the chunk arrived, by default now
+        '''
+        if received is None:
+            received = timeit.default_timer()
+        task = ((digest, func_bytes, payload, received), callback)
+        with self._lock:
+            if self.busy >= self.workers:
+                self._waiting.append(task)
+                return
+            self.busy += 1
+        self._start(task)
+
+    def _start(self, task):
+        '''
+        hands a chunk to a worker, which has been counted as busy already.
+        _process_chunk() doesn't raise, so the worker always calls back, and
+        if the chunk can't be handed over (the pool was closed), it fails
+        right away
+        '''
+        arguments, callback = task
+        try:
+            self._pool.apply_async(_process_chunk, arguments, 
+                callback = functools.partial(self._done, callback))
+        except Exception:
+            self._done(callback, (_worker_error(None), None))
+
+    def _done(self, callback, result):
+        '''
+        hands the chunk's worker the next chunk waiting, if there is one, 
+        and passes the result on
+        '''
+        task = None
+        with self._lock:
+            self._finished.append(timeit.default_timer())
+            if self._waiting:
+                task = self._waiting.popleft()
+            else:
+                self.busy -= 1
+        if task is not None:
+            self._start(task)
+        callback(result)
+
+    def free_slots(self):
+        '''
+        :return: number of workers not processing a chunk
+        '''
+        return self.workers - self.busy
+
+    def waiting(self):
+        '''
+        :return: number of chunks waiting for a free worker
+        '''
+        return len(self._waiting)
+
+    def throughput(self):
+        '''
+        :return: chunks per second processed over the last 
+                 THROUGHPUT_SECONDS
+        '''
+        since = timeit.default_timer() - THROUGHPUT_SECONDS
+        with self._lock:
+            recent = sum(1 for finished in self._finished if finished >= since)
+        return float(recent) / THROUGHPUT_SECONDS
+
+    def close(self):
+        '''
+        stops the worker processes, dropping the chunks still waiting
+        '''
+        with self._lock:
+            self._waiting.clear()
+        self._pool.terminate()
+        self._pool.join()
+
+#:worker processes jobs run in when they run on this machine, started the
+#:first time a job needs them and shared by every job after that
+_local_pool = None
+_local_pool_lock = threading.Lock()
+
+def _get_local_pool(workers):
+    '''
+    :param workers: number of worker processes to start the pool with, if
+        it hasn't been started yet
+    :return: the local _Worker_Pool
+    '''
+    global _local_pool
+    with _local_pool_lock:
+        if _local_pool is None:
+            _local_pool = _Worker_Pool(workers)
+        return _local_pool
+
+def _submit_local(pool, done, func, chunk, op, index, start, batch, 
+    profile = None):
+    '''
+    Hands a chunk to the local worker pool, which processes it just like a
+    server would, as soon as a worker is free
+
+    :param pool: the local _Worker_Pool
+    :param done: Queue to report the outcome to, as an (index, None, 
+        succeeded, processed chunk or traceback) tuple, like _send_op() 
+        does
+    :param func: (pickled function, digest) tuple from _pickle_func()
+    :param chunk: chunk to perform operation on
+    :param op: 'map', 'filter' or 'reduce'
+    :param index: chunk number to allow ordering of processed chunks
+    :param start: index of the chunk's first element in the whole list
+    :param batch: whether foo() takes the whole chunk at once
+    :param profile: the job's timing.Profile, if the job is profiled
+    '''
+    func_bytes, digest = func
+    envelope = {'func': None, 'func_digest': digest, 'op': op,
+        'index': index, 'start': start, 'batch': batch, 'keep': False,
+        'source': None, 'raw': False, 'profile': profile is not None}
+    body = list()
+    if isinstance(chunk, _File_Range):
+        # the workers read the file's range themselves
+        envelope['source'] = chunk.source
+    else:
+        body = _dump_parts(chunk)
+    payload = _join_parts([pickle.dumps(envelope)] + body)
+    pool.submit(digest, func_bytes, payload,
+        functools.partial(_local_done, done, profile, index))
+
+def _local_done(done, profile, index, result):
+    '''
+    Reports a chunk processed by the local worker pool, and merges its 
+    profile into the job's timing.Profile (if the job is profiled)
+
+    :param index: chunk number of the chunk, which failed chunks may not
+        know themselves
+    '''
+    message, _ = result
+    # copied into a bytearray, so arrays in the chunk are writable
+    response = _load_parts(bytearray(message))
+    if profile is not None and response.get('profile'):
+        profile.merge(response['profile'])
+    if 'error' in response:
+        done.put((index, None, False, response['error']))
+    else:
+        done.put((index, None, True, response['chunk']))
+
+def _pickle_func(foo):
+    '''
+    Pickles a function once per job, along with everything it closes over,
+    and content-addresses the result, so servers can cache the function
+    and later chunks only need to carry its digest
+
+    :param foo: the function to pickle
+    :return: tuple of the pickled function and its digest
+    '''
+    func_bytes = pickle.dumps(foo)
+    return func_bytes, hashlib.sha1(func_bytes).digest()
+
+class _Compressor(object):
+    '''
+    Decides which of a job's messages get compressed, and counts how many
+    bytes they take before and after. In the 'auto' mode, the front of 
+    every COMPRESSION_RESAMPLE'th message (chunk or result) is compressed 
+    as a sample, to see how well and how fast the job's data compresses. A
+    chunk (and its result) is then compressed if compressing it and 
+    sending what is left takes less time than sending it as is over its 
+    connection
+    '''
+    def __init__(self, mode = 'auto', stats = None):
+        '''
+        :param mode: 'auto', None to never compress, or the name of a 
+            registered codec to compress every message with
+        :param stats: object (the job's planner.Plan) whose bytes_before 
+            and bytes_after attributes count the bytes of the job's 
+            messages, both ways, before and after compression, and whose
+            stats (a timing.JobStats) count the bytes sent and received
+        '''
+        self.mode = mode
+        self.stats = stats
+        self._messages = 0
+        # compressed size per byte, and seconds spent per byte, of the 
+        # latest sample
+        self._ratio = 1.0
+        self._seconds_per_byte = 0.0
+        self._lock = threading.Lock()
+
+    def choose(self, parts, bandwidth):
+        '''
+        :param parts: list of strings and buffers making up a message
+        :param bandwidth: bytes per second the message's connection sends
+        :return: name of the codec to compress the message (and its 
+                 response) with, or None to send them as they are
+        '''
+        if self.mode != 'auto':
+            return self.mode
+        self._observe(parts)
+        with self._lock:
+            seconds = self._seconds_per_byte + self._ratio / bandwidth
+        if seconds < 1.0 / bandwidth:
+            return COMPRESSION_CODEC
+        return None
+
+    def received(self, payload, size):
+        '''
+        Counts a result, and samples it if it is time to
+
+        :param payload: the (decompressed) result
+        :param size: bytes it took on the wire
+        '''
+        self.count(len(payload), size, False)
+        if self.mode == 'auto':
+            self._observe([payload])
+
+    def _observe(self, parts):
+        '''
+        Compresses the front of every COMPRESSION_RESAMPLE'th message big
+        enough to be compressed, to see how well that pays
+        '''
+        if sum(len(part) for part in parts) < COMPRESSION_MIN_BYTES:
+            return
+        with self._lock:
+            sample = self._messages % COMPRESSION_RESAMPLE == 0
+            self._messages += 1
+        if not sample:
+            return
+        front = list()
+        size = 0
+        for part in parts:
+            if size >= COMPRESSION_SAMPLE_BYTES:
+                break
+            front.append(str(buffer(part, 0, COMPRESSION_SAMPLE_BYTES - size)))
+            size += len(front[-1])
+        data = ''.join(front)
+        compress = _CODECS[COMPRESSION_CODEC][1]
+        started = timeit.default_timer()
+        compressed = compress(data)
+        elapsed = timeit.default_timer() - started
+        with self._lock:
+            self._ratio = float(len(compressed)) / len(data)
+            self._seconds_per_byte = elapsed / len(data)
+
+    def encode(self, parts, codec):
+        '''
+        :param parts: list of strings and buffers making up a message
+        :param codec: the codec choose() picked for it, or None
+        :return: tuple of the frame flags and parts to send the message as
+        '''
+        size = sum(len(part) for part in parts)
+        flags = 0
+        if codec is not None:
+            flags, data = _compress(codec, _join_parts(parts))
+            if flags:
+                parts = [data]
+        self.count(size, sum(len(part) for part in parts))
+        return flags, parts
+
+    def count(self, before, after, sent = True):
+        '''
+        :param before: bytes of a message before compression
+        :param after: bytes it took on the wire
+        :param sent: whether the message was sent, rather than received
+        '''
+        if self.stats is None:
+            return
+        with self._lock:
+            self.stats.bytes_before += before
+            self.stats.bytes_after += after
+        self.stats.stats.count('bytes_sent' if sent else 'bytes_received',
+            after)
 
-def _chunk_list(data, sz):
+def _send_op(done, func, chunk, op, index, target_ip, port, timeout, job_id,
+    keep = False, start = 0, batch = False, compressor = None, 
+    dataset = None, cached = False, stats = None, profile = None):
     '''
-    Creates chunks of size `sz` from data. Returns a list of chunks, 
-    which are also lists.
+    Sends an operation over the network for a server to process. It 
+    doesn't wait for the result: the client loop reports it once it 
+    arrives, so any number of chunks can be in flight from one thread
 
-    These chunks will be sent to other machines on the network for processing.
+    The pickled function only goes along with the first chunk sent over a
+    connection. Later chunks just carry its digest, unless the server
+    reports that it no longer has the function cached. Chunks of a cached
+    dataset (see p_cache()) work the same way: the chunk itself is left 
+    out if the server holds it, unless it reports that it doesn't anymore.
+    So are ranges of files (see files.py), whose bytes are only sent to 
+    servers that don't have the file
 
-    :param data: the data (of type list) to be split into chunks
-    :param sz: the desired chunk size
-    :return: a 2D array of chunks
+    :param done: Queue to report the outcome to, as an (index, target_ip,
+        succeeded, processed chunk) tuple. If foo() raised an error on the
+        server, succeeded is False and the error's traceback takes the place
+        of the processed chunk
+    :param func: (pickled function, digest) tuple from _pickle_func(), for
+        map, filter, or reduce calls
+    :param chunk: chunk to perform operation on
+    :param op: string corresponding to operation to perform: 
+        'map', 'filter', 'reduce'
+    :param index: chunk number to allow ordering of processed chunks
+    :param target_ip: ip address of the server to send the chunk to
+    :param port: port of server
+    :param timeout: how long in seconds to wait for the result
+    :param job_id: id of the job this chunk belongs to
+    :param keep: if True, the server keeps the reduced chunk for a tree
+        reduction and only reports back that it is done
+    :param start: index of the chunk's first element in the whole list
+    :param batch: whether foo() takes the whole chunk at once
+    :param compressor: the job's _Compressor, if its messages may be 
+        compressed
+    :param dataset: (dataset id, chunk number) of the chunk, if it is one
+        of a cached dataset's. The server caches the chunk under it
+    :param cached: whether the server already holds the chunk, so only its
+        key needs to be sent
+    :param stats: the job's timing.JobStats, which times pickling the 
+        chunk, sending it and unpickling its result
+    :param profile: the job's timing.Profile, if the server should profile
+        foo() on the chunk. The chunk's profile is merged into it
     '''
-    chunks = []
-    for i in xrange(0, len(data), sz):
-        chunk = data[i:i + sz]
-        chunks.append(chunk)
-    return chunks
+    if stats is None:
+        stats = timing.JobStats()
+    func_bytes, digest = func
+    # the chunk is pickled separately from the small envelope, so the
+    # server can route the chunk without unpickling it
+    envelope = {'func': None, 'func_digest': digest, 'op': op, 
+        'index': index, 'start': start, 'batch': batch, 'keep': keep,
+        'compress': None, 'dataset': dataset, 'cached': cached, 
+        'source': None, 'raw': False, 'profile': profile is not None}
+    body = list()
+    pickled = timeit.default_timer()
+    if isinstance(chunk, _File_Range):
+        envelope['source'] = chunk.source
+    elif not cached:
+        body.extend(_dump_parts(chunk))
+    stats.add('pickling', timeit.default_timer() - pickled)
+    # when the chunk was last handed to the client loop
+    sent = [None]
 
-def _single_map(foo, data):
-    '''
-    Map a function foo() over data (of type list). Map modifies data in place
-    and supplies foo() with both the current element of the list and its
-    respective index.
+    def send(connection):
+        started = timeit.default_timer()
+        parts = [pickle.dumps(envelope)] + body
+        flags = 0
+        encoded = timeit.default_timer()
+        if compressor is not None:
+            flags, parts = compressor.encode(parts, envelope['compress'])
+        sent[0] = timeit.default_timer()
+        stats.add('pickling', encoded - started)
+        stats.add('compression', sent[0] - encoded)
+        connection.request_async(job_id, parts, timeout, 
+            functools.partial(received, connection), flags = flags, 
+            compressor = compressor)
 
-    This function is meant to be used on a chunk, which is a portion of 
-    a list designated for a single machine. This function is called by 
-    parallelogram.p_map()
+    def received(connection, msg_type, payload):
+        arrived = timeit.default_timer()
+        if msg_type in (MSG_FUNC_MISSING, MSG_DATA_MISSING):
+            stats.count('resent')
+        try:
+            if msg_type == MSG_FUNC_MISSING and envelope['func'] is None:
+                # the server evicted the function (or restarted), so 
+                # resend it
+                envelope['func'] = func_bytes
+                send(connection)
+                return
+            if msg_type == MSG_DATA_MISSING and envelope['cached']:
+                # the server evicted the chunk, so send it along this time
+                envelope['cached'] = False
+                body.extend(_dump_parts(chunk))
+                send(connection)
+                return
+            if (msg_type == MSG_DATA_MISSING and envelope['source'] and 
+                not envelope['raw']):
+                # the server doesn't have the file, so send it the range's
+                # bytes, and the ranges after this one right away
+                connection.missing_files.add(chunk.source['path'])
+                envelope['raw'] = True
+                body.append(chunk.raw())
+                send(connection)
+                return
+            if msg_type != MSG_RESULT:
+                raise RuntimeError("No result from %s!" % target_ip)
+            response = _load_parts(payload)
+        except Exception:
+            # the client will resend the chunk
+            done.put((index, target_ip, False, None))
+            return
+        stats.add('unpickling', timeit.default_timer() - arrived)
+        # the round trip, less the time the server spent on the chunk
+        served = response.get('timing', dict())
+        stats.served(served)
+        stats.add('network', max(arrived - sent[0] - sum(served.values()),
+            0.0))
+        if profile is not None and response.get('profile'):
+            profile.merge(response['profile'])
+        if 'error' in response:
+            # foo() itself failed, so resending the chunk won't help
+            done.put((index, target_ip, False, response['error']))
+        else:
+            done.put((response['index'], target_ip, True, response['chunk']))
 
-    :param foo: the function to map over data
-    :param data: the data to be mapped
-    :return: the mapped data
-    '''
-    for index, elt in enumerate(data):
-        data[index] = foo(elt, index)
-    return data
+    try:
+        connection = _connection_pool.get(target_ip, port, timeout)
+        if connection.needs_function(digest):
+            envelope['func'] = func_bytes
+        if (envelope['source'] is not None and not envelope['raw'] and
+            chunk.source['path'] in connection.missing_files):
+            envelope['raw'] = True
+            body.append(chunk.raw())
+        if compressor is not None:
+            envelope['compress'] = compressor.choose(body, 
+                connection.bandwidth())
+        send(connection)
+    except (RuntimeError, socket.error):
+        done.put((index, target_ip, False, None))
 
-def _single_filter(foo, data):
+def _store_chunk(stored, dataset_id, index, chunk, target_ip, port, 
+    timeout):
     '''
-    Filter data (of type list) via a predicate formatted as a function. For 
-    example, if data is a list of natural numbers from 1 to N:
+    Sends a chunk of a dataset for a server to cache (see p_cache()), 
+    without waiting for the server to confirm it
 
-        [1, 2, 3, ..., N]
+    :param stored: Queue to report the outcome to, as an (index, target_ip,
+        succeeded) tuple
+    :param dataset_id: id of the dataset
+    :param index: number of the chunk in the dataset
+    :param chunk: the chunk
+    :param target_ip: ip address of the server to cache the chunk on
+    :param port: port of server
+    :param timeout: how long in seconds to wait for the server to confirm
+    '''
+    def received(msg_type, payload):
+        stored.put((index, target_ip, msg_type == MSG_RESULT))
 
-    And you'd like to filter this list so that it contains only even numbers, 
-    then simply define foo(elt, index) to be:
+    parts = [pickle.dumps({'dataset': (dataset_id, index)})] + \
+        _dump_parts(chunk)
+    try:
+        connection = _connection_pool.get(target_ip, port, timeout)
+        connection.request_async(dataset_id, parts, timeout, received, 
+            MSG_STORE)
+    except (RuntimeError, socket.error):
+        stored.put((index, target_ip, False))
 
-        return elt % 2 == 0
+def _drop_dataset(dataset_id, servers, port, timeout):
+    '''
+    Tells servers to forget a cached dataset. Servers that don't answer 
+    are left to evict it in time
 
-    This function is meant to be used on a chunk, which is a portion of 
-    a list designated for a single machine. This function is called by 
-    parallelogram.p_filter()
+    :param dataset_id: id of the dataset
+    :param servers: ip addresses of the servers holding its chunks
+    :param port: port of the servers
+    :param timeout: how long in seconds to wait for each server
+    '''
+    replies = Queue.Queue()
+    asked = 0
+    for server in servers:
+        try:
+            connection = _connection_pool.get(server, port, timeout)
+            connection.request_async(dataset_id, pickle.dumps(
+                {'dataset': dataset_id}), timeout, 
+                lambda *response: replies.put(response), MSG_DROP)
+            asked += 1
+        except (RuntimeError, socket.error):
+            pass
+    for _ in xrange(asked):
+        replies.get()
 
-    :param foo: the function to filter over data
-    :param data: the data to be filtered
-    :return: the filtered data
+def _merge_runs(foo, runs, commutative):
     '''
-    for index, elt in reversed(list(enumerate(data))):
-        if not foo(elt, index):
-            data.pop(index)
-    return data
+    Combines partial reductions of a job. Every partial reduction is a run:
+    a (first chunk index, last chunk index, value) tuple. Runs of adjacent
+    chunks are combined in order, so foo() only has to be associative. If
+    foo() is commutative too, all runs are combined into one
 
-def _single_reduce(foo, data):
+    :param foo: the function the job reduces with
+    :param runs: list of runs to combine
+    :param commutative: whether runs may be combined out of order
+    :return: the list of runs left, in chunk order
     '''
-    Reduce data (of type list) by continually applying foo() to subsequent
-    elements of data. For exmaple, if data is a list of elements e_1 to e_N:
+    merged = list()
+    for run in sorted(runs, key = lambda run: run[0]):
+        if merged and (commutative or merged[-1][1] + 1 == run[0]):
+            first, _, value = merged[-1]
+            merged[-1] = (first, run[1], foo(value, run[2]))
+        else:
+            merged.append(run)
+    return merged
 
-        [e_1, e_2, e_3, ..., e_N]
+class _Tree_Reduction(object):
+    '''
+    What a server knows about its part in a job's tree reduction: the 
+    partial reductions of the chunks it processed, the runs its children
+    in the tree sent it, and the client's request to collect them
+    '''
+    def __init__(self):
+        #:chunk index -> reduced chunk
+        self.partials = dict()
+        #:runs sent by children in the reduction tree
+        self.child_runs = list()
+        self.children_received = 0
+        #:(collect message, connection, request id) once the client asks
+        self.collect = None
+        #:when the job was last heard from
+        self.touched = timeit.default_timer()
 
-    And you'd like to reduce this list to the sum of all the elements, then 
-    simply define foo() to be:
+    def ready(self):
+        '''
+        :return: whether everything this server has to combine is in
+        '''
+        if self.collect is None:
+            return False
+        message = self.collect[0]
+        return (self.children_received >= message['children'] and
+            all(index in self.partials for index in message['indices']))
 
-        def foo(elt1, elt2):
-            return elt1 + elt2
+def _send_collect(replies, server, port, job_id, message, timeout):
+    '''
+    Asks a server to combine its part of a tree reduction, and reports its
+    reply (or the failure to get one) once it arrives. Servers only reply 
+    once the servers below them in the tree are done
 
-    foo() is applied to data in the following way:
+    :param replies: Queue to put (server, reply) tuples on, where reply is 
+        None if the server couldn't be reached
+    :param server: ip address of the server
+    :param port: port of the server
+    :param job_id: id of the job
+    :param message: the collect message for this server
+    :param timeout: how long in seconds to wait for the reply
+    '''
+    def received(msg_type, payload):
+        reply = None
+        if msg_type is not None:
+            try:
+                reply = _loads(payload)
+            except Exception:
+                pass
+        replies.put((server, reply))
 
-        1. [foo(e_1, e_2), e_3, ..., e_N]
-        2. [foo(foo(e_1, e_2), e_3), ..., e_N]
-        ...
-        N - 1. [foo(foo(foo(e_1, e_2), e_3), ..., e_N)]
+    try:
+        connection = _connection_pool.get(server, port, timeout)
+        connection.request_async(job_id, pickle.dumps(message), timeout, 
+            received, MSG_COLLECT)
+    except (RuntimeError, socket.error):
+        replies.put((server, None))
 
-    This function is meant to be used on a chunk, which is a portion of 
-    a list designated for a single machine. This function is called by 
-    parallelogram.p_reduce()
+def _collect_tree(func, job_id, owners, port, timeout, commutative):
+    '''
+    Finishes a tree reduction once every chunk has been reduced and kept by
+    a server. The servers are arranged in a tree with REDUCE_TREE_FANOUT
+    children per server. Every server combines its own partial reductions
+    with the runs of its children and sends the result to its parent, so 
+    only the root sends anything back to the client
 
-    Note: this function assumes non-empty data. An exception will be thrown
-    if an empty list is passed in.
+    :param func: (pickled function, digest) tuple of the job
+    :param job_id: id of the job
+    :param owners: list with, for every chunk, the ip address of the server
+        that kept its partial reduction
+    :param port: port of the servers
+    :param timeout: how long in seconds to wait on each level of the tree
+    :param commutative: whether partial reductions may be combined in any
+        order
+    :return: list of the partial reductions left, in chunk order (a single
+             value whenever everything could be combined), which is empty
+             if the job had no chunks
+    '''
+    servers = sorted(set(owners))
+    if not servers:
+        return list()
+    indices = dict((server, list()) for server in servers)
+    for index, server in enumerate(owners):
+        indices[server].append(index)
+    depth = 1
+    while REDUCE_TREE_FANOUT ** depth < len(servers):
+        depth += 1
+    replies = Queue.Queue()
+    for position, server in enumerate(servers):
+        children = [child for child in xrange(1, len(servers))
+            if (child - 1) // REDUCE_TREE_FANOUT == position]
+        if position == 0:
+            parent = None
+        else:
+            parent = (servers[(position - 1) // REDUCE_TREE_FANOUT], port)
+        message = {'func_digest': func[1], 'indices': indices[server], 
+            'children': len(children), 'parent': parent, 
+            'commutative': commutative}
+        _send_collect(replies, server, port, job_id, message, 
+            timeout * (depth + 1))
+    runs = None
+    for _ in servers:
+        server, reply = replies.get()
+        if reply is None:
+            raise RuntimeError("Lost the partial reductions on %s!" % server)
+        if 'error' in reply:
+            raise RuntimeError("foo() failed on %s:\n%s" % 
+                (server, reply['error']))
+        if server == servers[0]:
+            runs = reply['runs']
+    if runs is None:
+        # only the root of the tree sends its runs back
+        raise RuntimeError("%s, the root of the reduction tree, sent back "
+            "no partial reductions!" % servers[0])
+    return [run[2] for run in runs]
 
-    :param foo: the function to reduce over data
-    :param data: the data to be reduced
-    :return: a single reduction value
+class _Server_Connection(object):
     '''
-    # ensure that data actually exists
-    assert(len(data) > 0)
+    Server side of a client's long-lived connection. A reader thread queues
+    every chunk that arrives, and results are written back on the same 
+    socket, tagged with the request id of the chunk they answer
+    '''
+    def __init__(self, sock, queue):
+        '''
+        :param sock: socket accepted from the client
+        :param queue: Queue to add received frames to
+        '''
+        self.sock = sock
+        # clients keep their connection open between jobs
+        self.sock.settimeout(None)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.queue = queue
+        self.closed = False
+        self._send_lock = threading.Lock()
+        reader = threading.Thread(target = self._read_loop)
+        reader.daemon = True
+        reader.start()
 
-    # as explained above, we need to apply foo() N-1 times
-    for _ in range(len(data) - 1):
-        data[0] = foo(data[0], data[1])
-        # once the function has been applied, remove the old element
-        data.pop(1)
-    return data[0]
+    def _read_loop(self):
+        '''
+        Queues (frame, connection, time received) tuples until the client
+        hangs up
+        '''
+        try:
+            while True:
+                self.queue.put((_recv_frame(self.sock), self, 
+                    timeit.default_timer()))
+        except (RuntimeError, socket.error):
+            # a client that dies halfway through a frame shouldn't
+            # take the whole server down with it
+            self.close()
 
-def _send_op(result, foo, chunk, op, index, target_ip, own_ip, port, timeout):
-    '''
-    Sends an operation over the network for a server to process, and 
-    receives the result. Since we want each chunk to be sent in 
-    parallel, this should be threaded
+    def send(self, msg_type, job_id, request_id, msg, codec = None):
+        '''
+        Sends a response back to the client
 
-    :param result: empty list passed by reference which will contain the result. 
-        Necessary because threads don't allow standard return values
-    :param foo: function to use for map, filter, or reduce calls
-    :param chunk: chunk to perform operation on
-    :param op: string corresponding to operation to perform: 
-        'map', 'filter', 'reduce'
-    :param index: chunk number to allow ordering of processed chunks
-    :param port: port of server
-    '''
-    try:
-        dict_sending = {'func': foo, 'chunk': chunk, 'op': op, 'index': index}
-        csts = threading.Thread(
-            target = _client_socket_thread_send,
-            args = (target_ip, port, pickle.dumps(dict_sending), timeout))
-        csts.start()
-        queue = Queue.Queue()
-        cstr = threading.Thread(
-            target = _client_socket_thread_receive,
-            args = (own_ip, port+1, queue, timeout))
-        cstr.start()
-        cstr.join(timeout = None)
-        response = pickle.loads(queue.get())
-        result[response['index']] = response['chunk']
-    except RuntimeError, socket.timeout:
-        return #do nothing on error, just end and the client will restart the sending protocol
+        :param msg_type: MSG_RESULT or MSG_FUNC_MISSING
+        :param job_id: id of the job the response belongs to
+        :param request_id: request id of the chunk this response answers
+        :param msg: the pickled response message
+        :param codec: name of the codec to compress the response with, if
+            the client asked for that
+        '''
+        flags = 0
+        if codec in _CODECS:
+            flags, msg = _compress(codec, msg)
+        try:
+            with self._send_lock:
+                _send_frame(self.sock, msg_type, job_id, request_id, msg, 
+                    flags)
+        except socket.error:
+            # the client is gone, so it will resend the chunk elsewhere
+            self.close()
 
-# based on examples from https://docs.python.org/2/howto/sockets.html
-def _server_socket_thread_send(ip, target_port, msg):
-    '''
-    Starts a server thread to send a message to the target port
-    
-    :param target_port: The port to which the message should be sent
-    :param msg: The message to send
-    '''
-    socket.setdefaulttimeout(DEFAULT_TIMEOUT)
-    #defines socket as internet, streaming socket
-    clientsocket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    target_port = target_port
-    clientsocket.connect((ip, target_port))
-    sent = clientsocket.send(msg)
-    if sent == 0:
-        raise RuntimeError("Socket connection broken!")
-    clientsocket.close()
+    def close(self):
+        '''
+        closes the connection
+        '''
+        self.closed = True
+        self.sock.close()
 
 # based on examples from https://docs.python.org/2/howto/sockets.html
 class _Server_Socket_Thread_Receive(threading.Thread):
     def __init__(self, ip, port, queue):
         '''
-        Starts a server socket that listens on the input port and writes
-        received messages to the queue. Has a blocking
+        Starts a server socket that listens on the input port and accepts
+        long-lived client connections, each of which writes the frames it 
+        receives to the queue. Has a blocking
         infinite loop, so should be run as a separate thread
         A class rather than a function to make it stoppable and allow
         cleaner socket closing in infinite loop
@@ -225,25 +2398,30 @@ class _Server_Socket_Thread_Receive(threading.Thread):
         #before refusing outside connections
         self.serversocket.listen(MAX_CONNECT_REQUESTS)
         self.queue = queue
+        self.connections = list()
         self._abort = False
         threading.Thread.__init__(self)
 
     def run(self):
         '''
-        Loop that listens for messages and processes them if they arrive, 
-        adding them to the queue
+        Loop that accepts client connections. Each connection then adds
+        ((message type, job id, request id, payload), connection) pairs to
+        the queue as messages arrive
         '''
         while not self._abort:
             try:
-                clientsocket, address = self.serversocket.accept()
+                clientsocket, _ = self.serversocket.accept()
             except socket.timeout:
                 #reset blocking client on timeout
                 continue
-            msg = clientsocket.recv(NETWORK_CHUNK_SIZE)
-            if msg == '':
-                raise RuntimeError("Socket connection broken!")
-            self.queue.put((msg, address[0]))
-            clientsocket.close()
+            # forget clients that have hung up
+            self.connections = [connection for connection in self.connections
+                if not connection.closed]
+            self.connections.append(_Server_Connection(clientsocket, 
+                self.queue))
+        for connection in self.connections:
+            connection.close()
+        self.serversocket.close()
 
     def stop(self):
         '''
@@ -251,73 +2429,18 @@ class _Server_Socket_Thread_Receive(threading.Thread):
         '''
         self._abort = True
 
-# based on examples from https://docs.python.org/2/howto/sockets.html
-def _client_socket_thread_send(target_ip, target_port, msg, timeout):
-    '''
-    Starts a client thread to send a message to the target port
-
-    :param target_ip: The ip address to which the message should be sent
-    :param target_port: The port to which the message should be sent
-    :param msg: The message to send
-    :return: how long in seconds to wait before giving up on sending
-    '''
-    #socket setup
-    socket.setdefaulttimeout(timeout)
-    #defines socket as internet, streaming socket
-    clientsocket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    #connects to given ip address and port
-    clientsocket.connect((target_ip, target_port))
-    try:
-        sent = clientsocket.send(msg)
-        if sent == 0:
-            raise RuntimeError("Socket connection broken!")
-    finally:
-        clientsocket.close()
-
-# based on examples from https://docs.python.org/2/howto/sockets.html
-def _client_socket_thread_receive(ip, port, queue, timeout):
-    '''
-    Starts a client socket that listens on the input port and writes
-    received messages to the queue. Is blocking, so should be run on a 
-    separate thread
-
-    :param ip: The ip address on which to listen
-    :param port: Port on which to listen for messages
-    :param queue: Queue to add messages to
-    :param timeout: how long in seconds to wait before giving up on receiving
-    '''
-    #socket setup
-    socket.setdefaulttimeout(timeout)
-    #defines socket as internet, streaming socket
-    serversocket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    #prevents socket waiting for additional packets after end of 
-    #channel to allow quick reuse
-    serversocket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    #bind socket to given ip address and port
-    serversocket.bind((ip, port))
-    #allows up to MAX_CONNECT_REQUESTS requests before 
-    # refusing outside connections
-    serversocket.listen(MAX_CONNECT_REQUESTS)
-    #want to make sure to close clientsocket on timeout, which throws a socket.timeout exception
-    clientsocket, _ = serversocket.accept()
-    try:
-        msg = clientsocket.recv(NETWORK_CHUNK_SIZE)
-        if msg == '':
-            raise RuntimeError("Socket connection broken!")
-        queue.put(msg)
-    finally:
-        clientsocket.close()
-
 #based on sample code from https://pymotw.com/2/socket/multicast.html
 def _broadcast_client_thread(mult_group_ip, mult_port, server_list):
     '''
     Function run by client that broadcasts that there is a job it wants servers
-    to perform, and returns a list of tuples of avaliable servers and how
-    'avaliable' and willing to take new chunks each of them are
+    to perform, and returns a list of tuples of avaliable servers, how
+    'avaliable' and willing to take new chunks each of them are, and how
+    long in seconds each of them took to answer
 
     :param mult_group_ip: multicast group ip address on which to broadcast
     :param mult_port: multicast port to send to
-    :param server_list: empty list to add to avaliable server/server avaliability metric tuples
+    :param server_list: empty list to add (server, avaliability metric, 
+        round trip time, availability report) tuples to
     '''
     message = str('job')
     multicast_group = (mult_group_ip, mult_port)
@@ -327,7 +2450,7 @@ def _broadcast_client_thread(mult_group_ip, mult_port, server_list):
 
     # Set a timeout so the socket does not block indefinitely when trying
     # to receive data.
-    sock.settimeout(2)
+    sock.settimeout(DISCOVERY_TIMEOUT)
 
     # Standard time-to-live value scopes:
     # 0    Restricted to the same host
@@ -341,25 +2464,226 @@ def _broadcast_client_thread(mult_group_ip, mult_port, server_list):
 
     try:
         # Send data to the multicast group
+        sent = timeit.default_timer()
         sock.sendto(message, multicast_group)
 
 
         # Look for responses from all recipients
         while True:
             try:
-                avaliability, address = sock.recvfrom(NETWORK_CHUNK_SIZE)
+                reply, address = sock.recvfrom(NETWORK_CHUNK_SIZE)
             except socket.timeout:
                 break
-            else:
-                #only want ip address from address tuple, not port
-                server_list.append((address[0], int(avaliability)))
+            try:
+                avaliability, report = _parse_report(reply)
+            except (ValueError, KeyError):
+                continue
+            #only want ip address from address tuple, not port
+            server_list.append((address[0], avaliability,
+                timeit.default_timer() - sent, report))
 
     finally:
         sock.close()
 
+def _join_group(sock, mult_group_ip):
+    '''
+    Tells the operating system to add a socket to a multicast group on all
+    interfaces
+
+    :param sock: bound datagram socket
+    :param mult_group_ip: multicast group ip address to join
+    '''
+    group = socket.inet_aton(mult_group_ip)
+    mreq = struct.pack('4sL', group, socket.INADDR_ANY)
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+
+class _Membership(threading.Thread):
+    '''
+    Keeps track of the servers on the network from the heartbeats they 
+    multicast, so jobs can look them up right away instead of waiting on a
+    discovery broadcast. Servers join as soon as their first heartbeat
+    arrives and leave when they say so, or once they miss 
+    HEARTBEATS_MISSED heartbeats in a row
+    '''
+    def __init__(self, mult_group_ip, heartbeat_port):
+        '''
+        :param mult_group_ip: multicast group ip address servers beat on
+        :param heartbeat_port: port servers send their heartbeats to
+        '''
+        threading.Thread.__init__(self)
+        self.daemon = True
+        # server ip -> (avaliability, round trip time or None, time heard,
+        # availability report)
+        self.members = dict()
+        self._lock = threading.Lock()
+        # every client on this machine listens to the heartbeats
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            self.sock.bind(('', heartbeat_port))
+            _join_group(self.sock, mult_group_ip)
+        except socket.error:
+            self.sock.close()
+            raise
+
+    def run(self):
+        '''
+        Records heartbeats until the process exits
+        '''
+        while True:
+            try:
+                msg, address = self.sock.recvfrom(NETWORK_CHUNK_SIZE)
+                if msg == 'leave':
+                    with self._lock:
+                        self.members.pop(address[0], None)
+                elif msg.startswith('beat '):
+                    avaliability, report = _parse_report(msg[len('beat '):])
+                    with self._lock:
+                        rtt = self.members.get(address[0], (None,) * 4)[1]
+                        self.members[address[0]] = (avaliability, rtt, 
+                            timeit.default_timer(), report)
+            except (socket.error, ValueError, KeyError):
+                continue
+
+    def update(self, servers):
+        '''
+        Records the answers to a discovery broadcast, which unlike 
+        heartbeats tell us how far away the servers are
+
+        :param servers: list of (server, avaliability metric, round trip 
+            time, availability report) tuples
+        '''
+        now = timeit.default_timer()
+        with self._lock:
+            for server in servers:
+                self.members[server[0]] = (server[1], server[2], now, 
+                    _report(server))
+
+    def servers(self):
+        '''
+        :return: list of (server, avaliability metric, round trip time,
+                 availability report) tuples of the servers heard from lately, like 
+                 _broadcast_client_thread() finds. Servers only known from
+                 their heartbeats get the median round trip time of the 
+                 others, and if none has been measured yet, the list is 
+                 empty so that the caller broadcasts
+        '''
+        oldest = timeit.default_timer() - HEARTBEAT_SECONDS * HEARTBEATS_MISSED
+        with self._lock:
+            for server in [server for server, member in 
+                self.members.items() if member[2] < oldest]:
+                del self.members[server]
+            members = self.members.items()
+        rtts = sorted(member[1] for _, member in members 
+            if member[1] is not None)
+        if not rtts:
+            return list()
+        median = rtts[len(rtts) // 2]
+        return [(server, avaliability, median if rtt is None else rtt, report)
+            for server, (avaliability, rtt, _, report) in members]
+
+_membership = None
+_membership_lock = threading.Lock()
+
+def _get_membership():
+    '''
+    :return: the _Membership of this process, started on first use, or None
+             if this machine can't listen to heartbeats
+    '''
+    global _membership
+    with _membership_lock:
+        if _membership is None:
+            try:
+                _membership = _Membership(MULTICAST_GROUP_IP, HEARTBEAT_PORT)
+                _membership.start()
+            except socket.error:
+                _membership = False
+        return _membership or None
+
+def _benchmark(seconds):
+    '''
+    Measures how fast a single core of this machine runs Python code, so
+    clients can tell fast machines from slow ones before sending them 
+    anything
+
+    :param seconds: how long to measure for
+    :return: score, the number of rounds of a fixed workload per second
+    '''
+    rounds = 0
+    start = timeit.default_timer()
+    elapsed = 0.0
+    while elapsed < seconds:
+        sum(xrange(1000))
+        cPickle.loads(cPickle.dumps(range(100), -1))
+        rounds += 1
+        elapsed = timeit.default_timer() - start
+    return rounds / elapsed
+
+def _parse_report(message):
+    '''
+    Reads a server's availability report. Servers from before reports 
+    existed only send their avaliability metric
+
+    :param message: the report, as sent by the server
+    :return: tuple of the avaliability metric and the report (a dict, or
+             None for old servers)
+    '''
+    report = json.loads(message)
+    if isinstance(report, dict):
+        return int(report['avaliability']), report
+    return int(report), None
+
+def _report(server):
+    '''
+    :param server: a (server, avaliability metric, round trip time[, 
+        availability report]) tuple
+    :return: the server's availability report, or None if there is none
+    '''
+    if len(server) > 3:
+        return server[3]
+    return None
+
+#:(time found, servers) of the latest discovery, shared by the jobs that
+#:start soon after it
+_discovery = (None, list())
+_discovery_lock = threading.Lock()
+
+def _discover(server_list, fresh = False):
+    '''
+    Finds the available servers. Servers heard from through their 
+    heartbeats are known right away. Otherwise this broadcasts like 
+    _broadcast_client_thread() does, but shares the answers between jobs:
+    jobs that start while a discovery is going on wait for it rather than
+    broadcasting again, and so do jobs that start within 
+    DISCOVERY_CACHE_SECONDS after it
+
+    :param server_list: empty list to add (server, avaliability metric, 
+        round trip time) tuples to
+    :param fresh: if True, always broadcast again (say, because the servers
+        found before have failed)
+    '''
+    global _discovery
+    membership = _get_membership()
+    if membership is not None and not fresh:
+        servers = membership.servers()
+        if servers:
+            server_list.extend(servers)
+            return
+    with _discovery_lock:
+        found, servers = _discovery
+        if (fresh or found is None or 
+            timeit.default_timer() - found > DISCOVERY_CACHE_SECONDS):
+            servers = list()
+            _broadcast_client_thread(MULTICAST_GROUP_IP, MULTICAST_PORT, 
+                servers)
+            _discovery = (timeit.default_timer(), servers)
+            if membership is not None:
+                membership.update(servers)
+    server_list.extend(servers)
+
 #based on sample code from https://pymotw.com/2/socket/multicast.html
 class _Broadcast_Server_Thread(threading.Thread):
-    def __init__(self, mult_group_ip, mult_port, chunk_queue):
+    def __init__(self, mult_group_ip, mult_port, chunk_queue, pool):
         '''
         Function run by server to listen on the multicast channel for new
         clients, and to send back that the machine is avaliable and how
@@ -369,9 +2693,14 @@ class _Broadcast_Server_Thread(threading.Thread):
         :param mult_group_ip: multicast group ip address on which to broadcast
         :param mult_port: multicast port to send to
         :param chunk_queue: queue of chunks that are waiting to be processed
+        :param pool: the _Worker_Pool processing the chunks
         '''
         self.chunk_queue = chunk_queue
+        self.pool = pool
         self._abort = False
+        # None until the benchmark has run, so clients treat us like a 
+        # server that doesn't report a score
+        self.score = None
         threading.Thread.__init__(self)
 
         server_address = ('', mult_port)
@@ -382,28 +2711,36 @@ class _Broadcast_Server_Thread(threading.Thread):
 
         # Tell the operating system to add the socket to the multicast group
         # on all interfaces.
-        group = socket.inet_aton(mult_group_ip)
-        mreq = struct.pack('4sL', group, socket.INADDR_ANY)
-        self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+        _join_group(self.sock, mult_group_ip)
 
     def run(self):
         '''
-        starts receive and respond loop
+        benchmarks the machine, then starts receive and respond loop
         '''
+        # measured once, while the machine isn't busy with chunks yet. 
+        # Clients asking in the meantime are answered right after
+        self.score = _benchmark(BENCHMARK_SECONDS)
         while not self._abort:
-            msg, address = self.sock.recvfrom(NETWORK_CHUNK_SIZE)
-            avaliability = self.calc_avaliability()
+            try:
+                msg, address = self.sock.recvfrom(NETWORK_CHUNK_SIZE)
+            except socket.timeout:
+                # see whether the server was stopped
+                continue
             if msg == 'job':
-                self.sock.sendto(str(avaliability), address)
+                self.sock.sendto(json.dumps(self.report()), address)
         self.sock.close()
 
     def calc_avaliability(self):
         '''
         Function to calculate avaliability of given machine. Change this
         function to customize the metric for your application/network
+
+        By default, this is the number of chunks waiting to be processed
+        minus the number of free workers, so an idle machine with many cores
+        looks more avaliable than an idle machine with few
         :return:
         '''
-        avaliability = self.chunk_queue.qsize()
+        avaliability = self.queued() - self.pool.free_slots()
         return avaliability
         '''
         To use system cpu percentage as a metric swap in the following code:
@@ -418,38 +2755,338 @@ class _Broadcast_Server_Thread(threading.Thread):
         avaliability = 100 - ps.virtual_memory()[2] 
         return avaliability
         '''
+    def report(self):
+        '''
+        Describes how much work this machine can take on, for clients to 
+        decide how many chunks to send it. Besides the avaliability metric
+        it has the number of cores and worker processes, how many of those
+        are free, how many chunks are waiting, the load average and free
+        memory of the machine (None where the platform can't tell), the
+        score of the benchmark it ran when it started (None until it has
+        run) and how many chunks per second it processed lately
+
+        :return: the report, as a dict
+        '''
+        if hasattr(os, 'getloadavg'):
+            load = os.getloadavg()[0]
+        else:
+            load = None
+        try:
+            memory = ps.virtual_memory().available
+        except Exception:
+            memory = None
+        return {'avaliability': self.calc_avaliability(), 
+            'cores': multiprocessing.cpu_count(), 
+            'workers': self.pool.workers, 'free': self.pool.free_slots(),
+            'queued': self.queued(), 'load': load, 
+            'memory': memory, 'score': self.score, 
+            'throughput': self.pool.throughput()}
+
+    def queued(self):
+        '''
+        :return: number of messages waiting for the server to handle them, 
+                 and of chunks waiting for a free worker
+        '''
+        return self.chunk_queue.qsize() + self.pool.waiting()
+
     def stop(self):
         '''
         stop server and nicely close sockets
         '''
         self._abort = True
-#naive implementation: give each chunk to minimum avaliability server, then increment
-#avaliability of that server modify this function to change how chunks are
-#assigned
-def _get_chunk_assignments(avaliable_servers, num_chunks):
-    '''
-    Given a certain number of chunks, assigns each of them to a server
-    based on the number of servers who identified themselves and what
-    each of their avaliabilities are
-
-    :param avaliable_servers: list of tuples with ip address of avaliable
-           servers and each of their avaliability metrics
-    :param num_chunks: number of chunks to assign
-    :return: list of len(num_chunks) in which each index is the ip address
-             of the server to send the given chunk to
-    '''
-    zipped_avaliable_servers = zip(*avaliable_servers)
-
-    # raise an AssertionError if there are no servers avaialable
-    assert(len(zipped_avaliable_servers) != 0)
-    
-    server_list = list(zipped_avaliable_servers[0])
-    avaliability_list = list(zipped_avaliable_servers[1])
-
-    chunk_address_list = list()
-    for i in xrange(0, num_chunks):
-        # grab the server processing the least number of chunks
-        min_available = avaliability_list.index(min(avaliability_list))
-        chunk_address_list.append(server_list[min_available])
-        avaliability_list[min_available] =  avaliability_list[min_available] + 1
-    return chunk_address_list
+
+class _Heartbeat_Thread(threading.Thread):
+    def __init__(self, mult_group_ip, heartbeat_port, broadcast_thread):
+        '''
+        Thread run by server to multicast a heartbeat with its availability
+        report every HEARTBEAT_SECONDS, so clients keep an up to date list of the 
+        servers without asking (see _Membership). When the server stops, it
+        tells clients that it is leaving
+
+        :param mult_group_ip: multicast group ip address to beat on
+        :param heartbeat_port: port clients listen to heartbeats on
+        :param broadcast_thread: the server's _Broadcast_Server_Thread, 
+            which reports its avaliability
+        '''
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.group = (mult_group_ip, heartbeat_port)
+        self.broadcast_thread = broadcast_thread
+        self._stopped = threading.Event()
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        # heartbeats stay on the subnet, like discovery broadcasts
+        self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 
+            struct.pack('b', 1))
+
+    def run(self):
+        '''
+        beats until the server is stopped
+        '''
+        try:
+            while not self._stopped.is_set():
+                self.sock.sendto('beat ' + 
+                    json.dumps(self.broadcast_thread.report()), self.group)
+                self._stopped.wait(HEARTBEAT_SECONDS)
+            self.sock.sendto('leave', self.group)
+        except socket.error:
+            pass
+        finally:
+            self.sock.close()
+
+    def stop(self):
+        '''
+        stop beating and tell clients we left
+        '''
+        self._stopped.set()
+
+class _Metrics_Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    '''
+    Answers GET requests for / or /metrics with a server's metrics as JSON
+    '''
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = json.dumps(self.server.snapshot())
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # servers don't log every request
+        pass
+
+class _Metrics_Server_Thread(threading.Thread):
+    def __init__(self, ip, port, snapshot, sample):
+        '''
+        Thread run by server to answer HTTP requests for its metrics (see
+        metrics.py), and to sample how many chunks it has waiting every
+        METRICS_SAMPLE_SECONDS in between
+
+        :param ip: ip address to listen on
+        :param port: port to listen on, or 0 for any free one
+        :param snapshot: function returning the metrics, as a dict
+        :param sample: function sampling the server's queue
+        '''
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.sample = sample
+        self.httpd = BaseHTTPServer.HTTPServer((ip, port), _Metrics_Handler)
+        self.httpd.snapshot = snapshot
+        # wake up for the next sample even if no request comes in
+        self.httpd.timeout = METRICS_SAMPLE_SECONDS
+        self.port = self.httpd.server_address[1]
+        self._abort = False
+
+    def run(self):
+        '''
+        answers requests until the server is stopped
+        '''
+        sampled = None
+        while not self._abort:
+            now = timeit.default_timer()
+            if sampled is None or now - sampled >= METRICS_SAMPLE_SECONDS:
+                self.sample()
+                sampled = now
+            self.httpd.handle_request()
+        self.httpd.server_close()
+
+    def stop(self):
+        '''
+        stop answering requests
+        '''
+        self._abort = True
+
+class _Scheduler(object):
+    '''
+    Decides which server each chunk of a job goes to: the one expected to
+    finish it first, given the work it already has in flight and how fast
+    it has been getting through the job's chunks. Servers sit in a heap 
+    keyed by that time, so assigning a chunk takes O(log n) for n servers,
+    and faster machines get proportionally more chunks, so that all of them
+    finish together. Change this class to change how chunks are assigned
+    '''
+    def __init__(self, avaliable_servers):
+        '''
+        :param avaliable_servers: list of tuples with ip address of 
+               avaliable servers and each of their avaliability metrics
+               (and round trip times and availability reports), as found
+               by _discover()
+        '''
+        # ip -> chunks the server can process at once
+        self._slots = dict()
+        # ip -> how fast the server runs foo() compared to the others, 
+        # going by the benchmark in its availability report
+        self._speeds = dict()
+        # ip -> chunks the server had waiting before the job started
+        self._backlog = dict()
+        # ip -> {chunk index: elements} of our chunks in flight on it
+        self._in_flight = dict()
+        # ip -> elements per second the server got through, once measured
+        self._rates = dict()
+        # sum over the measured servers of their rate per slot and speed
+        self._slot_rates = 0.0
+        # ip -> version of its entry in the heap, older entries are stale
+        self._versions = dict()
+        self._heap = list()
+        # elements in a typical chunk of the job, which the heap is keyed
+        # by. None until the first chunk is assigned
+        self._chunk = None
+        scores = [_report(server)['score'] for server in avaliable_servers
+            if _report(server) and _report(server).get('score')]
+        for server in avaliable_servers:
+            report = _report(server) or dict()
+            slots = max(-server[1], 1)
+            if report.get('memory') is not None:
+                # a server short on memory gets fewer chunks at once
+                slots = min(slots, max(report['memory'] // MEMORY_PER_SLOT, 1))
+            self._slots[server[0]] = slots
+            if report.get('score') and scores:
+                self._speeds[server[0]] = (report['score'] * len(scores) /
+                    sum(scores))
+            else:
+                self._speeds[server[0]] = 1.0
+            self._backlog[server[0]] = max(server[1], 0)
+            self._in_flight[server[0]] = dict()
+            self._versions[server[0]] = 0
+
+    def __len__(self):
+        return len(self._slots)
+
+    def __contains__(self, server):
+        return server in self._slots
+
+    def _rate(self, server):
+        '''
+        :return: elements per second the server gets through. Until it is
+                 measured, that is what the measured servers achieve per
+                 slot and speed (or 1, if none are) times its slots and 
+                 speed
+        '''
+        rate = self._rates.get(server)
+        if rate is not None:
+            return rate
+        capacity = self._slots[server] * self._speeds[server]
+        if self._rates:
+            return capacity * self._slot_rates / len(self._rates)
+        return capacity
+
+    def _push(self, server):
+        '''
+        (Re)enters a server in the heap, keyed by when it would finish one
+        more chunk
+        '''
+        self._versions[server] += 1
+        work = (sum(self._in_flight[server].itervalues()) + 
+            (self._backlog[server] + 1) * self._chunk)
+        heapq.heappush(self._heap, (work / self._rate(server), 
+            self._versions[server], server))
+
+    def _rebuild(self):
+        '''
+        Rebuilds the heap from scratch, dropping its stale entries
+        '''
+        self._heap = list()
+        for server in self._slots:
+            self._push(server)
+
+    def assign(self, index, elements, exclude = (), idle = False, 
+        prefer = None):
+        '''
+        Picks the server to send a chunk to, and counts the chunk as in 
+        flight on it
+
+        :param index: chunk number
+        :param elements: number of elements in the chunk
+        :param exclude: servers the chunk mustn't go to
+        :param idle: if True, only pick a server with a free slot
+        :param prefer: server to pick whenever it qualifies, however busy it
+            is, such as the one holding the chunk cached
+        :return: ip address of the server, or None if no server qualifies
+        '''
+        if self._chunk is None or not (self._chunk / 2 <= elements <= 
+            self._chunk * 2):
+            # the planner changed chunk sizes
+            self._chunk = max(elements, 1)
+            self._rebuild()
+        skipped = list()
+        server = None
+        if prefer in self._slots and prefer not in exclude and not (idle and
+            len(self._in_flight[prefer]) >= self._slots[prefer]):
+            # its heap entry goes stale, since _push() below bumps its
+            # version
+            server = prefer
+        while server is None and self._heap:
+            _, version, candidate = heapq.heappop(self._heap)
+            if self._versions.get(candidate) != version:
+                continue
+            if candidate in exclude or (idle and 
+                len(self._in_flight[candidate]) >= self._slots[candidate]):
+                skipped.append(candidate)
+                continue
+            server = candidate
+            break
+        for candidate in skipped:
+            self._push(candidate)
+        if server is not None:
+            self._in_flight[server][index] = elements
+            self._push(server)
+        return server
+
+    def finished(self, server, index, seconds = None):
+        '''
+        Records that a chunk in flight on a server came back
+
+        :param server: ip address of the server
+        :param index: chunk number
+        :param seconds: round trip time of the chunk, if it should count 
+            towards the server's measured speed
+        '''
+        if server not in self._slots:
+            return
+        in_flight = self._in_flight[server]
+        if seconds:
+            # by Little's law, the elements in flight on a server over the
+            # time they take to come back is its throughput
+            sample = sum(in_flight.itervalues()) / seconds
+            rate = self._rates.get(server)
+            capacity = self._slots[server] * self._speeds[server]
+            if rate is None:
+                rate = sample
+            else:
+                self._slot_rates -= rate / capacity
+                rate += SCHEDULER_SMOOTHING * (sample - rate)
+            first = server not in self._rates
+            self._rates[server] = rate
+            self._slot_rates += rate / capacity
+            # the measurement already accounts for whatever else the 
+            # server is doing
+            self._backlog[server] = 0
+        else:
+            first = False
+        in_flight.pop(index, None)
+        if self._chunk is None:
+            return
+        if first or len(self._heap) > 2 * len(self._slots) + 8:
+            # the servers not measured yet go by the measured ones
+            self._rebuild()
+        else:
+            self._push(server)
+
+    def remove(self, server):
+        '''
+        Stops assigning chunks to a server (say, because it failed)
+
+        :param server: ip address of the server
+        '''
+        if server not in self._slots:
+            return
+        rate = self._rates.pop(server, None)
+        if rate is not None:
+            self._slot_rates -= rate / (self._slots[server] * 
+                self._speeds[server])
+        for table in (self._slots, self._speeds, self._backlog, 
+            self._in_flight, self._versions):
+            del table[server]
@@ -0,0 +1,167 @@
+'''
+This file defines the Metrics class, which counts what a server has been
+doing since it started: chunks processed and failed per operation, how
+long chunks waited for a worker, took to unpickle, to run and to pickle
+their results in and how long sending those back took, the bytes that came
+in and went out, chunks the server had to ask clients to resend with their
+function or data, and how many chunks were waiting over time.
+
+Servers answer HTTP requests for their metrics with JSON (see
+helpers._Metrics_Server_Thread), along with the hit rates of their caches
+and their availability report, so overloaded servers stand out and the
+numbers of a fleet can be added up.
+'''
+
+import time # stamps queue samples with the time of day
+import threading # the server loop, the pool and the endpoint all count
+import collections # keeps the latest queue samples
+
+#:upper bounds in seconds of the buckets latencies are counted in. A last
+#:bucket counts the latencies above all of them
+LATENCY_BUCKETS = (0.0001, 0.001, 0.01, 0.1, 1, 10)
+#:phases of a chunk on a server whose latencies are counted: waiting for a
+#:worker, unpickling the chunk, running foo(), pickling the result and
+#:sending it back
+PHASES = ('queue', 'loading', 'compute', 'dumping', 'sending')
+
+class Histogram(object):
+    '''
+    Counts values into buckets, keeping their count, sum and largest value
+
+    bounds: upper bound of every bucket but the last, in order
+    counts: number of values in each bucket, the last of which counts the
+        values above every bound
+    '''
+    def __init__(self, bounds = LATENCY_BUCKETS):
+        '''
+        :param bounds: upper bounds of the buckets, in order
+        '''
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = None
+
+    def observe(self, value):
+        '''
+        :param value: the value to count
+        '''
+        bucket = 0
+        while bucket < len(self.bounds) and value > self.bounds[bucket]:
+            bucket += 1
+        self.counts[bucket] += 1
+        self.count += 1
+        self.total += value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def summary(self):
+        '''
+        :return: the histogram as a dict of plain values
+        '''
+        return {'count': self.count, 'sum': self.total, 'max': self.max,
+            'mean': self.total / self.count if self.count else None,
+            'bounds': list(self.bounds), 'counts': list(self.counts)}
+
+class Metrics(object):
+    '''
+    Counters and histograms of a server, updated as chunks come and go
+
+    started: time of day the server started
+    received: operation -> number of chunks handed to a worker
+    completed: operation -> number of chunks processed
+    failed: operation -> number of chunks foo() raised an error on
+    bytes_in: bytes of every message received, after decompression
+    bytes_out: bytes of every result sent, before compression
+    missing: number of chunks sent back to their client, because we were
+        missing their 'function' or their 'data'
+    latencies: phase (see PHASES) -> Histogram of the seconds chunks spent
+        in it
+    queue: the latest (time of day, chunks waiting, chunks being processed)
+        samples, at most `samples` of them
+    '''
+    def __init__(self, samples = 300):
+        '''
+        :param samples: number of queue samples to keep
+        '''
+        self.started = time.time()
+        self.received = collections.defaultdict(int)
+        self.completed = collections.defaultdict(int)
+        self.failed = collections.defaultdict(int)
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.missing = {'function': 0, 'data': 0}
+        self.latencies = dict((phase, Histogram()) for phase in PHASES)
+        self.queue = collections.deque(maxlen = samples)
+        self._lock = threading.Lock()
+
+    def message(self, nbytes):
+        '''
+        :param nbytes: bytes of a message that arrived
+        '''
+        with self._lock:
+            self.bytes_in += nbytes
+
+    def chunk(self, op):
+        '''
+        :param op: operation of a chunk handed to a worker
+        '''
+        with self._lock:
+            self.received[op] += 1
+
+    def resend(self, what):
+        '''
+        :param what: 'function' or 'data', whichever a chunk was missing
+        '''
+        with self._lock:
+            self.missing[what] += 1
+
+    def finished(self, op, timing, nbytes, sending):
+        '''
+        Counts a chunk that was processed and sent back
+
+        :param op: operation of the chunk
+        :param timing: dict of the seconds the chunk spent in each phase
+                       on the worker, or None if foo() raised an error
+        :param nbytes: bytes of the result sent back
+        :param sending: seconds sending the result took
+        '''
+        with self._lock:
+            self.bytes_out += nbytes
+            self.latencies['sending'].observe(sending)
+            if timing is None:
+                self.failed[op] += 1
+                return
+            self.completed[op] += 1
+            for phase, seconds in timing.items():
+                self.latencies[phase].observe(seconds)
+
+    def sample(self, waiting, busy):
+        '''
+        :param waiting: number of chunks waiting for a worker
+        :param busy: number of chunks being processed
+        '''
+        with self._lock:
+            self.queue.append((time.time(), waiting, busy))
+
+    def summary(self):
+        '''
+        :return: the metrics as a dict of plain values (which json.dumps()
+                 takes), with the queue samples' latest and largest values
+        '''
+        with self._lock:
+            queue = list(self.queue)
+            return {'started': self.started,
+                'uptime': time.time() - self.started,
+                'received': dict(self.received),
+                'completed': dict(self.completed),
+                'failed': dict(self.failed),
+                'bytes_in': self.bytes_in, 'bytes_out': self.bytes_out,
+                'missing': dict(self.missing),
+                'latencies': dict((phase, histogram.summary())
+                    for phase, histogram in self.latencies.items()),
+                'queue': {'waiting': queue[-1][1] if queue else None,
+                    'busy': queue[-1][2] if queue else None,
+                    'max_waiting': max(waiting for _, waiting, _ in queue)
+                        if queue else None,
+                    'samples': [list(sample) for sample in queue]}}
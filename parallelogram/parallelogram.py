@@ -1,6 +1,8 @@
 ''' 
 This file contains our library's implementations of p_map(), p_filter(), and 
-p_reduce().
+p_reduce(), of their lazy versions p_imap() and p_ifilter(), and of their
+asynchronous versions p_map_async(), p_filter_async() and p_reduce_async().
+p_cache() keeps data on the servers for jobs that run over it repeatedly.
 
 We use the letter "p" because it indicates that the method is parallelized
 and because doing so ensures that our functions are properly namespaced
@@ -12,32 +14,34 @@ If your code crashes
 '''
 
 import Queue # allows machines to hold multiple chunks at one
-import socket # allows for communication between machines
+import copy # so local jobs over cached data don't change it
+import random # to tag each job with an id
+import timeit # times chunk round trips
 import helpers # exposes our helper methods
+import planner # decides whether and how to distribute a job
+import future # stands for the results of jobs running in the background
+import cache # stands for data cached on the servers
+import files # stands for files jobs run over
+import sinks # writes results to disk as they arrive
 import threading # allows us to have multiple threads on clients/servers
+import itertools # cuts chunks off iterators
+import collections # holds the chunks waiting to be resent
+import multiprocessing # counts the cores local jobs can run on
 
 # somtimes Python can't find the actual variables inside of config,
 # so it's safer to just assign variables this way
 import config
-MULTICAST_PORT = config.MULTICAST_PORT
-MULTICAST_GROUP_IP = config.MULTICAST_GROUP_IP
+CHUNKS_IN_FLIGHT_PER_SERVER = config.CHUNKS_IN_FLIGHT_PER_SERVER
+LOCAL_WORKERS = config.LOCAL_WORKERS
+PLAN_SAMPLE_SIZE = config.PLAN_SAMPLE_SIZE
+SPECULATION_FACTOR = config.SPECULATION_FACTOR
 
-'''
-Our minimum chunk size in terms of number of elements. When asked to map(),
-filter(), or reduce() a presumably large list, we chunk it in pieces of
-CHUNK_SIZE and send those chunks to other physical machines on the network.
-
-If the list on which to apply a function foo() is smaller than CHUNK_SIZE,
-it makes more sense to have the calling machine process the chunk instead
-of sending it over the wire.
-'''
-CHUNK_SIZE = 6
+#:the backends a job can be asked to run on
+BACKENDS = ('auto', 'local', 'distributed')
 
-# IP_ADDRESS = 'localhost' #run sockets on localhost
-# gets ip address of machine on network
-IP_ADDRESS = socket.gethostbyname(socket.gethostname())
-
-def p_map(foo, data, port, timeout):
+def p_map(foo, data, port, timeout, explain = False, backend = 'auto',
+    batch = False, compression = 'auto', out = None, stats = False,
+    profile = False):
     '''
     Map a function foo() over chunks of data (of type list) and
     join the mapped chunks before returning back to the caller.
@@ -51,16 +55,42 @@ def p_map(foo, data, port, timeout):
     :param port: a port by which to send over distributed operations
     :param timeout: timeout, in seconds, that function should wait
                     for chunks to be returned
-    :return: the mapped results
+    :param explain: if True, return a (result, plan) tuple instead, where 
+                    plan is the planner.Plan the job was run with
+    :param backend: 'auto' to distribute the job if that is worth it, 
+                    'local' to run it on the cores of this machine only, 
+                    or 'distributed' to send it to the servers whenever
+                    there are any
+    :param batch: if True, foo(chunk, indices) is called once per chunk
+                  with a slice of data and the xrange of its indices in 
+                  data, and returns the mapped slice. NumPy arrays stay
+                  arrays all the way through
+    :param compression: 'auto' to compress chunks and results sent over 
+                        the network when that gets them across sooner, 
+                        None to never compress them, or the name of a codec
+                        ('zlib', 'bz2', or 'lzma' where available) to 
+                        compress them with whenever that makes them smaller
+    :param out: where to write the mapped results as they arrive instead 
+                of returning them: the path of a .npy file or of a text 
+                file (one element per line), a sinks.Sink, or a function 
+                to give every mapped chunk to, in order
+    :param stats: if True, also return the timing.JobStats of the job, 
+                  which break down where its time went, after the result
+                  (and the plan)
+    :param profile: if True, profile foo() with cProfile on every chunk, 
+                    wherever it runs, and also return the merged profile 
+                    (a timing.Profile, which is a pstats.Stats) last
+    :return: the mapped results, or the number of them written to out
     '''
-    try:
-        result = p_func(foo, data, port, 'map', timeout)
-        return helpers._flatten(result)
-    except RuntimeError:
-        # if no servers are available, run the job yourself
-        return helpers._single_map(foo, data)
+    plan = planner.Plan(foo, data, 'map', batch, compression = compression,
+        profile = profile)
+    result = _gather(foo, data, port, 'map', timeout, plan, backend, batch, 
+        out)
+    return _answer(result, plan, explain, stats, profile)
 
-def p_filter(foo, data, port, timeout):
+def p_filter(foo, data, port, timeout, explain = False, backend = 'auto',
+    batch = False, compression = 'auto', out = None, stats = False,
+    profile = False):
     '''
     Filter a function foo() over chunks of data (of type list) and
     join the filtered chunks before returning back to the caller.
@@ -72,16 +102,35 @@ def p_filter(foo, data, port, timeout):
 	:param foo: function to filter over data
     :param data: a list of data to be filtered
     :param port: a port by which to send over distributed operations
-    :return: the filtered results
+    :param explain: if True, return a (result, plan) tuple instead, where 
+                    plan is the planner.Plan the job was run with
+    :param backend: 'auto' to distribute the job if that is worth it, 
+                    'local' to run it on the cores of this machine only, 
+                    or 'distributed' to send it to the servers whenever
+                    there are any
+    :param batch: if True, foo(chunk, indices) is called once per chunk
+                  with a slice of data and the xrange of its indices in 
+                  data, and returns a mask (such as a boolean NumPy array)
+                  of the elements to keep
+    :param compression: whether to compress what is sent over the network
+                        (see p_map())
+    :param out: where to write the kept elements as they arrive instead of
+                returning them (see p_map())
+    :param stats: if True, also return the timing.JobStats of the job (see
+                  p_map())
+    :param profile: if True, also return the profile of foo() over the job
+                    (see p_map())
+    :return: the filtered results, or the number of them written to out
 	'''
-    try:
-        result = p_func(foo, data, port, 'filter', timeout)
-        return helpers._flatten(result)
-    except RuntimeError:
-        # if no servers are available, run the job yourself
-        return helpers._single_filter(foo, data)
+    plan = planner.Plan(foo, data, 'filter', batch, 
+        compression = compression, profile = profile)
+    result = _gather(foo, data, port, 'filter', timeout, plan, backend, batch,
+        out)
+    return _answer(result, plan, explain, stats, profile)
 
-def p_reduce(foo, data, port, timeout):
+def p_reduce(foo, data, port, timeout, explain = False, associative = False,
+    commutative = False, backend = 'auto', compression = 'auto', 
+    stats = False, profile = False):
     '''
     Reduce a function foo() over chunks of data (of type list) and
 	then reduce the results before returning back to the caller.
@@ -93,107 +142,786 @@ def p_reduce(foo, data, port, timeout):
 	After the intial chunks have been reduced, we still need to reduce
 	the results of the initial reduction, so we call our function again
 	and either redistribute the initial results or simply locally-process
-	chunks, depending on the size of the initial results array.
+	chunks, depending on what the planner makes of the initial results.
+
+    If foo() is declared associative, the servers instead keep the reduced
+    chunks and combine them among themselves in a tree, so the whole job
+    takes a single round and the client gets a single value back.
 
     :param foo: function to reduce over data
     :param data: a list of data to be reduced
     :param port: a port by which to send over distributed operations
     :param timeout: timeout, in seconds, that function should wait for
                     chunks to be returned
+    :param explain: if True, return a (result, plan) tuple instead, where 
+                    plan is the planner.Plan the first round was run with
+    :param associative: whether foo(foo(a, b), c) == foo(a, foo(b, c)),
+                        which lets servers combine the reduced chunks
+    :param commutative: whether foo(a, b) == foo(b, a), which lets servers
+                        combine reduced chunks in any order (only used if
+                        foo() is associative too)
+    :param backend: 'auto' to distribute the job if that is worth it, 
+                    'local' to run it on the cores of this machine only, 
+                    or 'distributed' to send it to the servers whenever
+                    there are any
+    :param compression: whether to compress what is sent over the network
+                        (see p_map())
+    :param stats: if True, also return the timing.JobStats of the first 
+                  round (see p_map())
+    :param profile: if True, also return the profile of foo() over the 
+                    chunks of the first round (see p_map())
     :return: the reduced result (a single value!)
     '''
     # ensure that data is present
     assert(len(data) > 0)
 
+    plan = planner.Plan(foo, data, 'reduce', compression = compression,
+        profile = profile)
+    result = _reduce(foo, data, port, timeout, plan, backend, associative,
+        commutative)
+    return _answer(result, plan, explain, stats, profile)
+
+def _answer(result, plan, explain, stats, profile):
+    '''
+    :param explain: whether the caller asked for the plan of the job
+    :param stats: whether the caller asked for the stats of the job
+    :param profile: whether the caller asked for the profile of the job
+    :return: what p_map(), p_filter() and p_reduce() return: the result,
+             followed by the plan, its stats and its profile if they were
+             asked for
+    '''
+    if not (explain or stats or profile):
+        return result
+    answer = (result,)
+    if explain:
+        answer += (plan,)
+    if stats:
+        answer += (plan.stats,)
+    if profile:
+        answer += (plan.profile,)
+    return answer
+
+def _gather(foo, data, port, op, timeout, plan, backend, batch, out):
+    '''
+    Runs a map or a filter, and joins its processed chunks or writes them 
+    to out as they arrive
+
+    :param out: where to write the processed chunks (see p_map()), or None
+    :return: the joined chunks, or the number of elements written to out
+    '''
+    if out is None:
+        return helpers._join(_run(foo, data, port, op, timeout, plan, 
+            backend, batch = batch))
+    sink = sinks._sink(out)
+    # a map gives back as many elements as it is given, so each chunk's
+    # place in the output is known before it arrives. Lines of text files
+    # are only counted roughly, though
+    rows = None
+    if op == 'map' and not isinstance(data, files.Lines):
+        rows = len(data)
+    sink.start(rows)
     try:
-        result = p_func(foo, data, port, 'reduce', timeout)
+        _run(foo, data, port, op, timeout, plan, backend, batch = batch,
+            sink = sink)
+    finally:
+        sink.close()
+    return sink.written
+
+def _reduce(foo, data, port, timeout, plan, backend, associative, 
+    commutative):
+    '''
+    Runs a reduction planned by p_reduce()
 
-        # checks if single value is returned, which means reduce is done.
-        # this case will only occur when our initial data is <= than CHUNK_SIZE
-        if (len(result) == 1):
-            return result[0]
+    :return: the reduced result
+    '''
+    result = _run(foo, data, port, 'reduce', timeout, plan, backend, 
+        associative, commutative)
+
+    # checks if single value is returned, which means reduce is done.
+    # otherwise, reduce the partial results of the chunks. Those of a
+    # distributed job are planned again, and may well be reduced locally
+    if (len(result) == 1):
+        return result[0]
+    elif plan.backend == 'distributed':
+        return p_reduce(foo, result, port, timeout, 
+            associative = associative, commutative = commutative,
+            backend = backend, compression = plan.compression)
+    return helpers._single_reduce(foo, result)
+
+def p_cache(data, port, timeout):
+    '''
+    Caches data (of type list) on the servers, for jobs that run over the 
+    same data again and again, like the steps of an iterative algorithm. 
+    The data is cut into chunks once, and each chunk is kept by the server
+    it is sent to. Jobs given the returned handle in place of the data send
+    every chunk to the server holding it, and only the function and the 
+    chunk's key go over the network.
+
+    Servers keep cached chunks in memory until DATASET_CACHE_BYTES are
+    full, and then spill the least recently used ones to DATASET_SPILL_DIR
+    (or drop them, if it is None). A chunk its server no longer has, or 
+    whose server is gone, is sent along with its job and cached again.
+
+    :param data: a list (or NumPy array) of data to cache
+    :param port: a port by which to send over distributed operations
+    :param timeout: timeout, in seconds, to wait for the servers to 
+                    confirm they cached a chunk
+    :return: a cache.Handle to pass to the p_ functions in place of data
+    '''
+    plan = planner.Plan(lambda elt, index: elt, data, 'map')
+    servers = list()
+    if plan.picklable and len(data) > 0:
+        _discover(plan, servers)
+    if servers:
+        plan.use_servers(servers)
+    else:
+        # the chunks of jobs over the data will be run locally instead
+        plan.use_local_pool(_local_workers(), True)
+    size = plan.cache_chunk_size()
+    sizes = [min(size, len(data) - start) 
+        for start in xrange(0, len(data), size)]
+    handle = cache.Handle(data, random.getrandbits(32), sizes, 
+        [None] * len(sizes), port)
+    if not servers:
+        return handle
+
+    # spread the chunks like a job would, and wait for every server to 
+    # confirm. Chunks that don't make it are cached by the first job
+    scheduler = helpers._Scheduler(servers)
+    stored = Queue.Queue()
+    start = 0
+    for index, size in enumerate(sizes):
+        helpers._store_chunk(stored, handle.dataset_id, index, 
+            data[start:start + size], scheduler.assign(index, size), port,
+            timeout)
+        start += size
+    for _ in sizes:
+        index, server, succeeded = stored.get()
+        if succeeded:
+            handle.owners[index] = server
+    return handle
+
+def p_map_async(foo, data, port, timeout, job_timeout = None, 
+    backend = 'auto', batch = False, compression = 'auto', out = None,
+    profile = False):
+    '''
+    Starts mapping foo() over data like p_map() does, but in the background
+
+    Jobs started close together share server discovery, and all jobs share
+    connections to the servers, so many jobs can be kept going at once.
+
+    The future's plan attribute is the job's planner.Plan once it is 
+    planned, so there is no explain argument. Nor is there a stats one: 
+    the plan's stats attribute always holds the job's timing.JobStats.
+
+    :param foo: function to map over data
+    :param data: a list of data to be mapped over
+    :param port: a port by which to send over distributed operations
+    :param timeout: timeout, in seconds, that function should wait
+                    for chunks to be returned
+    :param job_timeout: seconds the whole job may take, after which it is
+                        stopped and its future raises future.TimeoutError
+    :param backend: 'auto', 'local' or 'distributed' (see p_map())
+    :param batch: whether foo() takes whole chunks at once (see p_map())
+    :param compression: whether to compress what is sent over the network
+                        (see p_map())
+    :param out: where to write the mapped results (see p_map())
+    :param profile: if True, profile foo() on every chunk (see p_map()). 
+                    The profile is the plan's profile attribute
+    :return: a future.Future of the mapped results, or of the number of
+             them written to out
+    '''
+    def _job(job):
+        plan = planner.Plan(foo, data, 'map', batch, 
+            compression = compression, profile = profile)
+        if job._start(plan):
+            return _gather(foo, data, port, 'map', timeout, plan, backend, 
+                batch, out)
+    return _submit(_job, job_timeout)
+
+def p_filter_async(foo, data, port, timeout, job_timeout = None, 
+    backend = 'auto', batch = False, compression = 'auto', out = None,
+    profile = False):
+    '''
+    Starts filtering data like p_filter() does, but in the background (see
+    p_map_async())
+
+    :param foo: function to filter over data
+    :param data: a list of data to be filtered
+    :param port: a port by which to send over distributed operations
+    :param timeout: timeout, in seconds, that function should wait
+                    for chunks to be returned
+    :param job_timeout: seconds the whole job may take
+    :param backend: 'auto', 'local' or 'distributed' (see p_map())
+    :param batch: whether foo() takes whole chunks at once (see p_filter())
+    :param compression: whether to compress what is sent over the network
+                        (see p_map())
+    :param out: where to write the kept elements (see p_map())
+    :param profile: whether to profile foo() (see p_map_async())
+    :return: a future.Future of the filtered results, or of the number of
+             them written to out
+    '''
+    def _job(job):
+        plan = planner.Plan(foo, data, 'filter', batch, 
+            compression = compression, profile = profile)
+        if job._start(plan):
+            return _gather(foo, data, port, 'filter', timeout, plan, backend,
+                batch, out)
+    return _submit(_job, job_timeout)
+
+def p_reduce_async(foo, data, port, timeout, job_timeout = None, 
+    associative = False, commutative = False, backend = 'auto', 
+    compression = 'auto', profile = False):
+    '''
+    Starts reducing data like p_reduce() does, but in the background (see
+    p_map_async())
+
+    :param foo: function to reduce over data
+    :param data: a list of data to be reduced
+    :param port: a port by which to send over distributed operations
+    :param timeout: timeout, in seconds, that function should wait
+                    for chunks to be returned
+    :param job_timeout: seconds the whole job may take
+    :param associative: whether foo() is associative (see p_reduce())
+    :param commutative: whether foo() is commutative (see p_reduce())
+    :param backend: 'auto', 'local' or 'distributed' (see p_map())
+    :param compression: whether to compress what is sent over the network
+                        (see p_map())
+    :param profile: whether to profile foo() over the chunks of the first
+                    round (see p_map_async())
+    :return: a future.Future of the reduced result
+    '''
+    # ensure that data is present
+    assert(len(data) > 0)
+
+    def _job(job):
+        plan = planner.Plan(foo, data, 'reduce', compression = compression,
+            profile = profile)
+        if job._start(plan):
+            return _reduce(foo, data, port, timeout, plan, backend, 
+                associative, commutative)
+    return _submit(_job, job_timeout)
+
+def _submit(job, job_timeout):
+    '''
+    Runs a job in a thread of its own
+
+    :param job: function running the job, which gets the job's future
+    :param job_timeout: seconds the job may take, or None for no limit
+    :return: the future.Future of the job
+    '''
+    job_future = future.Future()
+
+    def _run_job():
+        '''
+        runs the job and reports how it went to its future
+        '''
+        try:
+            result = job(job_future)
+        except Exception:
+            job_future._set_exception()
         else:
-            # if we have less than CHUNK_SIZE elements, just locally compute.
-            # otherwise, call a new round of distributed reduction!
-            if (len(result) <= CHUNK_SIZE):
-                return helpers._single_reduce(foo, result)
-            else:
-                return p_reduce(foo, result, port, timeout)
-    except RuntimeError:
-        # if no servers are available, run the job yourself
-        return helpers._single_reduce(foo, data)
+            job_future._set_result(result)
+
+    thread = threading.Thread(target = _run_job)
+    thread.daemon = True
+    thread.start()
+    if job_timeout is not None:
+        timer = threading.Timer(job_timeout, job_future._expire)
+        timer.daemon = True
+        timer.start()
+        job_future.add_done_callback(lambda done_future: timer.cancel())
+    return job_future
 
-def p_func(foo, data, port, op, timeout):
+def p_imap(foo, data, port, timeout, window = None, ordered = True,
+    backend = 'auto', batch = False, compression = 'auto'):
+    '''
+    Map a function foo() over data like p_map(), but lazily: data can be any
+    iterable, chunks are cut off its front as they are needed, and mapped
+    elements are yielded as soon as their chunk is done. At most `window` 
+    chunks are held at a time, so data doesn't have to fit in memory.
+
+    If data has no length, the job can't be planned as a whole. It is 
+    planned on its first few elements and assumed to be long.
+
+    :param foo: function to map over data
+    :param data: an iterable of data to be mapped over
+    :param port: a port by which to send over distributed operations
+    :param timeout: timeout, in seconds, that function should wait
+                    for chunks to be returned
+    :param window: the most chunks in flight (or done, but waiting on an 
+                   earlier chunk) at once. By default, enough to keep every
+                   worker busy
+    :param ordered: if False, elements are yielded as their chunk is done 
+                    rather than in the order of data (foo() gets every
+                    element's index, so it can return it along with the 
+                    mapped element)
+    :param backend: 'auto' to distribute the job if that is worth it, 
+                    'local' to run it on the cores of this machine only, 
+                    or 'distributed' to send it to the servers whenever
+                    there are any
+    :param batch: whether foo() takes whole chunks at once (see p_map())
+    :param compression: whether to compress what is sent over the network
+                        (see p_map())
+    :return: generator of the mapped elements
+    '''
+    for chunk in _stream(foo, data, port, 'map', timeout, window, ordered, 
+        backend, batch, compression):
+        for elt in chunk:
+            yield elt
+
+def p_ifilter(foo, data, port, timeout, window = None, ordered = True,
+    backend = 'auto', batch = False, compression = 'auto'):
+    '''
+    Filter data like p_filter(), but lazily (see p_imap())
+
+    :param foo: function to filter over data
+    :param data: an iterable of data to be filtered
+    :param port: a port by which to send over distributed operations
+    :param timeout: timeout, in seconds, that function should wait
+                    for chunks to be returned
+    :param window: the most chunks held at once (see p_imap())
+    :param ordered: if False, elements are yielded as their chunk is done
+    :param backend: 'auto' to distribute the job if that is worth it, 
+                    'local' to run it on the cores of this machine only, 
+                    or 'distributed' to send it to the servers whenever
+                    there are any
+    :param batch: whether foo() takes whole chunks at once (see p_filter())
+    :param compression: whether to compress what is sent over the network
+                        (see p_map())
+    :return: generator of the elements foo() keeps
+    '''
+    for chunk in _stream(foo, data, port, 'filter', timeout, window, ordered,
+        backend, batch, compression):
+        for elt in chunk:
+            yield elt
+
+def _stream(foo, data, port, op, timeout, window, ordered, backend, batch,
+    compression = 'auto'):
+    '''
+    Runs a job over an iterable on the backend it was asked to run on (see
+    p_imap())
+
+    :return: generator of the processed chunks
+    '''
+    if backend not in BACKENDS:
+        raise ValueError("The backend %r does not exist." % backend)
+    if helpers._sliceable(data):
+        plan = planner.Plan(foo, data, op, batch, compression = compression)
+    else:
+        # plan on the first few elements, without losing them
+        data = iter(data)
+        head = list(itertools.islice(data, PLAN_SAMPLE_SIZE))
+        plan = planner.Plan(foo, head, op, batch, 
+            stream = len(head) == PLAN_SAMPLE_SIZE, compression = compression)
+        data = itertools.chain(head, data)
+    servers = list()
+    force = backend == 'distributed' and plan.picklable
+    if force or (backend == 'auto' and plan.worth_discovering()):
+        _discover(plan, servers)
+        plan.use_servers(servers, force)
+    if not plan.distribute and not plan.use_local_pool(_local_workers(), 
+        backend == 'local'):
+        plan.backend = 'single'
+    for _, _, _, chunk in _run_chunks(foo, _chunker(data), port, op,
+        timeout, plan, servers, window, ordered, batch = batch):
+        yield chunk
+    plan.stats.finish()
+
+def _discover(plan, servers, fresh = False):
+    '''
+    Finds the servers for a job (see helpers._discover()), timing it in the
+    job's stats
+
+    :param plan: the planner.Plan of the job
+    :param servers: empty list to add the servers to
+    :param fresh: if True, ask the network even if servers were found
+                  recently
+    '''
+    started = timeit.default_timer()
+    helpers._discover(servers, fresh = fresh)
+    plan.stats.add('discovery', timeit.default_timer() - started)
+
+def _chunker(data):
+    '''
+    :param data: a job's data, a cache.Handle of data cached on the 
+                 servers or a files.Source
+    :return: helpers._Chunker cutting the job's chunks off data
+    '''
+    if isinstance(data, (cache.Handle, files.Source)):
+        return data.chunker()
+    return helpers._Chunker(data)
+
+def _local_workers():
+    '''
+    :return: number of worker processes jobs run in locally
+    '''
+    return LOCAL_WORKERS or multiprocessing.cpu_count()
+
+def _run(foo, data, port, op, timeout, plan, backend, associative = False,
+    commutative = False, batch = False, sink = None):
+    '''
+    Runs a job on the backend it was asked to run on. Automatically run jobs
+    go to the servers if the plan finds that worth it and otherwise run on
+    this machine
+
+    :param backend: 'auto', 'local' or 'distributed' (see p_map())
+    :param batch: whether foo() takes whole chunks at once (see p_map())
+    :param sink: sinks.Sink to write the processed chunks to as they arrive,
+                 or None
+    :return: list of the processed chunks, in order, or None if they were
+             written to sink
+    '''
+    if backend not in BACKENDS:
+        raise ValueError("The backend %r does not exist." % backend)
+    try:
+        return _run_on(foo, data, port, op, timeout, plan, backend, 
+            associative, commutative, batch, sink)
+    finally:
+        plan.stats.finish()
+
+def _run_on(foo, data, port, op, timeout, plan, backend, associative, 
+    commutative, batch, sink):
+    '''
+    Runs a job for _run(), which sees to its stats
+    '''
+    if backend != 'local':
+        try:
+            return p_func(foo, data, port, op, timeout, plan, associative, 
+                commutative, batch, sink, backend == 'distributed')
+        except RuntimeError:
+            # if no servers are available (or they wouldn't be any faster),
+            # run the job yourself, unless part of it is written already
+            if sink is not None and sink.written:
+                raise
+    if not plan.use_local_pool(_local_workers(), backend == 'local'):
+        plan.backend = 'single'
+        if isinstance(data, cache.Handle):
+            data = copy.copy(data.data)
+        elif isinstance(data, files.Source):
+            data = data.whole()
+        started = timeit.default_timer()
+        result = [_run_here(plan, op, foo, data, 0, batch)]
+        plan.stats.chunk(None, len(data), timeit.default_timer() - started)
+        if sink is None:
+            return result
+        return _write(sink, [(0, 0, None, result[0])])
+    chunks = _run_chunks(foo, _chunker(data), port, op, timeout, plan, None,
+        ordered = sink is not None and sink.ordered, batch = batch)
+    if sink is not None:
+        return _write(sink, chunks)
+    result = list()
+    for index, _, _, chunk in chunks:
+        result.extend([None] * (index + 1 - len(result)))
+        result[index] = chunk
+    return result
+
+def _run_here(plan, op, foo, chunk, start, batch):
+    '''
+    Runs a chunk in this process (see helpers._run_op()), profiling it if
+    the job is profiled
+
+    :param plan: the planner.Plan of the job
+    :return: the processed chunk
+    '''
+    if plan.profile is None:
+        return helpers._run_op(op, foo, chunk, start, batch)
+    processed_chunk, profile = helpers._profile_op(op, foo, chunk, start, 
+        batch)
+    plan.profile.merge(profile)
+    return processed_chunk
+
+def _write(sink, chunks):
+    '''
+    Writes processed chunks to a sink as they arrive, holding none of them
+
+    :param sink: the sinks.Sink to write to
+    :param chunks: iterable of (chunk index, start, server, processed chunk)
+                   tuples (see _run_chunks()), in order if the sink needs
+                   them to be
+    '''
+    for _, start, _, chunk in chunks:
+        sink.write(start, chunk)
+
+def p_func(foo, data, port, op, timeout, plan, associative = False,
+    commutative = False, batch = False, sink = None, force = False):
     '''
     Performs network operations for parallel map, filter, and reduce functions
 
+    Chunks are cut lazily off the front of data, sized by the plan, which
+    learns from every chunk that completes (see _run_chunks()).
+
     :param foo: function to reduce over data
     :param data: a list of data to be reduced
     :param port: a port by which to send over distributed operations
     :param op: operation to perform, can be 'map', 'reduce', or 'filter
     :param timeout: timeout, in seconds, that function should wait
                     for chunks to be returned
-    :return:
+    :param plan: the planner.Plan of the job
+    :param associative: for reductions, whether the servers should combine
+                        the reduced chunks themselves (see p_reduce())
+    :param commutative: for reductions, whether foo() is commutative
+    :param batch: whether foo() takes whole chunks at once
+    :param sink: sinks.Sink to write the processed chunks to as they arrive,
+                 or None
+    :param force: if True, distribute the job whenever there are servers,
+                  even if running it locally looks faster
+    :return: list of the processed chunks, in order, or None if they were
+             written to sink. Raises a RuntimeError if the job should be run
+             locally instead
     '''
+    # don't wait on discovery if the job would be done before it is
+    if not (force and plan.picklable) and not plan.worth_discovering():
+        raise RuntimeError(plan.reason)
+
     # get list of avaliable servers to send to
     # can block since we need list of machines to continue, don't need to thread
     available_servers = list()
-    helpers._broadcast_client_thread(MULTICAST_GROUP_IP,
-        MULTICAST_PORT, available_servers)
+    _discover(plan, available_servers)
+    plan.use_servers(available_servers, force)
+    if not plan.distribute:
+        raise RuntimeError(plan.reason)
+
+    # tags every message of this job, so results of other jobs are never
+    # mistaken for ours
+    job_id = random.getrandbits(32)
+    # pickled once for the whole job rather than once per chunk
+    func = helpers._pickle_func(foo)
+    # whether servers keep reduced chunks to combine them in a tree
+    keep = op == 'reduce' and associative
+    chunks = _run_chunks(foo, _chunker(data), port, op, timeout, plan,
+        available_servers, ordered = sink is not None and sink.ordered, 
+        keep = keep, batch = batch, job_id = job_id, func = func)
+    if sink is not None:
+        return _write(sink, chunks)
+    # placeholder for data to be read into
+    result = list()
+    # ip of the server that processed each chunk
+    owners = list()
+    for index, _, server, chunk in chunks:
+        result.extend([None] * (index + 1 - len(result)))
+        owners.extend([None] * (index + 1 - len(owners)))
+        result[index] = chunk
+        owners[index] = server
+    if keep:
+        # the reduced chunks are still on the servers
+        return helpers._collect_tree(func, job_id, owners, port, timeout,
+            commutative)
+    return result
 
-    # chunk the data so it can be sent out in pieces
-    chunks = helpers._chunk_list(data, CHUNK_SIZE)
+def _run_chunks(foo, chunker, port, op, timeout, plan, servers, window = None,
+    ordered = True, keep = False, batch = False, job_id = None, func = None):
+    '''
+    Runs a job chunk by chunk, where plan.backend says: on the given servers,
+    in the local worker pool or in this process. Only `window` chunks are
+    cut ahead of the chunks that are done (and, if ordered, yielded).
 
-    try:
-        #list of length len(chunks) with the address to send each chunk to
-        chunk_assignments = helpers._get_chunk_assignments(available_servers,
-            len(chunks))
-    except AssertionError:
-        raise RuntimeError("There aren't any available servers on the network!")
+    A chunk that fails or times out on a server is resent to another 
+    server, and the server that failed gets no more chunks. Once enough 
+    chunks have completed, how long a chunk may take follows their round 
+    trip times (see planner.Plan.chunk_timeout) rather than `timeout`. If no
+    servers are left (and no new ones answer), the rest of the job runs on
+    this machine. Once all chunks are sent out, chunks taking much longer
+    than the others are copied onto idle servers, and the first copy to
+    finish wins, so one slow server doesn't hold up the whole job. Tree
+    reductions don't do that, since a server keeps the chunks it reduced.
+    A chunk foo() raised an error on is run again in this process, which
+    raises the error for the caller to see, unless it only happened 
+    because of something missing on the server (which plan.stats counts as
+    a rerun). The local worker pool runs the same code as this process, so
+    a chunk that fails there but not here raises a RuntimeError.
 
-    # placeholder for data to be read into
-    result = [None] * len(chunks)
-    # list of threads corresponding to sent chunks
-    compute_threads = [None] * len(chunks)
-    #iterate while some chunks are still None, and thus have not been completed
-    while None in result:
-        for index, chunk in enumerate(chunks):
-            #don't resend completed chunks, move on to next result element
-            if result[index] != None:
-                continue
-            # spawns separate thread to distribute each chunk and collect results
-            compute_threads[index] = threading.Thread(
-                target = helpers._send_op,
-                args = (result, foo, chunk, op, index,
-                    chunk_assignments[index], IP_ADDRESS, port, timeout))
-            compute_threads[index].start()
-            # ideally, we'd like to pop the chunk after processing
-            # it to preserve memory, but this messes up the loop
-            # chunks.pop(index)
-        # wait for all threads to finish, so we know all results are in
-        for thread in compute_threads:
-            thread.join()
-        # doubles timeout in case chunk just took a really long time to process,
-        # preventing the case where it keeps getting sent out but always times
-        # out and never succeeds
-        timeout *= 2
-        #recompute chunk destinations after removing failed machines
-        bad_machine_indices = [i for i,val in enumerate(result) if val==None]
-        # convert indices of bad machines to ips
-        bad_machine_ips = set([available_servers[i] for i in bad_machine_indices])
-        for server in bad_machine_ips:
-            available_servers.remove(server)
-        # check if list is empty. If not, reassign to remaining machines.
-        # if yes, ask for machines again
-        if available_servers:
-            chunk_assignments = helpers._get_chunk_assignments(available_servers, len(chunks))
+    Chunks and results sent over the network are compressed as 
+    plan.compression says (see helpers._Compressor).
+
+    :param foo: function to process the chunks with
+    :param chunker: helpers._Chunker over the job's data
+    :param port: a port by which to send over distributed operations
+    :param op: operation to perform, can be 'map', 'reduce', or 'filter
+    :param timeout: timeout, in seconds, that function should wait
+                    for chunks to be returned, until the plan knows better
+    :param plan: the planner.Plan of the job, which sizes the chunks
+    :param servers: list of (ip, avaliability, round trip time) tuples of
+                    the servers to use, if the job is distributed
+    :param window: the most chunks in flight or waiting to be yielded. By
+                   default, enough to keep every worker busy, plus a few
+                   chunks queued up on every server
+    :param ordered: whether to yield chunks in order rather than as soon as
+                    they are done
+    :param keep: for tree reductions, whether servers keep the reduced 
+                 chunks. Those can't be combined with chunks run locally, so
+                 failures raise a RuntimeError instead
+    :param batch: whether foo() takes whole chunks at once
+    :param job_id: id to tag the job's messages with, by default a random one
+    :param func: foo() as pickled by helpers._pickle_func(), if it already is
+    :return: generator of (chunk index, index in the data of the chunk's 
+             first element, ip of the server that processed the chunk or 
+             None, processed chunk) tuples
+    '''
+    if job_id is None:
+        job_id = random.getrandbits(32)
+    if func is None:
+        func = helpers._pickle_func(foo)
+    # picks the server for each chunk, from those still in use
+    scheduler = helpers._Scheduler(list())
+    compressor = helpers._Compressor(plan.compression, plan)
+    pool = None
+    if plan.backend == 'distributed':
+        scheduler = helpers._Scheduler(servers)
+    elif plan.backend == 'local':
+        pool = helpers._get_local_pool(plan.slots)
+    if window is None:
+        # enough chunks to keep every free worker busy, plus a few queued up
+        window = (max(plan.slots, 1) + 
+            len(scheduler) * CHUNKS_IN_FLIGHT_PER_SERVER)
+
+    # chunk index -> (start, chunk) of every chunk not done yet
+    chunks = dict()
+    # chunks that failed and need to be resent
+    retries = collections.deque()
+    # chunk index -> {server ip or None: time sent} of every copy of a chunk
+    # in flight
+    in_flight = dict()
+    # chunk index -> (start, server ip, processed chunk) of chunks that are
+    # done but wait on earlier chunks to be yielded
+    finished = dict()
+    # completed (or failed) chunks are reported here
+    done = Queue.Queue()
+
+    def send(index, server):
+        '''
+        Sends a chunk to a server, or runs it locally if server is None
+        '''
+        start, chunk = chunks[index]
+        in_flight.setdefault(index, dict())[server] = timeit.default_timer()
+        if server is not None:
+            # chunks of cached data are cached under their dataset, and 
+            # only their key is sent to the server holding them
+            dataset = None
+            if chunker.dataset_id is not None:
+                dataset = (chunker.dataset_id, index)
+            # the client loop sends the chunk and puts its result on done,
+            # so no thread is needed per chunk
+            helpers._send_op(done, func, chunk, op, index, server, port,
+                plan.chunk_timeout(len(chunk), timeout), job_id, keep, start,
+                batch, compressor, dataset, server == chunker.owner(index),
+                plan.stats, plan.profile)
+        elif pool is not None:
+            helpers._submit_local(pool, done, func, chunk, op, index, start,
+                batch, plan.profile)
         else:
-            available_servers = list()
-            helpers._broadcast_client_thread(MULTICAST_GROUP_IP,
-                MULTICAST_PORT, available_servers)
-            if not available_servers:
-                raise RuntimeError("There aren't any available servers on the network!")
-            chunk_assignments = helpers._get_chunk_assignments(available_servers, len(chunks))
+            done.put((index, None, True, 
+                _run_here(plan, op, foo, chunk, start, batch)))
 
-    return result
-    
\ No newline at end of file
+    cut = 0
+    yielded = 0
+    exhausted = False
+    while True:
+        if plan.cancelled:
+            raise future.CancelledError("The job was cancelled.")
+        # keep the window of chunks full
+        while (len(in_flight) + len(finished) < window and 
+            (retries or not exhausted)):
+            if retries:
+                index = retries.popleft()
+            else:
+                piece = chunker.next_chunk(plan)
+                if piece is None:
+                    exhausted = True
+                    break
+                index = cut
+                cut += 1
+                chunks[index] = piece
+                plan.sent(len(piece[1]))
+            if scheduler:
+                send(index, scheduler.assign(index, len(chunks[index][1]),
+                    prefer = chunker.owner(index)))
+            else:
+                send(index, None)
+        if not in_flight:
+            return
+
+        # once every chunk is out, the job can only be held up by the chunks
+        # still in flight, so copy the ones taking much longer than the
+        # others onto idle servers. Whichever copy finishes first wins
+        wait = None
+        if exhausted and not retries and not keep and len(scheduler) > 1:
+            now = timeit.default_timer()
+            for index, copies in in_flight.items():
+                expected = plan.expected_seconds(len(chunks[index][1]))
+                if expected is None or len(copies) > 1:
+                    continue
+                late = min(copies.values()) + expected * SPECULATION_FACTOR
+                if late > now:
+                    wait = late - now if wait is None else min(wait, 
+                        late - now)
+                    continue
+                server = scheduler.assign(index, len(chunks[index][1]), 
+                    exclude = copies, idle = True)
+                if server is not None:
+                    send(index, server)
+                    plan.speculated += 1
+        try:
+            index, server, succeeded, chunk_result = done.get(True, wait)
+        except Queue.Empty:
+            continue
+        copies = in_flight.get(index, dict())
+        sent = copies.pop(server, None)
+        if not succeeded and chunk_result is None:
+            # stop sending to the failed machine and resend the chunk 
+            # elsewhere, unless another copy of it is still running
+            scheduler.remove(server)
+            if server is not None:
+                plan.stats.failed(server)
+            if sent is not None and not copies:
+                del in_flight[index]
+                retries.append(index)
+                plan.stats.count('retries')
+            # if no machines are left, ask for machines again (unless we
+            # already gave up on them)
+            if not scheduler and plan.backend == 'distributed':
+                available_servers = list()
+                _discover(plan, available_servers, fresh = True)
+                scheduler = helpers._Scheduler(available_servers)
+                if not scheduler:
+                    if keep:
+                        raise RuntimeError("There aren't any available "
+                            "servers on the network!")
+                    # run the rest of the job ourselves
+                    if not plan.use_local_pool(_local_workers()):
+                        plan.backend = 'single'
+                    elif pool is None:
+                        pool = helpers._get_local_pool(plan.slots)
+            continue
+        if sent is None:
+            # another copy of the chunk finished first
+            scheduler.finished(server, index)
+            continue
+        scheduler.finished(server, index, timeit.default_timer() - sent)
+        del in_flight[index]
+        if server is not None and chunker.dataset_id is not None:
+            # the chunk is cached there now
+            chunker.set_owner(index, server)
+        if not succeeded:
+            # foo() raised an error
+            if keep:
+                raise RuntimeError("foo() failed on %s:\n%s" % 
+                    (server, chunk_result))
+            start, chunk = chunks[index]
+            error = chunk_result
+            chunk_result = helpers._run_op(op, foo, chunk, start, batch)
+            if server is None:
+                raise RuntimeError("The chunk failed in the local worker "
+                    "pool, but not in this process:\n%s" % error)
+            plan.stats.count('reruns')
+        start, chunk = chunks.pop(index)
+        plan.observe(len(chunk), timeit.default_timer() - sent)
+        plan.stats.chunk(server, len(chunk), timeit.default_timer() - sent)
+        if not ordered:
+            yield index, start, server, chunk_result
+            continue
+        finished[index] = (start, server, chunk_result)
+        while yielded in finished:
+            start, server, chunk_result = finished.pop(yielded)
+            yield yielded, start, server, chunk_result
+            yielded += 1
@@ -8,13 +8,22 @@ will immediately start this server with the configuration specified
 in config.py.
 '''
 
-import time # allows us to avoid busy waiting
 import Queue # to hold incoming chunks
 import socket # to communicate
+import timeit # times sending results back
 import helpers # exposes our helper methods
+import metrics # counts what the server has been doing
+import functools # binds a chunk's ids to the callback sending its result
 import threading # allows us to use multiple threads on a single server
+import traceback # reports errors raised by foo() back to the client
 import cloudpickle as pickle # allows for (de)serialization
 from config import PORT, MULTICAST_PORT, MULTICAST_GROUP_IP # config vars
+from config import HEARTBEAT_PORT # config vars
+from config import DEFAULT_TIMEOUT # config vars
+from config import FUNCTION_CACHE_BYTES, SERVER_WORKERS # config vars
+from config import REDUCTION_SECONDS # config vars
+from config import DATASET_CACHE_BYTES, DATASET_SPILL_DIR # config vars
+from config import METRICS_PORT, METRICS_SAMPLES # config vars
 
 # run sockets on localhost 
 # IP_ADDRESS = 'localhost'
@@ -28,13 +37,28 @@ class Server(threading.Thread):
     computational entity for the system. Extends threading. Thread to make the 
     server threaded and thus nonblocking
     '''
-    def __init__(self, port):
+    def __init__(self, port, workers = SERVER_WORKERS):
         '''
         Initializes server listening on given port
         :param port: port that server should listen on
+        :param workers: number of worker processes chunks are processed in,
+                        by default one per core
         '''
         self.chunk_queue = Queue.Queue()
+        # pickled functions clients have sent us, keyed by their digest
+        self.functions = helpers._LRU_Cache(FUNCTION_CACHE_BYTES)
+        # chunks of the datasets clients cached on us (see p_cache())
+        self.datasets = helpers._Chunk_Store(DATASET_CACHE_BYTES, 
+            DATASET_SPILL_DIR)
         self.port = port
+        self.workers = workers
+        # job id -> _Tree_Reduction of the tree reductions we take part in
+        # (see reduction())
+        self.reductions = dict()
+        self.metrics = metrics.Metrics(METRICS_SAMPLES)
+        self.heartbeat = None
+        self.metrics_thread = None
+        self._lock = threading.Lock()
         self._abort = False
         threading.Thread.__init__(self)
 
@@ -42,59 +66,287 @@ class Server(threading.Thread):
         '''
         Runs core loop of server. It continually listens on a port and waits 
         until it receives a message, which is added to the queue. The server 
-        then determines the type of operation wanted, processes the chunk, 
-        and sends the results back to the calling client. It continues to 
-        process these commands until the queue is empty, at which point it 
-        returns to waiting
+        then hands the chunk to the worker pool, which queues it up until a
+        worker process is free. That worker determines the type of 
+        operation wanted and processes the chunk, and the results are sent
+        back to the calling client over the same connection. Since handing
+        a chunk over never blocks, messages that aren't chunks are handled 
+        right away however busy the workers are. It continues to process 
+        these commands until the queue is empty, at which point it blocks 
+        until the next chunk arrives
         '''
+        # start the workers before any other thread, since they are forked
+        # off this process
+        self.pool = helpers._Worker_Pool(self.workers)
+
         #infinite looping listening thread to identify itself to clients
         print('Server is Running')
 
         self.bst = helpers._Broadcast_Server_Thread(MULTICAST_GROUP_IP, 
-            MULTICAST_PORT, self.chunk_queue)
+            MULTICAST_PORT, self.chunk_queue, self.pool)
         self.bst.start()
 
+        #lets clients know we are here (and still alive) without asking
+        self.heartbeat = helpers._Heartbeat_Thread(MULTICAST_GROUP_IP, 
+            HEARTBEAT_PORT, self.bst)
+        self.heartbeat.start()
+
+        #answers requests for our metrics
+        if METRICS_PORT is not None:
+            self.metrics_thread = helpers._Metrics_Server_Thread(IP_ADDRESS,
+                METRICS_PORT, self.snapshot, self.sample)
+            self.metrics_thread.start()
+
         #infinite looping listening thread for chunks
         self.sstr = helpers._Server_Socket_Thread_Receive(IP_ADDRESS, 
             self.port, self.chunk_queue)
         self.sstr.start()
         #infinitely loops until calling process calls stop()
         while not self._abort:
-            
-            # sleep so we don't busy wait
-            time.sleep(0.01)
-
-            if not self.chunk_queue.empty():
-                full_chunk = self.chunk_queue.get()
-                dict_received = pickle.loads(full_chunk[0])
-                chunk = dict_received['chunk']
-                func = dict_received['func']
-                op = dict_received['op']
-
-                if op == 'map':
-                    processed_chunk = helpers._single_map(func, chunk)
-                elif op == 'filter':
-                    processed_chunk = helpers._single_filter(func, chunk)
-                elif op == 'reduce':
-                    processed_chunk = helpers._single_reduce(func, chunk)
-                # TODO: raise an error here
-                else:
-                    processed_chunk = 'This operation does not exist.'
-                
-                dict_sent = {
-                    'chunk': processed_chunk, 
-                    'index': dict_received['index']
-                }
-
-                #sends results back on port+1
-                self.ssts = threading.Thread(
-                    target = helpers._server_socket_thread_send, 
-                    args = (full_chunk[1], self.port + 1, 
-                        pickle.dumps(dict_sent))
-                )
-                self.ssts.start()
+            # blocks until a chunk arrives (or stop() wakes us up)
+            item = self.chunk_queue.get()
+            if item is None:
+                continue
+            frame, connection, received = item
+            msg_type, job_id, request_id, payload = frame
+            self.metrics.message(len(payload))
+            if msg_type == helpers.MSG_COLLECT:
+                self.collect(job_id, request_id, helpers._loads(payload),
+                    connection)
+                continue
+            if msg_type == helpers.MSG_PARTIAL:
+                self.receive_runs(job_id, request_id, 
+                    helpers._loads(payload), connection)
+                continue
+            if msg_type == helpers.MSG_STORE:
+                envelope, offset = helpers._load_envelope(payload)
+                self.datasets.put(envelope['dataset'], 
+                    str(buffer(payload, offset)))
+                connection.send(helpers.MSG_RESULT, job_id, request_id, '')
+                continue
+            if msg_type == helpers.MSG_DROP:
+                self.datasets.drop(helpers._loads(payload)['dataset'])
+                connection.send(helpers.MSG_RESULT, job_id, request_id, '')
+                continue
+            if msg_type != helpers.MSG_CHUNK:
+                continue
+            # only the small envelope in front of the chunk is unpickled
+            # here, the chunk itself is left to the worker
+            envelope, offset = helpers._load_envelope(payload)
+            func_bytes = self.get_function(envelope)
+            if func_bytes is None:
+                # ask the client to resend the chunk with the function
+                self.metrics.resend('function')
+                connection.send(helpers.MSG_FUNC_MISSING, job_id, 
+                    request_id, '')
+                continue
+            if (envelope['source'] is not None and not envelope['raw'] 
+                and not helpers._has_file(envelope['source'])):
+                # ask the client to send the bytes of the file's range
+                self.metrics.resend('data')
+                connection.send(helpers.MSG_DATA_MISSING, job_id, 
+                    request_id, '')
+                continue
+            if envelope['dataset'] is not None and envelope['cached']:
+                chunk = self.datasets.get(envelope['dataset'])
+                if chunk is None:
+                    # ask the client to resend the chunk with its data
+                    self.metrics.resend('data')
+                    connection.send(helpers.MSG_DATA_MISSING, job_id, 
+                        request_id, '')
+                    continue
+                payload = str(payload) + chunk
+            elif envelope['dataset'] is not None:
+                # keep the chunk for the next job over the same dataset
+                self.datasets.put(envelope['dataset'], 
+                    str(buffer(payload, offset)))
+
+            #sends results back over the connection the chunk came in on
+            if envelope['keep']:
+                callback = functools.partial(self.keep_partial, job_id,
+                    request_id, connection)
+            else:
+                callback = functools.partial(connection.send, 
+                    helpers.MSG_RESULT, job_id, request_id, 
+                    codec = envelope.get('compress'))
+            self.metrics.chunk(envelope['op'])
+            self.pool.submit(envelope['func_digest'], func_bytes, 
+                str(payload), functools.partial(self.finished, 
+                envelope['op'], callback), received)
         self.sstr.stop() #nicely close sockets at the end
+        self.bst.stop()
+        self.pool.close()
+
+    def get_function(self, envelope):
+        '''
+        Finds the pickled function a chunk should be processed with. Chunks
+        usually refer to a function by the digest of its pickle only, in 
+        which case it comes from the function cache. Otherwise the chunk 
+        carries the pickled function itself, which is cached for the chunks
+        that follow
 
+        :param envelope: the unpickled envelope of the chunk message
+        :return: the pickled function, or None if the chunk only has a 
+                 digest we don't have cached
+        '''
+        digest = envelope['func_digest']
+        func_bytes = self.functions.get(digest)
+        if func_bytes is None and envelope['func'] is not None:
+            func_bytes = envelope['func']
+            self.functions.put(digest, func_bytes, len(func_bytes))
+        return func_bytes
+
+    def finished(self, op, callback, result):
+        '''
+        Sends a processed chunk's result on, and counts it in our metrics
+
+        :param op: operation of the chunk
+        :param callback: called with the pickled result message
+        :param result: what helpers._process_chunk() returned
+        '''
+        message, timing = result
+        started = timeit.default_timer()
+        callback(message)
+        self.metrics.finished(op, timing, len(message), 
+            timeit.default_timer() - started)
+
+    def sample(self):
+        '''
+        Samples how many chunks are waiting for a worker, and how many are
+        being processed
+        '''
+        self.metrics.sample(self.bst.queued(), self.pool.busy)
+
+    def snapshot(self):
+        '''
+        :return: our metrics (see metrics.Metrics), the hit rates of our 
+                 function and dataset caches, and our availability report,
+                 as a dict json.dumps() takes
+        '''
+        snapshot = self.metrics.summary()
+        snapshot['caches'] = {
+            'functions': {'hits': self.functions.hits, 
+                'misses': self.functions.misses,
+                'bytes': self.functions.nbytes},
+            'datasets': {'hits': self.datasets.hits, 
+                'misses': self.datasets.misses,
+                'spilled': self.datasets.spilled()}}
+        for cache in snapshot['caches'].values():
+            lookups = cache['hits'] + cache['misses']
+            cache['hit_rate'] = (float(cache['hits']) / lookups 
+                if lookups else None)
+        snapshot['report'] = self.bst.report()
+        return snapshot
+
+    def keep_partial(self, job_id, request_id, connection, result):
+        '''
+        Keeps a reduced chunk for the job's tree reduction, and only tells
+        the client that the chunk is done
+
+        :param job_id: id of the job
+        :param request_id: request id of the chunk
+        :param connection: connection the chunk came in on
+        :param result: the pickled result message from the worker
+        '''
+        response = helpers._load_parts(result)
+        if 'error' not in response:
+            with self._lock:
+                reduction = self.reduction(job_id)
+                reduction.partials[response['index']] = response['chunk']
+            response['chunk'] = None
+            result = helpers._join_parts(helpers._dump_parts(response))
+        connection.send(helpers.MSG_RESULT, job_id, request_id, result)
+
+    def collect(self, job_id, request_id, message, connection):
+        '''
+        Handles a client asking us to combine our part of a tree reduction
+
+        :param job_id: id of the job
+        :param request_id: request id of the collect message
+        :param message: the unpickled collect message
+        :param connection: connection to answer on
+        '''
+        with self._lock:
+            reduction = self.reduction(job_id)
+            reduction.collect = (message, connection, request_id)
+            self.finish_when_ready(job_id)
+
+    def receive_runs(self, job_id, request_id, message, connection):
+        '''
+        Handles a child in the reduction tree sending us its runs
+
+        :param job_id: id of the job
+        :param request_id: request id of the message
+        :param message: the unpickled message, holding the runs
+        :param connection: connection to acknowledge the runs on
+        '''
+        with self._lock:
+            reduction = self.reduction(job_id)
+            reduction.child_runs.extend(message['runs'])
+            reduction.children_received += 1
+            self.finish_when_ready(job_id)
+        connection.send(helpers.MSG_RESULT, job_id, request_id, '')
+
+    def reduction(self, job_id):
+        '''
+        Looks up our part of a job's tree reduction. Whenever a new one is
+        added, those of jobs we haven't heard from in REDUCTION_SECONDS are
+        dropped, so partial reductions the client never collects don't 
+        pile up. Must be called holding self._lock
+
+        :param job_id: id of the job
+        :return: our _Tree_Reduction of the job, added if it is new
+        '''
+        now = timeit.default_timer()
+        reduction = self.reductions.get(job_id)
+        if reduction is None:
+            for stale, kept in self.reductions.items():
+                if now - kept.touched > REDUCTION_SECONDS:
+                    del self.reductions[stale]
+            reduction = helpers._Tree_Reduction()
+            self.reductions[job_id] = reduction
+        reduction.touched = now
+        return reduction
+
+    def finish_when_ready(self, job_id):
+        '''
+        Combines our part of a tree reduction on a separate thread once 
+        everything it needs is in. Must be called holding self._lock
+
+        :param job_id: id of the job
+        '''
+        if self.reductions[job_id].ready():
+            finisher = threading.Thread(target = self.finish_reduction,
+                args = (job_id, self.reductions.pop(job_id)))
+            finisher.daemon = True
+            finisher.start()
+
+    def finish_reduction(self, job_id, reduction):
+        '''
+        Combines the partial reductions we kept with the runs of our 
+        children, then sends them to our parent in the tree, or back to 
+        the client if we are the root
+
+        :param job_id: id of the job
+        :param reduction: our _Tree_Reduction of the job
+        '''
+        message, connection, request_id = reduction.collect
+        try:
+            func = pickle.loads(self.functions.get(message['func_digest']))
+            runs = [(index, index, reduction.partials[index]) 
+                for index in message['indices']] + reduction.child_runs
+            runs = helpers._merge_runs(func, runs, message['commutative'])
+            if message['parent'] is not None:
+                parent = helpers._connection_pool.get(message['parent'][0], 
+                    message['parent'][1], DEFAULT_TIMEOUT)
+                parent.request(job_id, pickle.dumps({'runs': runs}), 
+                    DEFAULT_TIMEOUT, helpers.MSG_PARTIAL)
+                runs = None
+            reply = {'runs': runs}
+        except Exception:
+            reply = {'error': traceback.format_exc()}
+        connection.send(helpers.MSG_RESULT, job_id, request_id, 
+            pickle.dumps(reply))
 
     def stop(self):
         '''
@@ -102,6 +354,20 @@ class Server(threading.Thread):
         '''
         print('Server Stopped')
         self._abort = True
+        threads = [thread for thread in (self.heartbeat, self.metrics_thread)
+            if thread is not None]
+        for thread in threads:
+            thread.stop()
+        # wake up the core loop if it is waiting on the queue
+        self.chunk_queue.put(None)
+        # wait for the threads to finish, and for the core loop to close the
+        # worker pool, so nothing is left running once we return
+        for thread in threads:
+            thread.join()
+        if self.is_alive() and threading.current_thread() is not self:
+            self.join()
+        # deletes whatever was spilled to disk
+        self.datasets.drop(None)
 
 if __name__ == '__main__':
     a = Server(PORT)
@@ -0,0 +1,463 @@
+'''
+This file defines the Plan class, which decides how a job is run: whether
+it is worth sending over the network at all and, if so, how big each chunk
+should be.
+
+A plan starts from a quick local measurement (timing foo() on a few sample
+elements and pickling them to see how many bytes each element costs on the
+wire). Once servers have been discovered, it adds how many of them there are
+and how long they took to answer. While the job runs, every completed chunk
+is fed back into the plan, so the chunks cut later in the job follow what
+the servers are actually achieving rather than the initial guess.
+
+Callers can look at the plan of a job via the explain option of p_map(),
+p_filter() and p_reduce().
+
+Jobs that aren't distributed are still planned: big enough ones run in a
+pool of worker processes on this machine, cut into chunks the same way.
+'''
+
+import math # for ceilings on chunk counts
+import bisect # keeps the round trip times sorted for percentiles
+import timeit # picks the most precise timer for the platform
+import cloudpickle as pickle # to measure serialized sizes
+import helpers # runs foo() on sample chunks in batch mode
+import cache # tells cached data, which isn't sent with the job, apart
+import timing # breaks down where the time of a job went
+
+# somtimes Python can't find the actual variables inside of config,
+# so it's safer to just assign variables this way
+import config
+DISCOVERY_TIMEOUT = config.DISCOVERY_TIMEOUT
+PLAN_SAMPLE_SIZE = config.PLAN_SAMPLE_SIZE
+PLAN_SAMPLE_SECONDS = config.PLAN_SAMPLE_SECONDS
+PLAN_OVERHEAD_FRACTION = config.PLAN_OVERHEAD_FRACTION
+PLAN_CHUNKS_PER_SERVER = config.PLAN_CHUNKS_PER_SERVER
+PLAN_MESSAGE_SECONDS = config.PLAN_MESSAGE_SECONDS
+PLAN_BANDWIDTH = config.PLAN_BANDWIDTH
+MAX_CHUNK_BYTES = config.MAX_CHUNK_BYTES
+LOCAL_POOL_SECONDS = config.LOCAL_POOL_SECONDS
+LATENCY_PERCENTILE = config.LATENCY_PERCENTILE
+LATENCY_SAMPLES = config.LATENCY_SAMPLES
+CHUNK_TIMEOUT_FACTOR = config.CHUNK_TIMEOUT_FACTOR
+MIN_CHUNK_TIMEOUT = config.MIN_CHUNK_TIMEOUT
+
+class Plan(object):
+    '''
+    How a single p_map(), p_filter() or p_reduce() job is run. The
+    attributes are meant to be read by callers that want to know why a job
+    ran the way it did:
+
+    picklable: whether foo() and the data can be sent over the network
+    distribute: whether the job is sent to servers at all
+    backend: where the job ran: 'distributed' (on servers), 'local' (in a
+        pool of worker processes on this machine) or 'single' (in the
+        calling process)
+    reason: a short explanation of that decision
+    servers: number of servers the job can use
+    slots: number of chunks those servers (or local workers) can process
+        at once
+    rtt: typical time in seconds servers took to answer discovery
+    seconds_per_element: local time foo() takes on one element
+    bytes_per_element: pickled size of an element going out and coming back
+        (only coming back, if the data is cached on the servers)
+    cached: whether the data is cached on the servers (see p_cache())
+    chunk_sizes: sizes of the chunks sent so far, in order
+    chunk_seconds: round trip time of each completed chunk
+    speculated: number of chunks that were copied onto a second server
+        because they took much longer than the others
+    compression: how the job compresses what it sends over the network
+        (see p_map())
+    bytes_before: bytes of the chunks and results sent over the network,
+        before compression
+    bytes_after: bytes they took on the wire
+    stats: timing.JobStats breaking down where the time of the job went
+    profile: timing.Profile of foo() over the job's chunks, if the job is
+        profiled, or None
+    cancelled: set to stop the job before its next chunk (see future.Future)
+    '''
+    def __init__(self, foo, data, op, batch = False, stream = False,
+        compression = 'auto', profile = False):
+        '''
+        Measures foo() on a handful of elements from the front of data. foo()
+        gets called on these samples an extra time, which is harmless as
+        long as it has no side effects (something distributed jobs, whose
+        chunks may be retried, require anyway)
+
+        :param foo: the function the job applies
+        :param data: the data (of type list) the job runs over
+        :param op: 'map', 'filter', 'reduce' or 'pipeline' (foo is then the
+            list of steps, which are timed together on whole chunks)
+        :param batch: whether foo() takes whole chunks at once
+        :param stream: whether data is just the front of a stream of unknown
+            length, which is assumed to be long
+        :param compression: 'auto', None, or the name of a codec (see 
+            p_map())
+        :param profile: whether to profile foo() on every chunk (see 
+            p_map())
+        '''
+        if compression not in (None, 'auto') and \
+            compression not in helpers._CODECS:
+            raise ValueError("The compression %r does not exist." % 
+                compression)
+        self.stats = timing.JobStats()
+        self.profile = timing.Profile() if profile else None
+        self.op = op
+        self.batch = batch
+        self.cached = isinstance(data, cache.Handle)
+        # None for streams
+        self.elements = None if stream else len(data)
+        self.servers = 0
+        self.slots = 0
+        self.rtt = 0.0
+        self.distribute = False
+        self.backend = 'single'
+        self.reason = 'no servers have been asked yet'
+        self.chunk_sizes = list()
+        self.chunk_seconds = list()
+        self.speculated = 0
+        self.compression = compression
+        self.bytes_before = 0
+        self.bytes_after = 0
+        self.cancelled = False
+        self._started = None
+        # round trip time per element of every completed chunk, sorted
+        self._latencies = list()
+        self._completed = 0
+        try:
+            self.func_bytes = len(pickle.dumps(foo))
+            if batch:
+                self.seconds_per_element, self.bytes_per_element = \
+                    self._sample_batch(foo, data)
+            else:
+                self.seconds_per_element, self.bytes_per_element = \
+                    self._sample(foo, data)
+            self.picklable = True
+        except Exception:
+            # whatever can't be pickled can only ever run locally
+            self.func_bytes = 0
+            self.seconds_per_element, self.bytes_per_element = 0.0, 0.0
+            self.picklable = False
+        # what servers achieve per element, learned from completed chunks
+        self._remote_seconds_per_element = None
+        self.stats.add('planning', timeit.default_timer() - 
+            self.stats._started)
+
+    def _sample(self, foo, data):
+        '''
+        Times foo() on up to PLAN_SAMPLE_SIZE elements, stopping early once
+        PLAN_SAMPLE_SECONDS have passed so an expensive foo() doesn't make
+        planning expensive too
+
+        :return: tuple of the seconds foo() takes per element and the
+                 pickled size of an element plus its result
+        '''
+        if len(data) == 0 or (self.op == 'reduce' and len(data) < 2):
+            return 0.0, 0.0
+        sample = list()
+        output = list()
+        start = timeit.default_timer()
+        for index, elt in enumerate(data[:PLAN_SAMPLE_SIZE]):
+            if self.op == 'map':
+                output.append(foo(elt, index))
+            elif self.op == 'filter':
+                if foo(elt, index):
+                    output.append(elt)
+            elif index > 0:
+                # reductions only send a single value back per chunk
+                foo(sample[-1], elt)
+            sample.append(elt)
+            if timeit.default_timer() - start > PLAN_SAMPLE_SECONDS:
+                break
+        elapsed = timeit.default_timer() - start
+        if self.op == 'reduce':
+            calls = len(sample) - 1
+        else:
+            calls = len(sample)
+        nbytes = self._input_bytes(sample) + len(pickle.dumps(output))
+        return elapsed / max(calls, 1), float(nbytes) / len(sample)
+
+    def _sample_batch(self, foo, data):
+        '''
+        Times foo() on chunks from the front of data, quadrupling the chunk
+        until foo() takes about PLAN_SAMPLE_SECONDS, since a vectorized foo()
+        costs little more on a few elements than on a single one
+
+        :return: tuple of the seconds foo() takes per element and the
+                 pickled size of an element plus its result
+        '''
+        if len(data) == 0:
+            return 0.0, 0.0
+        size = PLAN_SAMPLE_SIZE
+        while True:
+            sample = data[:size]
+            start = timeit.default_timer()
+            output = helpers._run_op(self.op, foo, sample, 0, True)
+            elapsed = timeit.default_timer() - start
+            if elapsed * 4 > PLAN_SAMPLE_SECONDS or size >= len(data):
+                break
+            size *= 4
+        nbytes = self._input_bytes(sample) + len(pickle.dumps(output))
+        return elapsed / len(sample), float(nbytes) / len(sample)
+
+    def _input_bytes(self, sample):
+        '''
+        :return: pickled size of sample elements going out to the servers,
+                 which is nothing if the servers have the data cached
+        '''
+        if self.cached:
+            return 0
+        return len(pickle.dumps(sample))
+
+    @property
+    def local_seconds(self):
+        '''
+        :return: estimated seconds for running the whole job locally
+        '''
+        if self.elements is None:
+            return float('inf')
+        return self.elements * self.seconds_per_element
+
+    @property
+    def overhead_seconds(self):
+        '''
+        :return: estimated seconds every chunk costs regardless of its size
+        '''
+        return (self.rtt + PLAN_MESSAGE_SECONDS +
+            float(self.func_bytes) / PLAN_BANDWIDTH)
+
+    @property
+    def remote_seconds_per_element(self):
+        '''
+        :return: estimated seconds a server spends per element, including
+                 moving it over the network
+        '''
+        if self._remote_seconds_per_element is not None:
+            return self._remote_seconds_per_element
+        return (self.seconds_per_element +
+            self.bytes_per_element / PLAN_BANDWIDTH)
+
+    def distributed_seconds(self):
+        '''
+        :return: estimated seconds for running the job on the servers
+        '''
+        if self.servers == 0 or self.elements is None:
+            return float('inf')
+        chunk_size = self.next_chunk_size(self.elements)
+        rounds = math.ceil(math.ceil(float(self.elements) / chunk_size) /
+            self.slots)
+        # compute is split between servers, but every byte still goes
+        # through the client's own network link
+        return (self.elements * self.seconds_per_element / self.slots +
+            self.elements * self.bytes_per_element / PLAN_BANDWIDTH +
+            rounds * self.overhead_seconds)
+
+    def distributed_seconds_per_element(self):
+        '''
+        :return: estimated seconds each element of a stream costs on the 
+                 servers, including its share of its chunk's overhead
+        '''
+        chunk_size = self.next_chunk_size(None)
+        return ((self.seconds_per_element + 
+            self.overhead_seconds / chunk_size) / self.slots + 
+            self.bytes_per_element / PLAN_BANDWIDTH)
+
+    def worth_discovering(self):
+        '''
+        Discovering servers alone takes DISCOVERY_TIMEOUT seconds, so a job
+        that finishes locally before then is never worth distributing
+
+        :return: whether to look for servers at all
+        '''
+        if not self.picklable:
+            self.reason = 'foo() or the data can not be pickled'
+            return False
+        if self.local_seconds <= DISCOVERY_TIMEOUT:
+            self.reason = ('running locally takes about %.3gs, less than '
+                'discovering servers' % self.local_seconds)
+            return False
+        return True
+
+    def use_servers(self, available_servers, force = False):
+        '''
+        Decides between running locally and distributing, given the servers
+        that answered discovery
+
+        :param available_servers: list of (ip, avaliability, round trip
+            time) tuples
+        :param force: if True, distribute whenever there are servers and 
+            foo() and the data can be pickled
+        '''
+        self.servers = len(available_servers)
+        # idle servers report minus their number of free workers
+        self.slots = sum(max(-server[1], 1) for server in available_servers)
+        if self.servers == 0:
+            self.distribute = False
+            self.reason = "there aren't any available servers on the network"
+            return
+        rtts = sorted(server[2] for server in available_servers)
+        self.rtt = rtts[len(rtts) // 2]
+        if self.elements is None:
+            # streams are compared by what each element costs
+            local = self.seconds_per_element
+            distributed = self.distributed_seconds_per_element()
+            unit = 's per element'
+        else:
+            local = self.local_seconds
+            distributed = self.distributed_seconds()
+            unit = 's'
+        self.distribute = distributed < local
+        if force and self.picklable and not self.distribute:
+            self.distribute = True
+            self.backend = 'distributed'
+            self.reason = 'distributing over %d servers as asked' % \
+                self.servers
+        elif self.distribute:
+            self.backend = 'distributed'
+            self.reason = ('distributing over %d servers takes about %.3g%s, '
+                'running locally about %.3g%s' %
+                (self.servers, distributed, unit, local, unit))
+        else:
+            self.reason = ('running locally takes about %.3g%s, distributing '
+                'over %d servers about %.3g%s' %
+                (local, unit, self.servers, distributed, unit))
+
+    def use_local_pool(self, workers, force = False):
+        '''
+        Decides whether a job that isn't distributed runs in a pool of worker
+        processes on this machine. Handing chunks to the workers costs about
+        as much as starting a job, so cheap jobs stay in the calling process
+
+        :param workers: number of worker processes in the pool
+        :param force: if True, use the pool whenever foo() and the data can
+            be pickled
+        :return: whether to run the job in the pool
+        '''
+        if not self.picklable:
+            self.reason = 'foo() or the data can not be pickled'
+            return False
+        if not force and (workers < 2 or
+            self.local_seconds < LOCAL_POOL_SECONDS):
+            return False
+        self.backend = 'local'
+        self.distribute = False
+        self.servers = 0
+        self.slots = workers
+        self.rtt = 0.0
+        if force:
+            self.reason = 'running in %d local workers as asked' % workers
+        else:
+            self.reason += ', so running in %d local workers' % workers
+        return True
+
+    def cache_chunk_size(self):
+        '''
+        :return: number of elements per chunk to cache the data in (see 
+                 p_cache()), which stays the size of the chunks of every job
+                 over it: PLAN_CHUNKS_PER_SERVER chunks per slot, as long as
+                 none is bigger than MAX_CHUNK_BYTES
+        '''
+        balanced = math.ceil(float(self.elements) / 
+            (max(self.slots, 1) * PLAN_CHUNKS_PER_SERVER))
+        largest = MAX_CHUNK_BYTES / max(self.bytes_per_element, 1.0)
+        return max(int(min(balanced, largest)), 1)
+
+    def next_chunk_size(self, remaining):
+        '''
+        Size of the next chunk to cut. Chunks are big enough that the fixed
+        cost of a round trip is at most PLAN_OVERHEAD_FRACTION of their time,
+        and otherwise shrink as the job progresses so that each worker on the
+        servers gets about PLAN_CHUNKS_PER_SERVER chunks of what is left,
+        which lets the servers finish together
+
+        :param remaining: number of elements not yet sent out, or None if
+            that isn't known (for streams)
+        :return: number of elements to put in the next chunk
+        '''
+        per_element = max(self.remote_seconds_per_element, 1e-9)
+        amortized = (self.overhead_seconds * (1 - PLAN_OVERHEAD_FRACTION) /
+            (PLAN_OVERHEAD_FRACTION * per_element))
+        largest = MAX_CHUNK_BYTES / max(self.bytes_per_element, 1.0)
+        if remaining is None:
+            size = min(amortized, largest)
+        else:
+            balanced = math.ceil(float(remaining) /
+                (max(self.slots, 1) * PLAN_CHUNKS_PER_SERVER))
+            size = min(max(amortized, balanced), largest)
+        if self.op == 'reduce':
+            # a reduction only makes progress on chunks of 2 or more
+            size = max(size, 2)
+        if remaining is not None:
+            size = min(size, remaining)
+        return max(int(size), 1)
+
+    def sent(self, elements):
+        '''
+        Records a chunk being sent out
+
+        :param elements: number of elements in the chunk
+        '''
+        if self._started is None:
+            self._started = timeit.default_timer()
+        self.chunk_sizes.append(elements)
+
+    def observe(self, elements, seconds):
+        '''
+        Records a completed chunk and updates what servers achieve per
+        element. The estimate comes from the job's throughput so far rather
+        than from single round trips, since those also include time spent
+        waiting in a server's queue
+
+        :param elements: number of elements in the chunk
+        :param seconds: round trip time of the chunk
+        '''
+        self.chunk_seconds.append(seconds)
+        bisect.insort(self._latencies, seconds / max(elements, 1))
+        self._completed += elements
+        elapsed = timeit.default_timer() - self._started
+        # what each worker achieved per element, minus the fixed costs of the
+        # chunks it took to get there
+        slots = max(self.slots, 1)
+        chunks = float(len(self.chunk_seconds)) / slots
+        per_element = ((elapsed - chunks * self.overhead_seconds) *
+            slots / self._completed)
+        # the fixed costs can be overestimated (early on, or when the round
+        # trip to the servers was slow when they answered), which leaves 
+        # nothing to learn from, so keep the estimate from before then
+        if per_element > 0:
+            self._remote_seconds_per_element = per_element
+
+    def expected_seconds(self, elements):
+        '''
+        How long a chunk should take to come back, going by the 
+        LATENCY_PERCENTILE'th percentile of the chunks completed so far. A
+        percentile rather than the mean keeps a single slow server from
+        making every chunk look late
+
+        :param elements: number of elements in the chunk
+        :return: the expected round trip time in seconds, or None until
+                 LATENCY_SAMPLES chunks have completed
+        '''
+        if len(self._latencies) < LATENCY_SAMPLES:
+            return None
+        rank = (len(self._latencies) - 1) * LATENCY_PERCENTILE // 100
+        return self._latencies[rank] * max(elements, 1)
+
+    def chunk_timeout(self, elements, timeout):
+        '''
+        :param elements: number of elements in the chunk
+        :param timeout: the caller's timeout, used until enough chunks have
+            completed to know better
+        :return: how long in seconds to wait for a chunk before giving up 
+                 on it
+        '''
+        expected = self.expected_seconds(elements)
+        if expected is None:
+            return timeout
+        return max(expected * CHUNK_TIMEOUT_FACTOR, MIN_CHUNK_TIMEOUT)
+
+    def __repr__(self):
+        return ('Plan(op=%r, elements=%r, backend=%r, servers=%d, '
+            'chunks=%d, reason=%r)' % (self.op, self.elements,
+            self.backend, self.servers, len(self.chunk_sizes),
+            self.reason))
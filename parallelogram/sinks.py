@@ -0,0 +1,205 @@
+'''
+This file defines the Sink classes, which jobs write their results to as
+they arrive rather than returning them: a NumPy .npy file, a text file of
+lines, or a function of the caller's.
+
+p_map() and p_filter() otherwise hold every processed chunk until the job
+is done, and then join them into a second copy of the whole result. Given
+out = a path, a Sink or a function, each chunk is written as soon as it can
+be and then let go of. Where every chunk's place in the output is known up
+front (a map into a .npy file) chunks are written there as they come back,
+in any order. Everywhere else they are written in order, and chunks that
+come back early wait for the ones before them, so at most a window of
+chunks is held at a time (see _run_chunks()).
+'''
+
+import struct # packs the length of .npy headers
+try:
+    import numpy # writes arrays into .npy files
+except ImportError:
+    numpy = None
+
+#:magic string every .npy file starts with, and the format version we write
+NPY_MAGIC = '\x93NUMPY\x01\x00'
+
+class Sink(object):
+    '''
+    Where the results of a job go. Subclasses define write() and close()
+
+    ordered: whether chunks have to be written in order, or can be written
+        at their place in the output as they arrive
+    written: number of elements written so far
+    '''
+    ordered = True
+
+    def __init__(self):
+        self.written = 0
+
+    def start(self, rows):
+        '''
+        Called before the job runs
+
+        :param rows: number of elements the job will write, if known up
+                     front (for maps), or None
+        '''
+
+    def write(self, start, chunk):
+        '''
+        :param start: index in the output of the chunk's first element, if
+                      chunks aren't written in order
+        :param chunk: a processed chunk: a list, or a NumPy array
+        '''
+        raise NotImplementedError
+
+    def close(self):
+        '''
+        Called once the job is done, or has failed
+        '''
+
+class Npy(Sink):
+    '''
+    Writes a job's results into a .npy file, which numpy.load() reads back
+    (with mmap_mode = 'r', without reading it into memory). The array's
+    dtype and the shape of its rows are taken from the first chunk written,
+    and later chunks are cast to them
+    '''
+    def __init__(self, path):
+        '''
+        :param path: path of the .npy file to write
+        '''
+        Sink.__init__(self)
+        self.path = path
+        self.rows = None
+        self.dtype = None
+        self.shape = None
+        self._header = 0
+        self._file = None
+
+    def start(self, rows):
+        self.rows = rows
+        self.ordered = rows is None
+        self._file = open(self.path, 'wb')
+
+    def _write_header(self, rows):
+        '''
+        Writes the .npy header for an array of `rows` rows. The first header
+        is padded to hold any number of rows, so the header written once the
+        number is known takes the same space
+
+        :param rows: number of rows, or None for as many as there can be
+        '''
+        shape = (rows if rows is not None else 2 ** 63 - 1,) + self.shape
+        header = "{'descr': %r, 'fortran_order': False, 'shape': (%s), }" % (
+            numpy.lib.format.dtype_to_descr(self.dtype),
+            ''.join('%d, ' % length for length in shape))
+        if self._header == 0:
+            # the header ends with a newline, and the data starts at a
+            # multiple of 64 bytes
+            self._header = len(NPY_MAGIC) + 2 + len(header) + 1
+            self._header += -self._header % 64
+        header = header.ljust(self._header - len(NPY_MAGIC) - 3) + '\n'
+        self._file.seek(0)
+        self._file.write(NPY_MAGIC + struct.pack('<H', len(header)) +
+            header)
+
+    def write(self, start, chunk):
+        if len(chunk) == 0:
+            return
+        if self.dtype is None:
+            first = numpy.asarray(chunk)
+            if first.dtype.hasobject:
+                raise ValueError("%s can only hold results NumPy can store "
+                    "without pickling them." % self.path)
+            self.dtype = first.dtype
+            self.shape = first.shape[1:]
+            self._write_header(self.rows)
+        chunk = numpy.ascontiguousarray(chunk, self.dtype)
+        if chunk.shape[1:] != self.shape:
+            raise ValueError("Rows of shape %r can't be written into %s, "
+                "whose rows are of shape %r." % (chunk.shape[1:], self.path,
+                self.shape))
+        if self.ordered:
+            start = self.written
+        elif start + len(chunk) > self.rows:
+            raise ValueError("A map gave back more elements than it was "
+                "given.")
+        row_bytes = self.dtype.itemsize * int(numpy.prod(self.shape))
+        self._file.seek(self._header + start * row_bytes)
+        self._file.write(chunk.tostring())
+        self.written += len(chunk)
+
+    def close(self):
+        if self._file is None:
+            return
+        if self.dtype is None:
+            # nothing was written, so there is nothing to take a dtype from
+            self.dtype = numpy.dtype(float)
+            self.shape = ()
+        self._write_header(self.rows if self.rows is not None else
+            self.written)
+        self._file.close()
+        self._file = None
+
+class Lines(Sink):
+    '''
+    Writes a job's results into a text file, an element per line (as its
+    str(), or encoded as UTF-8 if it is unicode)
+    '''
+    def __init__(self, path):
+        '''
+        :param path: path of the text file to write
+        '''
+        Sink.__init__(self)
+        self.path = path
+        self._file = None
+
+    def start(self, rows):
+        self._file = open(self.path, 'wb')
+
+    def write(self, start, chunk):
+        lines = list()
+        for elt in chunk:
+            if isinstance(elt, unicode):
+                lines.append(elt.encode('utf-8'))
+            else:
+                lines.append(str(elt))
+        if lines:
+            self._file.write('\n'.join(lines) + '\n')
+        self.written += len(lines)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+class Writer(Sink):
+    '''
+    Gives a job's processed chunks, in order, to a function of the caller's
+    '''
+    def __init__(self, foo):
+        '''
+        :param foo: function called with every processed chunk (a list, or
+            a NumPy array), in order
+        '''
+        Sink.__init__(self)
+        self.foo = foo
+
+    def write(self, start, chunk):
+        self.foo(chunk)
+        self.written += len(chunk)
+
+def _sink(out):
+    '''
+    :param out: a path (of a .npy file, or of a text file otherwise), a
+                Sink, or a function to give the processed chunks to
+    :return: the Sink to write a job's results to
+    '''
+    if isinstance(out, Sink):
+        return out
+    if isinstance(out, basestring):
+        if out.endswith('.npy'):
+            return Npy(out)
+        return Lines(out)
+    if callable(out):
+        return Writer(out)
+    raise TypeError("Results can't be written to %r." % (out,))
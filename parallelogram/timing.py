@@ -0,0 +1,231 @@
+'''
+This file defines the JobStats class, which breaks down where the time of
+a job went: discovering servers, pickling chunks, sending them, waiting in
+the servers' queues, running foo() and unpickling the results. It also
+counts the bytes sent and received, the chunks that had to be resent and,
+per server, how many chunks it ran and how long they took, which is how
+slow or failing servers stand out.
+
+Every planner.Plan keeps one (as plan.stats), and p_map(), p_filter() and
+p_reduce() return it with stats = True.
+
+It also defines the Profile class, which merges the profiles servers take
+of foo() on every chunk of a job run with profile = True into a single
+pstats.Stats for the whole job.
+'''
+
+import timeit # times the whole job
+import pstats # merges the profiles of chunks
+import threading # the client loop and the job's thread both count
+
+#:phases of a job, in the order a chunk goes through them. Times are summed
+#:over chunks, so phases of chunks that overlap add up to more than the job
+PHASES = ('planning', 'discovery', 'pickling', 'compression', 'network',
+    'queue', 'loading', 'compute', 'unpickling', 'local')
+
+def _percentile(values, fraction):
+    '''
+    :param values: sorted list of numbers
+    :param fraction: which percentile, between 0 and 1
+    :return: the value below which that fraction of values lie, or None if
+             there aren't any
+    '''
+    if not values:
+        return None
+    return values[min(int(fraction * len(values)), len(values) - 1)]
+
+class JobStats(object):
+    '''
+    Timings and counts of a single job
+
+    seconds: how long the job took, from planning until its last chunk
+        came back, once it is done
+    phases: seconds spent in each phase (see PHASES), summed over chunks:
+        'planning' is timing foo() on samples, 'discovery' finding servers,
+        'pickling' and 'compression' preparing chunks to send, 'network'
+        sending chunks and results (their round trip, less the time the
+        servers spent on them), 'queue' chunks waiting for a worker on the
+        servers, 'loading' unpickling them there, 'compute' running foo()
+        there, 'unpickling' the results on this machine and 'local' chunks
+        run on this machine
+    bytes_sent: bytes of chunks sent, as they went over the wire
+    bytes_received: bytes of results received, as they went over the wire
+    chunks: number of chunks that came back
+    retries: number of chunks resent because their server failed or took
+        too long
+    resent: number of chunks sent again because their server was missing
+        the function or the data they refer to
+    reruns: number of chunks foo() failed on a server for, but not when
+        they were run again on this machine
+    servers: ip address of every server the job used -> dict of the
+        'chunks' it ran, 'elements' in them, 'failures' and round trip
+        'latencies' of its chunks, in seconds
+    '''
+    def __init__(self):
+        self.seconds = None
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.chunks = 0
+        self.retries = 0
+        self.resent = 0
+        self.reruns = 0
+        self.servers = dict()
+        self._started = timeit.default_timer()
+        self._lock = threading.Lock()
+
+    def add(self, phase, seconds):
+        '''
+        :param phase: one of PHASES
+        :param seconds: time spent in it
+        '''
+        with self._lock:
+            self.phases[phase] += seconds
+
+    def count(self, counter, amount = 1):
+        '''
+        :param counter: 'bytes_sent', 'bytes_received', 'retries', 
+                        'resent' or 'reruns'
+        :param amount: how much to add to it
+        '''
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + amount)
+
+    def _server(self, server):
+        '''
+        :return: the counts of a server, added if it is new. Only call it
+                 with the lock held
+        '''
+        counts = self.servers.get(server)
+        if counts is None:
+            counts = {'chunks': 0, 'elements': 0, 'failures': 0,
+                'latencies': list()}
+            self.servers[server] = counts
+        return counts
+
+    def chunk(self, server, elements, seconds):
+        '''
+        Counts a chunk that came back
+
+        :param server: ip address of the server that ran it, or None if it
+                       ran on this machine
+        :param elements: number of elements in the chunk
+        :param seconds: round trip time of the chunk
+        '''
+        with self._lock:
+            self.chunks += 1
+            if server is None:
+                self.phases['local'] += seconds
+                return
+            counts = self._server(server)
+            counts['chunks'] += 1
+            counts['elements'] += elements
+            counts['latencies'].append(seconds)
+
+    def failed(self, server):
+        '''
+        :param server: ip address of a server a chunk failed or timed out on
+        '''
+        with self._lock:
+            self._server(server)['failures'] += 1
+
+    def served(self, timing):
+        '''
+        Adds the times a server reports for a chunk it ran
+
+        :param timing: dict of the seconds the chunk spent in the 'queue',
+                       'loading' and 'compute' phases
+        '''
+        with self._lock:
+            for phase, seconds in timing.items():
+                self.phases[phase] += seconds
+
+    def finish(self):
+        '''
+        Records how long the job took, from when these stats were made
+        '''
+        self.seconds = timeit.default_timer() - self._started
+
+    def summary(self):
+        '''
+        :return: the stats as a dict of plain values (which json.dumps()
+                 takes), with the median, 99th percentile and slowest round
+                 trip per server rather than every one of them
+        '''
+        with self._lock:
+            servers = dict()
+            for server, counts in self.servers.items():
+                latencies = sorted(counts['latencies'])
+                servers[server] = {'chunks': counts['chunks'],
+                    'elements': counts['elements'],
+                    'failures': counts['failures'],
+                    'seconds_p50': _percentile(latencies, 0.5),
+                    'seconds_p99': _percentile(latencies, 0.99),
+                    'seconds_max': latencies[-1] if latencies else None}
+            return {'seconds': self.seconds, 'phases': dict(self.phases),
+                'bytes_sent': self.bytes_sent,
+                'bytes_received': self.bytes_received,
+                'chunks': self.chunks, 'retries': self.retries,
+                'resent': self.resent, 'reruns': self.reruns,
+                'servers': servers}
+
+    def __str__(self):
+        summary = self.summary()
+        lines = ['job took %ss' % ('%.3f' % summary['seconds']
+            if summary['seconds'] is not None else '?')]
+        for phase in PHASES:
+            lines.append('  %-12s %10.4fs' % (phase, summary['phases'][phase]))
+        lines.append('  %d chunks, %d retried, %d resent, %d rerun, '
+            '%d bytes sent, %d received' % (summary['chunks'], 
+            summary['retries'], summary['resent'], summary['reruns'],
+            summary['bytes_sent'], summary['bytes_received']))
+        for server in sorted(summary['servers']):
+            counts = summary['servers'][server]
+            lines.append('  %-15s %5d chunks %5d failed  p50 %s  p99 %s' % (
+                server, counts['chunks'], counts['failures'],
+                '%.4fs' % counts['seconds_p50']
+                if counts['seconds_p50'] is not None else '-',
+                '%.4fs' % counts['seconds_p99']
+                if counts['seconds_p99'] is not None else '-'))
+        return '\n'.join(lines)
+
+class _Raw_Profile(object):
+    '''
+    The raw stats of a profile sent back with a chunk, in the shape
+    pstats.Stats takes profilers in
+    '''
+    def __init__(self, stats):
+        '''
+        :param stats: dict of raw stats, as cProfile.Profile.stats holds them
+        '''
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+class Profile(pstats.Stats):
+    '''
+    The profile of foo() over every chunk of a job, wherever the chunks ran.
+    It is a pstats.Stats, so sort_stats(), print_stats() and dump_stats()
+    work on it like on any other profile. Times add up over chunks that ran
+    at the same time on different cores and servers
+    '''
+    def __init__(self):
+        pstats.Stats.__init__(self)
+        self._lock = threading.Lock()
+
+    def load_stats(self, arg):
+        # pstats.Stats refuses to be empty, but the profile of a job starts
+        # out as that of no chunks at all
+        if arg is None:
+            self.stats = dict()
+            return
+        pstats.Stats.load_stats(self, arg)
+
+    def merge(self, stats):
+        '''
+        :param stats: raw stats of a chunk's profile (see 
+                      helpers._profile_op())
+        '''
+        with self._lock:
+            self.add(_Raw_Profile(stats))
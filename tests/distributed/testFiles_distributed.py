@@ -0,0 +1,38 @@
+'''
+Ensures correctness for jobs over files (see files.py) on the servers 
+using the PyUnit (unittest) package
+'''
+
+import os # builds the path of the file to read
+import shutil # cleans up the file
+import tempfile # gives us a directory to write the file to
+import unittest # our test package
+from parallelogram.config import PORT # PORT on which the server should listen
+from parallelogram import parallelogram # library methods 
+from parallelogram import files # the files jobs run over
+
+class TestFiles_Distributed(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_files_1(self):
+        '''
+        Test that the servers index lines by the byte offset they start 
+        at, just like a job run on this machine does
+        '''
+        text = ''.join('line %d%s\n' % (number, 'x' * (number % 7))
+            for number in xrange(20000))
+        path = os.path.join(self.directory, 'lines.txt')
+        with open(path, 'wb') as written:
+            written.write(text)
+        lines = files.Lines(path)
+        foo = lambda elt, index: (index, elt)
+        output, plan = parallelogram.p_map(foo, lines, PORT, 10, 
+            explain = True, backend = 'distributed')
+        self.assertEqual(plan.backend, 'distributed')
+        self.assertEqual(output, parallelogram.p_map(foo, lines, PORT, 10,
+            backend = 'local'))
@@ -0,0 +1,59 @@
+'''
+Ensures correctness for batch mode (_batch_map() and _batch_filter()) using
+the PyUnit (unittest) package
+'''
+
+import numpy # batch mode keeps arrays as arrays
+import unittest # our test package
+from parallelogram import helpers # exposes the functions to test
+from parallelogram.config import PORT # port the p_* functions are given
+from parallelogram import parallelogram # library methods
+
+def foo_1(chunk, indices):
+	'''
+	Adds every element's index to it
+	'''
+	return chunk + numpy.asarray(indices)
+
+class TestBatch(unittest.TestCase):
+
+	def test_batch_1(self):
+		'''
+		Test that a batch map gets the indices of the chunk in the whole list
+		'''
+		def foo_2(chunk, indices):
+			'''
+			Pairs every element with its index
+			'''
+			return zip(chunk, indices)
+
+		output = helpers._batch_map(foo_2, ['a', 'b'], 5)
+		self.assertEqual(output, [('a', 5), ('b', 6)])
+
+	def test_batch_2(self):
+		'''
+		Test that a batch filter keeps arrays as arrays and lists as lists
+		'''
+		def foo_2(chunk, indices):
+			'''
+			Keeps the even elements
+			'''
+			return [elt % 2 == 0 for elt in chunk]
+
+		output = helpers._batch_filter(foo_2, numpy.arange(10))
+		self.assertTrue(isinstance(output, numpy.ndarray))
+		self.assertEqual(output.tolist(), [0, 2, 4, 6, 8])
+		output = helpers._batch_filter(foo_2, range(10))
+		self.assertEqual(output, [0, 2, 4, 6, 8])
+
+	def test_batch_3(self):
+		'''
+		Test that arrays mapped in batch mode come back as a single array
+		'''
+		output = helpers._join([numpy.arange(3), numpy.arange(3, 5)])
+		self.assertEqual(output.tolist(), range(5))
+		output, plan = parallelogram.p_map(foo_1, numpy.arange(10000), PORT, 
+			10, explain = True, backend = 'local', batch = True)
+		self.assertTrue(isinstance(output, numpy.ndarray))
+		self.assertEqual(plan.backend, 'local')
+		self.assertEqual(output.tolist(), range(0, 20000, 2))
@@ -0,0 +1,43 @@
+'''
+Ensures correctness for _LRU_Cache using the PyUnit (unittest) package
+'''
+
+import unittest # our test package
+from parallelogram import helpers # exposes the class to test
+
+class TestCache(unittest.TestCase):
+
+	def test_cache_1(self):
+		'''
+		Test that cached values come back and missing ones don't
+		'''
+		cache = helpers._LRU_Cache(100)
+		cache.put('a', 1, 10)
+		self.assertEqual(cache.get('a'), 1)
+		self.assertEqual(cache.get('b'), None)
+		self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+	def test_cache_2(self):
+		'''
+		Test that the least recently used entry is evicted first
+		'''
+		cache = helpers._LRU_Cache(100)
+		cache.put('a', 1, 40)
+		cache.put('b', 2, 40)
+		# using 'a' makes 'b' the least recently used entry
+		cache.get('a')
+		cache.put('c', 3, 40)
+		self.assertTrue('a' in cache)
+		self.assertFalse('b' in cache)
+		self.assertTrue('c' in cache)
+		self.assertEqual(cache.nbytes, 80)
+
+	def test_cache_3(self):
+		'''
+		Ensure that a value bigger than the whole cache isn't cached
+		'''
+		cache = helpers._LRU_Cache(100)
+		cache.put('a', 1, 40)
+		cache.put('b', 2, 400)
+		self.assertFalse('b' in cache)
+		self.assertTrue('a' in cache)
@@ -0,0 +1,105 @@
+'''
+Ensures correctness for the client loop that drives every _Connection using
+the PyUnit (unittest) package. A plain listening socket stands in for the 
+server
+'''
+
+import Queue # collects the responses handed to callbacks
+import socket # the fake server listens on a socket
+import threading # the fake server answers from its own thread
+import unittest # our test package
+from parallelogram import helpers # exposes the functions to test
+
+def _fake_server(answer):
+	'''
+	Starts a server that accepts one connection and calls answer() with it 
+
+	:param answer: function that reads and answers frames on the connection
+	:return: port the server listens on
+	'''
+	listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+	listener.bind(('127.0.0.1', 0))
+	listener.listen(1)
+	def serve():
+		sock, _ = listener.accept()
+		listener.close()
+		try:
+			answer(sock)
+		finally:
+			sock.close()
+	thread = threading.Thread(target = serve)
+	thread.daemon = True
+	thread.start()
+	return listener.getsockname()[1]
+
+class TestClientLoop(unittest.TestCase):
+
+	def test_client_loop_1(self):
+		'''
+		Test that many requests in flight on one connection, some too big
+		to send at once, each get their own response even out of order
+		'''
+		def answer(sock):
+			frames = [helpers._recv_frame(sock) for _ in xrange(20)]
+			for _, job_id, request_id, payload in reversed(frames):
+				helpers._send_frame(sock, helpers.MSG_RESULT, job_id, 
+					request_id, str(payload)[::-1])
+		connection = helpers._Connection('127.0.0.1', _fake_server(answer), 
+			5)
+		responses = Queue.Queue()
+		payloads = [str(n) * (n * 100000) for n in xrange(1, 21)]
+		for payload in payloads:
+			connection.request_async(7, payload, 5, 
+				lambda msg_type, response, payload = payload: 
+					responses.put((payload, msg_type, str(response))))
+		for _ in payloads:
+			payload, msg_type, response = responses.get(timeout = 5)
+			self.assertEqual(msg_type, helpers.MSG_RESULT)
+			self.assertEqual(response, payload[::-1])
+		connection.close()
+
+	def test_client_loop_2(self):
+		'''
+		Ensure that a request nobody answers times out without holding up 
+		the others, and that its late response is dropped
+		'''
+		def answer(sock):
+			_, job_id, late_id, _ = helpers._recv_frame(sock)
+			_, job_id, request_id, _ = helpers._recv_frame(sock)
+			helpers._send_frame(sock, helpers.MSG_RESULT, job_id, 
+				request_id, 'fast')
+			helpers._recv_frame(sock)
+			helpers._send_frame(sock, helpers.MSG_RESULT, job_id, late_id,
+				'late')
+		connection = helpers._Connection('127.0.0.1', _fake_server(answer), 
+			5)
+		responses = Queue.Queue()
+		connection.request_async(1, 'slow', 0.2, 
+			lambda *response: responses.put(('slow',) + response))
+		self.assertEqual(connection.request(1, 'fast', 5), 
+			(helpers.MSG_RESULT, bytearray('fast')))
+		self.assertEqual(responses.get(timeout = 5), ('slow', None, None))
+		connection.request_async(1, 'last', 0.2, 
+			lambda *response: responses.put(('last',) + response))
+		self.assertEqual(responses.get(timeout = 5), ('last', None, None))
+		connection.close()
+
+	def test_client_loop_3(self):
+		'''
+		Test that requests fail once the server hangs up, and that 
+		connecting to a port nobody listens on fails
+		'''
+		connection = helpers._Connection('127.0.0.1', 
+			_fake_server(helpers._recv_frame), 5)
+		self.assertRaises(RuntimeError, connection.request, 1, 'chunk', 5)
+		self.assertTrue(connection.closed)
+		self.assertRaises(RuntimeError, connection.request, 1, 'chunk', 5)
+		listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		listener.bind(('127.0.0.1', 0))
+		port = listener.getsockname()[1]
+		listener.close()
+		try:
+			connection = helpers._Connection('127.0.0.1', port, 5)
+		except socket.error:
+			return
+		self.assertRaises(RuntimeError, connection.request, 1, 'chunk', 5)
@@ -0,0 +1,68 @@
+'''
+Ensures correctness for compressed messages (helpers._Compressor and the
+codecs frames can be compressed with) using the PyUnit (unittest) package
+'''
+
+import os # makes data that doesn't compress
+import socket # gives us a connected pair of sockets to talk over
+import unittest # our test package
+from parallelogram import helpers # exposes the functions to test
+from parallelogram import planner # counts the bytes of a job
+
+class TestCompression(unittest.TestCase):
+
+	def setUp(self):
+		self.sender, self.receiver = socket.socketpair()
+
+	def tearDown(self):
+		self.sender.close()
+		self.receiver.close()
+
+	def test_compression_1(self):
+		'''
+		Test that frames compressed with every codec arrive as they were
+		sent, and that data compressing doesn't shrink is sent as is
+		'''
+		payload = helpers._join_parts(helpers._dump_parts(range(5000)))
+		for codec in helpers._CODECS:
+			flags, compressed = helpers._compress(codec, payload)
+			self.assertNotEqual(flags, 0)
+			self.assertTrue(len(compressed) < len(payload))
+			helpers._send_frame(self.sender, helpers.MSG_CHUNK, 1, 2,
+				compressed, flags)
+			_, _, _, received = helpers._recv_frame(self.receiver)
+			self.assertEqual(str(received), payload)
+		noise = os.urandom(10000)
+		self.assertEqual(helpers._compress('zlib', noise), (0, noise))
+
+	def test_compression_2(self):
+		'''
+		Ensure that automatic compression is used over slow links but not
+		over fast ones, and never for data that doesn't compress
+		'''
+		compressor = helpers._Compressor('auto')
+		parts = helpers._dump_parts(range(50000))
+		self.assertEqual(compressor.choose(parts, 10**6), 'zlib')
+		self.assertEqual(compressor.choose(parts, 10**15), None)
+		compressor = helpers._Compressor('auto')
+		self.assertEqual(compressor.choose([os.urandom(50000)], 10**6), None)
+
+	def test_compression_3(self):
+		'''
+		Ensure that a job asked to compress with a codec does so whatever
+		the link, one asked not to never does, and that the bytes before and
+		after compression are counted
+		'''
+		plan = planner.Plan(len, range(100), 'map', compression = 'bz2')
+		compressor = helpers._Compressor(plan.compression, plan)
+		parts = helpers._dump_parts(range(50000))
+		codec = compressor.choose(parts, 10**15)
+		self.assertEqual(codec, 'bz2')
+		flags, encoded = compressor.encode(parts, codec)
+		self.assertEqual(flags, helpers._CODECS['bz2'][0])
+		size = sum(len(part) for part in parts)
+		self.assertEqual(plan.bytes_before, size)
+		self.assertEqual(plan.bytes_after, len(encoded[0]))
+		self.assertEqual(helpers._Compressor(None).choose(parts, 1), None)
+		self.assertRaises(ValueError, planner.Plan, len, range(100), 'map',
+			compression = 'snappy')
@@ -0,0 +1,75 @@
+'''
+Ensures correctness for datasets cached on servers (helpers._Chunk_Store,
+cache.Handle and how chunks of cached data are scheduled) using the PyUnit
+(unittest) package
+'''
+
+import os # lists the chunks spilled to disk
+import shutil # cleans up the spill directory
+import tempfile # gives us a directory to spill chunks to
+import unittest # our test package
+from parallelogram import helpers # exposes the functions to test
+from parallelogram import planner # plans jobs over cached data
+from parallelogram import cache # the class to test
+
+class TestDataCache(unittest.TestCase):
+
+	def setUp(self):
+		self.spill_dir = tempfile.mkdtemp()
+
+	def tearDown(self):
+		shutil.rmtree(self.spill_dir)
+
+	def test_data_cache_1(self):
+		'''
+		Test that chunks that don't fit in memory are spilled to disk and
+		read back, and that dropping a dataset deletes its spilled chunks
+		'''
+		store = helpers._Chunk_Store(250, self.spill_dir)
+		for index in xrange(5):
+			store.put((7, index), str(index) * 100)
+		store.put((8, 0), 'x' * 100)
+		self.assertEqual(len(os.listdir(self.spill_dir)), 4)
+		for index in xrange(5):
+			self.assertEqual(store.get((7, index)), str(index) * 100)
+		store.drop(7)
+		self.assertEqual(store.get((7, 0)), None)
+		self.assertEqual(store.get((8, 0)), 'x' * 100)
+		self.assertEqual(os.listdir(self.spill_dir), [])
+		self.assertEqual(helpers._Chunk_Store(250).get((8, 0)), None)
+
+	def test_data_cache_2(self):
+		'''
+		Ensure that jobs over a handle get the chunks the data was cached
+		in, whatever their plan says, and don't count the cached data
+		towards the bytes each element costs on the wire
+		'''
+		handle = cache.Handle(range(10), 3, [4, 4, 2], ['a', 'b', None],
+			1001)
+		plan = planner.Plan(lambda elt, index: elt, handle, 'map')
+		self.assertTrue(plan.cached)
+		self.assertTrue(plan.bytes_per_element <
+			planner.Plan(lambda elt, index: elt, range(10), 'map')
+			.bytes_per_element)
+		chunker = handle.chunker()
+		chunks = [chunker.next_chunk(plan) for _ in xrange(4)]
+		self.assertEqual(chunks, [(0, [0, 1, 2, 3]), (4, [4, 5, 6, 7]),
+			(8, [8, 9]), None])
+		self.assertEqual(chunker.owner(1), 'b')
+		chunker.set_owner(2, 'a')
+		self.assertEqual(handle.owners, ['a', 'b', 'a'])
+		self.assertEqual(handle[2:4], [2, 3])
+
+	def test_data_cache_3(self):
+		'''
+		Ensure that chunks go to the server holding them, however busy it
+		is, unless it mustn't get them
+		'''
+		scheduler = helpers._Scheduler([('a', -2, 0.001), ('b', -2, 0.001)])
+		for index in xrange(6):
+			self.assertEqual(scheduler.assign(index, 10, prefer = 'a'), 'a')
+		self.assertEqual(scheduler.assign(6, 10, prefer = 'a', idle = True),
+			'b')
+		self.assertEqual(scheduler.assign(7, 10, prefer = 'c'), 'b')
+		self.assertEqual(scheduler.assign(8, 10, exclude = ['a'],
+			prefer = 'a'), 'b')
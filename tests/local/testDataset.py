@@ -0,0 +1,52 @@
+'''
+Ensures correctness for fused pipelines (dataset.Dataset and
+helpers._run_pipeline) using the PyUnit (unittest) package
+'''
+
+import operator # gives us a function to reduce with
+import unittest # our test package
+from parallelogram import helpers # exposes the functions to test
+from parallelogram.dataset import Dataset # the class to test
+
+class TestDataset(unittest.TestCase):
+
+	def test_dataset_1(self):
+		'''
+		Test that a chunk goes through every step, and that elements keep
+		their index in the whole list after a filter
+		'''
+		stages = [('filter', lambda elt, index: elt % 2, False),
+			('map', lambda elt, index: (elt, index), False),
+			('reduce', operator.add, False)]
+		self.assertEqual(helpers._run_pipeline(stages, range(6), 10),
+			[(1, 11, 3, 13, 5, 15)])
+		stages = [('filter', lambda elt, index: elt > 9, False),
+			('map', lambda chunk, indices: list(indices), True)]
+		self.assertEqual(helpers._run_pipeline(stages, range(6, 12), 6),
+			[10, 11])
+		stages[-1] = ('reduce', operator.add, False)
+		self.assertEqual(helpers._run_pipeline(stages, range(6), 0), [])
+
+	def test_dataset_2(self):
+		'''
+		Ensure that chained steps give what running them one by one does,
+		and that adding a step leaves the Dataset it was added to as is
+		'''
+		data = Dataset(range(1000), 1001, 10, backend = 'local')
+		doubled = data.map(lambda elt, index: elt * 2)
+		kept = doubled.filter(lambda elt, index: elt % 3 == 0)
+		expected = [elt * 2 for elt in range(1000) if elt * 2 % 3 == 0]
+		self.assertEqual(kept.collect(), expected)
+		self.assertEqual(kept.reduce(operator.add), sum(expected))
+		self.assertEqual(list(kept), expected)
+		self.assertEqual(doubled.collect(), range(0, 2000, 2))
+		self.assertEqual(data.collect(), range(1000))
+
+	def test_dataset_3(self):
+		'''
+		Ensure that reducing a Dataset its steps leave empty raises a
+		TypeError, like reduce() does
+		'''
+		data = Dataset(range(100), 1001, 10, backend = 'local')
+		self.assertRaises(TypeError,
+			data.filter(lambda elt, index: False).reduce, operator.add)
@@ -0,0 +1,155 @@
+'''
+Ensures correctness for jobs over files (files.Lines, files.Records,
+files.Npy and how helpers cuts them into byte ranges) using the PyUnit
+(unittest) package
+'''
+
+import os # builds the paths of the files to read
+import Queue # collects the chunks the local worker pool is done with
+import cPickle as pickle # builds the messages servers are sent
+import shutil # cleans up the files
+import tempfile # gives us a directory to write files to
+import unittest # our test package
+import numpy # writes the .npy file to read
+from parallelogram.config import PORT # port the p_* functions are given
+from parallelogram import parallelogram # runs jobs over the files
+from parallelogram import helpers # exposes the functions to test
+from parallelogram import planner # sizes the ranges files are cut into
+from parallelogram import files # the classes to test
+
+class TestFiles(unittest.TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	def write(self, name, contents):
+		path = os.path.join(self.directory, name)
+		with open(path, 'wb') as written:
+			written.write(contents)
+		return path
+
+	def test_files_1(self):
+		'''
+		Test that ranges of a text file cut anywhere hold every line once,
+		whether or not the file ends with a newline
+		'''
+		for text in ('ab\ncd\n\nefg\n', 'ab\ncd\n\nefg'):
+			source = files.Lines(self.write('lines.txt', text)).source
+			lines = list()
+			for start in xrange(0, len(text), 3):
+				lines.extend(helpers._read_source(dict(source, start = start,
+					stop = start + 3)))
+			self.assertEqual(lines, ['ab', 'cd', '', 'efg'])
+		self.assertEqual(files.Lines(self.write('lines.txt', text))[:2],
+			['ab', 'cd'])
+		self.assertEqual(files.Lines(self.write('empty.txt', '')).chunker()
+			.next_chunk(None), None)
+
+	def test_files_2(self):
+		'''
+		Ensure that slices of fixed-width records and .npy files read the
+		records in them, as strings or as writable rows of an array
+		'''
+		records = files.Records(self.write('records.bin', 'abcdefghij'), 3)
+		self.assertEqual(len(records), 3)
+		self.assertEqual(records[1:5], ['def', 'ghi'])
+		array = numpy.arange(24, dtype = numpy.float32).reshape(6, 2, 2)
+		path = os.path.join(self.directory, 'array.npy')
+		numpy.save(path, array)
+		rows = files.Npy(path)
+		self.assertEqual(len(rows), 6)
+		self.assertTrue((rows[2:4] == array[2:4]).all())
+		self.assertTrue(rows[2:4].flags.writeable)
+		floats = files.Records(path, 8, numpy.float32)
+		self.assertEqual(floats.source['shape'], (2,))
+		self.assertRaises(ValueError, files.Records, path, 6, numpy.float32)
+		self.assertRaises(TypeError, rows.__getitem__, 1)
+
+	def test_files_3(self):
+		'''
+		Ensure that a file is cut into ranges of whole records, indexed by
+		their first record, and that the bytes sent to servers without the
+		file read the same as the file does
+		'''
+		array = numpy.arange(1000, dtype = numpy.int64)
+		path = os.path.join(self.directory, 'array.npy')
+		numpy.save(path, array)
+		rows = files.Npy(path)
+		plan = planner.Plan(lambda elt, index: elt, rows, 'map')
+		chunker = rows.chunker()
+		chunks = list()
+		while True:
+			chunk = chunker.next_chunk(plan)
+			if chunk is None:
+				break
+			chunks.append(chunk)
+		self.assertEqual([index for index, _ in chunks],
+			[int(chunk.read()[0]) for _, chunk in chunks])
+		self.assertTrue((numpy.concatenate([chunk.read()
+			for _, chunk in chunks]) == array).all())
+		_, chunk = chunks[-1]
+		self.assertTrue((helpers._read_source(chunk.source, chunk.raw()) ==
+			chunk.read()).all())
+		self.assertTrue(helpers._has_file(chunk.source))
+		self.assertFalse(helpers._has_file(dict(chunk.source,
+			path = path + '.missing')))
+
+	def test_files_4(self):
+		'''
+		Ensure that lines are indexed by the byte offset they start at, 
+		whether the job runs right here, in the local worker pool, or on
+		servers that have the file or are sent its bytes
+		'''
+		text = ''.join('line %d%s\n' % (number, 'x' * (number % 7))
+			for number in xrange(20000))
+		lines = files.Lines(self.write('lines.txt', text))
+		expected = list()
+		offset = 0
+		for line in text.splitlines():
+			expected.append((offset, line))
+			offset += len(line) + 1
+		foo = lambda elt, index: (index, elt)
+		for backend, ran in (('auto', 'single'), ('local', 'local')):
+			output, plan = parallelogram.p_map(foo, lines, PORT, 10,
+				explain = True, backend = backend)
+			self.assertEqual(plan.backend, ran)
+			self.assertEqual(output, expected)
+		self.assertTrue(len(plan.chunk_sizes) > 1)
+		func_bytes, digest = helpers._pickle_func(foo)
+		for raw in (False, True):
+			served = list()
+			chunker = lines.chunker()
+			while True:
+				chunk = chunker.next_chunk(plan)
+				if chunk is None:
+					break
+				start, chunk = chunk
+				envelope = {'func_digest': digest, 'op': 'map', 'index': 0,
+					'start': start, 'batch': False, 'source': chunk.source,
+					'raw': raw, 'profile': False}
+				parts = [pickle.dumps(envelope)]
+				if raw:
+					parts.append(chunk.raw())
+				message, _ = helpers._process_chunk(digest, func_bytes,
+					helpers._join_parts(parts), 0)
+				served.extend(helpers._load_parts(bytearray(message))['chunk'])
+			self.assertEqual(served, expected)
+
+	def test_files_5(self):
+		'''
+		Ensure that the local worker pool reads the ranges of files it is 
+		handed and processes them itself, rather than failing them
+		'''
+		text = 'ab\ncd\n\nefg\n'
+		lines = files.Lines(self.write('lines.txt', text))
+		plan = planner.Plan(lambda elt, index: elt, lines, 'map')
+		start, chunk = lines.chunker().next_chunk(plan)
+		done = Queue.Queue()
+		helpers._submit_local(helpers._get_local_pool(2), done,
+			helpers._pickle_func(lambda elt, index: (index, elt)), chunk,
+			'map', 0, start, False)
+		self.assertEqual(done.get(timeout = 10),
+			(0, None, True, [(0, 'ab'), (3, 'cd'), (6, ''), (7, 'efg')]))
@@ -0,0 +1,78 @@
+'''
+Ensures correctness for future.Future and the asynchronous p_*_async() 
+functions using the PyUnit (unittest) package
+'''
+
+import time # lets us fake an expensive function
+import unittest # our test package
+from parallelogram import future # exposes the class to test
+from parallelogram.config import PORT # port the p_* functions are given
+from parallelogram import parallelogram # library methods
+
+def foo_1(elt, index):
+	'''
+	Increments an element by 1
+	'''
+	return elt + 1
+
+def foo_2(elt, index):
+	'''
+	Increments an element by 1, slowly
+	'''
+	time.sleep(0.01)
+	return elt + 1
+
+class TestFuture(unittest.TestCase):
+
+	def test_future_1(self):
+		'''
+		Test that jobs started together all finish with the right results
+		'''
+		futures = [parallelogram.p_map_async(foo_1, range(100), PORT, 10,
+			backend = 'local') for _ in range(3)]
+		futures.append(parallelogram.p_reduce_async(lambda elt1, elt2: 
+			elt1 + elt2, range(100), PORT, 10, backend = 'local'))
+		for job in futures[:3]:
+			self.assertEqual(job.result(10), range(1, 101))
+		self.assertEqual(futures[3].result(10), sum(range(100)))
+		self.assertTrue(all(job.done() for job in futures))
+
+	def test_future_2(self):
+		'''
+		Test that a future can only be cancelled before it is done, and that
+		callbacks see it done
+		'''
+		job = future.Future()
+		seen = list()
+		job.add_done_callback(seen.append)
+		self.assertTrue(job.cancel())
+		self.assertTrue(job.cancelled())
+		self.assertEqual(seen, [job])
+		self.assertRaises(future.CancelledError, job.result)
+		job = future.Future()
+		job._set_result(3)
+		self.assertFalse(job.cancel())
+		self.assertEqual(job.result(), 3)
+
+	def test_future_3(self):
+		'''
+		Ensure that a job running over its time is stopped
+		'''
+		job = parallelogram.p_map_async(foo_2, range(1000), PORT, 10,
+			job_timeout = 0.2, backend = 'local')
+		self.assertRaises(future.TimeoutError, job.result, 10)
+		self.assertTrue(job.plan.cancelled)
+		self.assertTrue(sum(job.plan.chunk_sizes) < 1000)
+
+	def test_future_4(self):
+		'''
+		Test that a job's plan, stats and profile are on its future
+		'''
+		job = parallelogram.p_map_async(foo_1, range(1000), PORT, 10,
+			backend = 'local', profile = True)
+		self.assertEqual(job.result(10), range(1, 1001))
+		self.assertEqual(job.plan.backend, 'local')
+		self.assertEqual(job.plan.stats.chunks, len(job.plan.chunk_sizes))
+		self.assertTrue(job.plan.stats.seconds is not None)
+		self.assertTrue('foo_1' in [function for _, _, function 
+			in job.plan.profile.stats])
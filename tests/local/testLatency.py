@@ -0,0 +1,58 @@
+'''
+Ensures correctness for the latency percentiles planner.Plan judges chunks
+in flight by, using the PyUnit (unittest) package
+'''
+
+import unittest # our test package
+from parallelogram import planner # exposes the class to test
+
+def foo_1(elt, index):
+	'''
+	Increments an element by 1
+	'''
+	return elt + 1
+
+class TestLatency(unittest.TestCase):
+
+	def test_latency_1(self):
+		'''
+		Ensure that the caller's timeout is used until enough chunks have
+		completed
+		'''
+		plan = planner.Plan(foo_1, range(1000), 'map')
+		plan.sent(10)
+		for _ in xrange(planner.LATENCY_SAMPLES - 1):
+			plan.observe(10, 0.5)
+		self.assertEqual(plan.expected_seconds(10), None)
+		self.assertEqual(plan.chunk_timeout(10, 30), 30)
+
+	def test_latency_2(self):
+		'''
+		Test that a few slow chunks don't move the percentile, and that the
+		expected time scales with the size of the chunk
+		'''
+		plan = planner.Plan(foo_1, range(1000), 'map')
+		plan.sent(100)
+		for _ in xrange(95):
+			plan.observe(100, 1.0)
+		for _ in xrange(5):
+			plan.observe(100, 50.0)
+		self.assertAlmostEqual(plan.expected_seconds(100), 1.0)
+		self.assertAlmostEqual(plan.expected_seconds(300), 3.0)
+
+	def test_latency_3(self):
+		'''
+		Test that chunk timeouts follow the percentile, but never drop below
+		MIN_CHUNK_TIMEOUT
+		'''
+		plan = planner.Plan(foo_1, range(1000), 'map')
+		plan.sent(10)
+		for _ in xrange(planner.LATENCY_SAMPLES):
+			plan.observe(10, 2.0)
+		self.assertAlmostEqual(plan.chunk_timeout(10, 30), 
+			2.0 * planner.CHUNK_TIMEOUT_FACTOR)
+		plan = planner.Plan(foo_1, range(1000), 'map')
+		plan.sent(10)
+		for _ in xrange(planner.LATENCY_SAMPLES):
+			plan.observe(10, 0.001)
+		self.assertEqual(plan.chunk_timeout(10, 30), planner.MIN_CHUNK_TIMEOUT)
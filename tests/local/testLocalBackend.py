@@ -0,0 +1,161 @@
+'''
+Ensures correctness for the local backend of p_map(), p_filter() and
+p_reduce() using the PyUnit (unittest) package
+'''
+
+import Queue # collects the chunks the local worker pool is done with
+import time # lets us fake an expensive function
+import threading # gives foo() something that can't be pickled to return
+import unittest # our test package
+from parallelogram.config import PORT # port the p_* functions are given
+from parallelogram import parallelogram # library methods
+from parallelogram import helpers # hands chunks to the local worker pool
+
+def foo_1(elt, index):
+	'''
+	Increments an element by 1
+	'''
+	return elt + 1
+
+def foo_2(elt1, elt2):
+	'''
+	Sums two elements
+	'''
+	return elt1 + elt2
+
+def foo_3(elt, index):
+	'''
+	Fails on a single element
+	'''
+	if elt == 500:
+		raise ZeroDivisionError
+	return elt
+
+def foo_4(elt, index):
+	'''
+	Returns an element, slowly
+	'''
+	time.sleep(0.2)
+	return elt
+
+def foo_5(elt, index):
+	'''
+	Returns a lock, which can't be pickled, for a single element
+	'''
+	if elt == 5000:
+		return threading.Lock()
+	return elt
+
+class TestLocalBackend(unittest.TestCase):
+
+	def test_local_backend_1(self):
+		'''
+		Test that a map asked to run locally runs in the local worker pool,
+		where every chunk succeeds
+		'''
+		output, plan = parallelogram.p_map(foo_1, range(1000), PORT, 10,
+			explain = True, backend = 'local')
+		self.assertEqual(output, range(1, 1001))
+		self.assertEqual(plan.backend, 'local')
+		self.assertEqual(sum(plan.chunk_sizes), 1000)
+		self.assertEqual(plan.stats.chunks, len(plan.chunk_sizes))
+		self.assertEqual(plan.stats.reruns, 0)
+
+	def test_local_backend_2(self):
+		'''
+		Test a reduction and a filter in the local worker pool
+		'''
+		output = parallelogram.p_reduce(foo_2, range(1000), PORT, 10,
+			backend = 'local')
+		self.assertEqual(output, sum(range(1000)))
+		output = parallelogram.p_filter(lambda elt, index: elt % 2 == 0,
+			range(1000), PORT, 10, backend = 'local')
+		self.assertEqual(output, range(0, 1000, 2))
+
+	def test_local_backend_3(self):
+		'''
+		Ensure that errors raised by foo() in a worker reach the caller
+		'''
+		with self.assertRaises(ZeroDivisionError):
+			parallelogram.p_map(foo_3, range(1000), PORT, 10,
+				backend = 'local')
+
+	def test_local_backend_4(self):
+		'''
+		Ensure that the local worker pool processes the chunks it is handed
+		itself, rather than failing them
+		'''
+		done = Queue.Queue()
+		helpers._submit_local(helpers._get_local_pool(2), done,
+			helpers._pickle_func(foo_1), [1, 2, 3], 'map', 0, 0, False)
+		self.assertEqual(done.get(timeout = 10), (0, None, True, [2, 3, 4]))
+
+	def test_local_backend_5(self):
+		'''
+		Ensure that a chunk failing in the local worker pool, but not when 
+		run in this process, raises an error rather than being run here
+		'''
+		submit = helpers._submit_local
+		def fail(pool, done, func, chunk, op, index, *args):
+			done.put((index, None, False, 'Traceback: the worker failed'))
+		helpers._submit_local = fail
+		try:
+			with self.assertRaises(RuntimeError):
+				parallelogram.p_map(foo_1, range(1000), PORT, 10,
+					backend = 'local')
+		finally:
+			helpers._submit_local = submit
+
+	def test_local_backend_6(self):
+		'''
+		Ensure that a busy worker pool queues chunks up until a worker is 
+		free, rather than making whoever hands them over wait
+		'''
+		pool = helpers._Worker_Pool(1)
+		try:
+			done = Queue.Queue()
+			func = helpers._pickle_func(foo_4)
+			started = time.time()
+			for index in xrange(3):
+				helpers._submit_local(pool, done, func, [index], 'map', index,
+					index, False)
+			self.assertTrue(time.time() - started < 0.2)
+			self.assertEqual(pool.waiting(), 2)
+			self.assertEqual(sorted(done.get(timeout = 10) 
+				for _ in xrange(3)), [(index, None, True, [index]) 
+				for index in xrange(3)])
+			self.assertEqual(pool.waiting(), 0)
+			self.assertEqual(pool.free_slots(), 1)
+		finally:
+			pool.close()
+
+	def test_local_backend_7(self):
+		'''
+		Ensure that a chunk whose result can't be pickled comes back as an
+		error, and that its worker goes on to process the next chunk
+		'''
+		pool = helpers._Worker_Pool(1)
+		try:
+			done = Queue.Queue()
+			func = helpers._pickle_func(foo_5)
+			helpers._submit_local(pool, done, func, [4999, 5000], 'map', 0,
+				0, False)
+			helpers._submit_local(pool, done, func, [1, 2], 'map', 1, 2, 
+				False)
+			index, _, succeeded, error = done.get(timeout = 10)
+			self.assertEqual((index, succeeded), (0, False))
+			self.assertTrue('Traceback' in error)
+			self.assertEqual(done.get(timeout = 10), (1, None, True, [1, 2]))
+			self.assertEqual(pool.free_slots(), 1)
+		finally:
+			pool.close()
+
+	def test_local_backend_8(self):
+		'''
+		Ensure that a map whose results can't all be pickled back from the
+		local worker pool raises an error rather than waiting forever
+		'''
+		with self.assertRaises(RuntimeError) as raised:
+			parallelogram.p_map(foo_5, range(10000), PORT, 5, 
+				backend = 'local')
+		self.assertTrue('local worker pool' in str(raised.exception))
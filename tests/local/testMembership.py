@@ -0,0 +1,98 @@
+'''
+Ensures correctness for server heartbeats and the _Membership clients keep
+from them, using the PyUnit (unittest) package
+'''
+
+import time # waits for heartbeats to arrive
+import unittest # our test package
+from parallelogram import helpers # exposes the classes to test
+
+class _Idle_Server(object):
+	'''
+	Stands in for a server's _Broadcast_Server_Thread
+	'''
+	def report(self):
+		return {'avaliability': -4, 'score': 100.0}
+
+def _wait_for(condition):
+	'''
+	Waits up to 2 seconds for condition() to hold
+	'''
+	deadline = time.time() + 2
+	while not condition() and time.time() < deadline:
+		time.sleep(0.01)
+	return condition()
+
+class TestMembership(unittest.TestCase):
+
+	def setUp(self):
+		self.heartbeat_seconds = helpers.HEARTBEAT_SECONDS
+		self.cache_seconds = helpers.DISCOVERY_CACHE_SECONDS
+		self.broadcast = helpers._broadcast_client_thread
+
+	def tearDown(self):
+		helpers.HEARTBEAT_SECONDS = self.heartbeat_seconds
+		helpers.DISCOVERY_CACHE_SECONDS = self.cache_seconds
+		helpers._broadcast_client_thread = self.broadcast
+		helpers._discovery = (None, list())
+		membership = helpers._get_membership()
+		if membership is not None:
+			membership.members.clear()
+
+	def test_membership_1(self):
+		'''
+		Test that a server joins with its first heartbeat, gets the round 
+		trip time of the servers that answered a broadcast, and leaves when
+		it stops
+		'''
+		port = helpers.HEARTBEAT_PORT + 100
+		try:
+			membership = helpers._Membership(helpers.MULTICAST_GROUP_IP, port)
+		except helpers.socket.error:
+			self.skipTest("can't listen to multicast heartbeats here")
+		membership.start()
+		heartbeat = helpers._Heartbeat_Thread(helpers.MULTICAST_GROUP_IP, 
+			port, _Idle_Server())
+		heartbeat.start()
+		self.assertTrue(_wait_for(lambda: membership.members))
+		server = membership.members.keys()[0]
+		# no round trip time is known yet
+		self.assertEqual(membership.servers(), [])
+		membership.update([('10.0.0.9', 1, 0.25, None)])
+		self.assertEqual(sorted(membership.servers()), 
+			sorted([(server, -4, 0.25, {'avaliability': -4, 'score': 100.0}), 
+				('10.0.0.9', 1, 0.25, None)]))
+		heartbeat.stop()
+		self.assertTrue(_wait_for(lambda: server not in membership.members))
+
+	def test_membership_2(self):
+		'''
+		Ensure that servers are forgotten once they miss too many heartbeats
+		'''
+		membership = helpers._get_membership()
+		if membership is None:
+			self.skipTest("can't listen to multicast heartbeats here")
+		helpers.HEARTBEAT_SECONDS = 0.01
+		membership.update([('10.0.0.9', 1, 0.25, None)])
+		self.assertEqual(membership.servers(), [('10.0.0.9', 1, 0.25, None)])
+		time.sleep(0.01 * (helpers.HEARTBEATS_MISSED + 1))
+		self.assertEqual(membership.servers(), [])
+
+	def test_membership_3(self):
+		'''
+		Test that jobs look servers up without broadcasting once they are 
+		known, unless they ask for a fresh discovery
+		'''
+		if helpers._get_membership() is None:
+			self.skipTest("can't listen to multicast heartbeats here")
+		broadcasts = list()
+		def broadcast(mult_group_ip, mult_port, server_list):
+			broadcasts.append(mult_port)
+			server_list.append(('10.0.0.9', 1, 0.25, None))
+		helpers._broadcast_client_thread = broadcast
+		helpers.DISCOVERY_CACHE_SECONDS = 0
+		for fresh in (False, False, True):
+			servers = list()
+			helpers._discover(servers, fresh)
+			self.assertEqual(servers, [('10.0.0.9', 1, 0.25, None)])
+		self.assertEqual(len(broadcasts), 2)
@@ -0,0 +1,39 @@
+'''
+Ensures correctness for _merge_runs() using the PyUnit (unittest) package
+'''
+
+import unittest # our test package
+from parallelogram import helpers # exposes the functions to test
+
+class TestMergeRuns(unittest.TestCase):
+
+	def foo_1(self, elt1, elt2):
+		'''
+		Concatenates two lists, which is associative but not commutative
+		'''
+		return elt1 + elt2
+
+	def test_merge_runs_1(self):
+		'''
+		Test that runs of adjacent chunks are combined in chunk order
+		'''
+		runs = [(2, 2, [2]), (0, 0, [0]), (1, 1, [1])]
+		output = helpers._merge_runs(self.foo_1, runs, False)
+		self.assertEqual(output, [(0, 2, [0, 1, 2])])
+
+	def test_merge_runs_2(self):
+		'''
+		Ensure that runs with a gap between them are not combined
+		'''
+		runs = [(0, 1, [0, 1]), (3, 3, [3]), (4, 5, [4, 5])]
+		output = helpers._merge_runs(self.foo_1, runs, False)
+		self.assertEqual(output, [(0, 1, [0, 1]), (3, 5, [3, 4, 5])])
+
+	def test_merge_runs_3(self):
+		'''
+		Test that commutative runs are combined into one despite gaps
+		'''
+		runs = [(4, 4, [4]), (0, 1, [0, 1])]
+		output = helpers._merge_runs(self.foo_1, runs, True)
+		self.assertEqual(len(output), 1)
+		self.assertEqual(sorted(output[0][2]), [0, 1, 4])
@@ -0,0 +1,94 @@
+'''
+Ensures correctness for the metrics servers keep and answer requests for
+(metrics.Metrics and helpers._Metrics_Server_Thread) using the PyUnit 
+(unittest) package
+'''
+
+import json # reads the metrics back
+import shutil # cleans up spilled chunks
+import urllib2 # asks for the metrics like a monitoring system would
+import tempfile # gives us a directory to spill chunks to
+import unittest # our test package
+from parallelogram import helpers # the cache and thread to test
+from parallelogram import metrics # the classes to test
+
+class TestMetrics(unittest.TestCase):
+
+	def test_metrics_1(self):
+		'''
+		Test that latencies land in the right buckets, and that chunks are
+		counted per operation whether they completed or failed
+		'''
+		histogram = metrics.Histogram((0.1, 1))
+		for value in (0.05, 0.1, 0.5, 2, 3):
+			histogram.observe(value)
+		summary = histogram.summary()
+		self.assertEqual(summary['counts'], [2, 1, 2])
+		self.assertEqual(summary['count'], 5)
+		self.assertEqual(summary['max'], 3)
+		self.assertAlmostEqual(summary['mean'], 1.13)
+		server_metrics = metrics.Metrics(samples = 2)
+		server_metrics.message(100)
+		server_metrics.chunk('map')
+		server_metrics.chunk('map')
+		server_metrics.finished('map', {'queue': 0.5, 'loading': 0.001,
+			'compute': 2.0, 'dumping': 0.001}, 40, 0.01)
+		server_metrics.finished('map', None, 60, 0.01)
+		server_metrics.resend('function')
+		for waiting in (3, 5, 1):
+			server_metrics.sample(waiting, 2)
+		summary = json.loads(json.dumps(server_metrics.summary()))
+		self.assertEqual(summary['received'], {'map': 2})
+		self.assertEqual(summary['completed'], {'map': 1})
+		self.assertEqual(summary['failed'], {'map': 1})
+		self.assertEqual(summary['bytes_in'], 100)
+		self.assertEqual(summary['bytes_out'], 100)
+		self.assertEqual(summary['missing'], {'function': 1, 'data': 0})
+		self.assertEqual(summary['latencies']['compute']['count'], 1)
+		self.assertEqual(summary['latencies']['sending']['count'], 2)
+		self.assertEqual(len(summary['queue']['samples']), 2)
+		self.assertEqual(summary['queue']['waiting'], 1)
+		self.assertEqual(summary['queue']['max_waiting'], 5)
+
+	def test_metrics_2(self):
+		'''
+		Test that the dataset cache counts chunks found in memory or on disk
+		as hits and chunks it doesn't hold as misses
+		'''
+		directory = tempfile.mkdtemp()
+		try:
+			store = helpers._Chunk_Store(10, directory)
+			store.put((1, 0), 'a' * 8)
+			store.put((1, 1), 'b' * 8)
+			self.assertEqual(store.spilled(), 1)
+			self.assertEqual(store.get((1, 1)), 'b' * 8)
+			self.assertEqual(store.get((1, 0)), 'a' * 8)
+			self.assertEqual(store.get((1, 2)), None)
+			self.assertEqual((store.hits, store.misses), (2, 1))
+			store.drop(None)
+		finally:
+			shutil.rmtree(directory)
+
+	def test_metrics_3(self):
+		'''
+		Test that the metrics endpoint answers with JSON, samples the queue
+		while it waits for requests and knows no other paths
+		'''
+		samples = list()
+		thread = helpers._Metrics_Server_Thread('127.0.0.1', 0, 
+			lambda: {'completed': {'map': len(samples)}}, 
+			lambda: samples.append(None))
+		thread.start()
+		try:
+			url = 'http://127.0.0.1:%d' % thread.port
+			answer = json.loads(urllib2.urlopen(url + '/metrics').read())
+			self.assertTrue(answer['completed']['map'] >= 1)
+			with self.assertRaises(urllib2.HTTPError) as raised:
+				urllib2.urlopen(url + '/jobs')
+			self.assertEqual(raised.exception.code, 404)
+		finally:
+			thread.stop()
+			thread.join()
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,89 @@
+'''
+Ensures correctness for planner.Plan using the PyUnit (unittest) package
+'''
+
+import time # lets us fake an expensive function
+import unittest # our test package
+from parallelogram import planner # exposes the class to test
+
+def foo_1(elt, index):
+	'''
+	Increments an element by 1
+	'''
+	return elt + 1
+
+def foo_2(elt, index):
+	'''
+	Increments an element by 1, slowly
+	'''
+	time.sleep(0.01)
+	return elt + 1
+
+class TestPlanner(unittest.TestCase):
+
+	def test_planner_1(self):
+		'''
+		Ensure that a small, cheap job doesn't wait on server discovery
+		'''
+		plan = planner.Plan(foo_1, range(1000), 'map')
+		self.assertFalse(plan.worth_discovering())
+		self.assertFalse(plan.distribute)
+
+	def test_planner_2(self):
+		'''
+		Test that an expensive job is distributed when servers answer, but
+		not when none do
+		'''
+		plan = planner.Plan(foo_2, range(10000), 'map')
+		self.assertTrue(plan.worth_discovering())
+		plan.use_servers([])
+		self.assertFalse(plan.distribute)
+		plan.use_servers([('10.0.0.1', 0, 0.001), ('10.0.0.2', 0, 0.002)])
+		self.assertTrue(plan.distribute)
+		self.assertEqual(plan.servers, 2)
+
+	def test_planner_3(self):
+		'''
+		Test that chunks shrink as the job progresses but are never empty
+		or bigger than what is left
+		'''
+		plan = planner.Plan(foo_2, range(10000), 'map')
+		plan.use_servers([('10.0.0.1', 0, 0.001), ('10.0.0.2', 0, 0.002)])
+		first = plan.next_chunk_size(10000)
+		self.assertTrue(first <= 10000)
+		self.assertTrue(plan.next_chunk_size(1000) < first)
+		self.assertEqual(plan.next_chunk_size(1), 1)
+
+	def test_planner_4(self):
+		'''
+		Ensure that a job asked to be distributed is whenever there are
+		servers, however cheap it is, but never if it can't be pickled
+		'''
+		servers = [('10.0.0.1', 0, 0.001)]
+		plan = planner.Plan(foo_1, range(1000), 'map')
+		plan.use_servers(servers)
+		self.assertFalse(plan.distribute)
+		plan.use_servers(servers, force = True)
+		self.assertTrue(plan.distribute)
+		self.assertEqual(plan.backend, 'distributed')
+		plan.use_servers([], force = True)
+		self.assertFalse(plan.distribute)
+		plan = planner.Plan(foo_1, [open(__file__)], 'map')
+		plan.use_servers(servers, force = True)
+		self.assertFalse(plan.distribute)
+
+	def test_planner_5(self):
+		'''
+		Ensure that the estimate of what servers achieve is kept when chunks
+		come back sooner than their fixed costs allow for, rather than the
+		next chunk becoming everything that is left
+		'''
+		plan = planner.Plan(foo_2, range(10000), 'map')
+		plan.use_servers([('10.0.0.1', 0, 5.0), ('10.0.0.2', 0, 5.0)])
+		estimate = plan.remote_seconds_per_element
+		size = plan.next_chunk_size(10000)
+		plan.sent(size)
+		plan.observe(size, 0.001)
+		self.assertEqual(plan.remote_seconds_per_element, estimate)
+		self.assertEqual(plan.next_chunk_size(10000), size)
+		self.assertTrue(size < 10000)
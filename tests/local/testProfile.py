@@ -0,0 +1,85 @@
+'''
+Ensures correctness for profiling foo() over the chunks of a job
+(timing.Profile) using the PyUnit (unittest) package
+'''
+
+import unittest # our test package
+import pstats # reads the merged profiles
+import cStringIO # catches printed profiles
+import cloudpickle as pickle # pickles chunk messages like clients do
+from parallelogram import helpers # profiles chunks like servers do
+from parallelogram import parallelogram # runs the jobs to profile
+from parallelogram import timing # the class to test
+
+def _calls(profile, name):
+	'''
+	:return: number of calls to functions called name in a pstats.Stats
+	'''
+	return sum(nc for (_, _, function), (_, nc, _, _, _) in 
+		profile.stats.items() if function == name)
+
+def _double(elt, index):
+	return elt * 2
+
+class TestProfile(unittest.TestCase):
+
+	def test_profile_1(self):
+		'''
+		Test that the profiles of chunks add up into one, which starts out
+		empty and prints like any other profile
+		'''
+		profile = timing.Profile()
+		self.assertEqual(profile.stats, dict())
+		for chunk in ([1, 2, 3], [4, 5]):
+			_, stats = helpers._profile_op('map', _double, chunk)
+			profile.merge(stats)
+		self.assertEqual(_calls(profile, '_double'), 5)
+		self.assertEqual(_calls(profile, '_single_map'), 2)
+		profile.stream = cStringIO.StringIO()
+		profile.sort_stats('cumulative').print_stats()
+		self.assertTrue('_double' in profile.stream.getvalue())
+
+	def test_profile_2(self):
+		'''
+		Test that jobs return the profile of foo() over all of their chunks
+		last, and only when asked for it
+		'''
+		result, profile = parallelogram.p_map(_double, range(1000), 1001, 
+			10, backend = 'local', profile = True)
+		self.assertEqual(result, [elt * 2 for elt in range(1000)])
+		self.assertTrue(isinstance(profile, pstats.Stats))
+		self.assertEqual(_calls(profile, '_double'), 1000)
+		result, stats, profile = parallelogram.p_filter(
+			lambda elt, index: elt % 2, range(100), 1001, 10, 
+			backend = 'local', stats = True, profile = True)
+		self.assertEqual(len(result), 50)
+		self.assertTrue(isinstance(stats, timing.JobStats))
+		self.assertEqual(_calls(profile, '<lambda>'), 100)
+		self.assertEqual(parallelogram.p_map(_double, range(10), 1001, 10, 
+			backend = 'local'), [elt * 2 for elt in range(10)])
+
+	def test_profile_3(self):
+		'''
+		Test that servers only send a chunk's profile back if the job asked
+		for one
+		'''
+		func_bytes, digest = helpers._pickle_func(_double)
+		for profiled in (False, True):
+			envelope = {'func': None, 'func_digest': digest, 'op': 'map',
+				'index': 0, 'start': 0, 'batch': False, 'keep': False,
+				'dataset': None, 'cached': False, 'source': None, 
+				'raw': False, 'profile': profiled}
+			payload = helpers._join_parts([pickle.dumps(envelope)] + 
+				helpers._dump_parts([1, 2, 3]))
+			response = helpers._load_parts(helpers._process_chunk(digest, 
+				func_bytes, payload, 0.0)[0])
+			self.assertEqual(response['chunk'], [2, 4, 6])
+			if not profiled:
+				self.assertEqual(response['profile'], None)
+				continue
+			profile = timing.Profile()
+			profile.merge(response['profile'])
+			self.assertEqual(_calls(profile, '_double'), 3)
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,55 @@
+'''
+Ensures correctness for the framed wire protocol (_send_frame() and
+_recv_frame()) using the PyUnit (unittest) package
+'''
+
+import socket # gives us a connected pair of sockets to talk over
+import threading # so big frames can be sent and received at once
+import unittest # our test package
+from parallelogram import helpers # exposes the functions to test
+import cloudpickle as pickle # allows for (de)serialization
+
+class TestProtocol(unittest.TestCase):
+
+	def setUp(self):
+		self.sender, self.receiver = socket.socketpair()
+
+	def tearDown(self):
+		self.sender.close()
+		self.receiver.close()
+
+	def test_protocol_1(self):
+		'''
+		Test that a small frame arrives with its header intact
+		'''
+		payload = pickle.dumps({'chunk': range(6), 'index': 3})
+		helpers._send_frame(self.sender, helpers.MSG_CHUNK, 42, 9, payload)
+		msg_type, job_id, request_id, received = \
+			helpers._recv_frame(self.receiver)
+		self.assertEqual(msg_type, helpers.MSG_CHUNK)
+		self.assertEqual(job_id, 42)
+		self.assertEqual(request_id, 9)
+		self.assertEqual(helpers._loads(received), 
+			{'chunk': range(6), 'index': 3})
+
+	def test_protocol_2(self):
+		'''
+		Test that a multi-megabyte frame is reassembled completely
+		'''
+		payload = pickle.dumps(range(500000))
+		sender = threading.Thread(target = helpers._send_frame,
+			args = (self.sender, helpers.MSG_RESULT, 7, 0, payload))
+		sender.start()
+		msg_type, job_id, request_id, received = \
+			helpers._recv_frame(self.receiver)
+		sender.join()
+		self.assertEqual(len(received), len(payload))
+		self.assertEqual(helpers._loads(received), range(500000))
+
+	def test_protocol_3(self):
+		'''
+		Ensure that frames from another protocol version are rejected
+		'''
+		self.sender.sendall(helpers.FRAME_HEADER.pack(
+			helpers.PROTOCOL_VERSION + 1, helpers.MSG_CHUNK, 0, 1, 0, 0))
+		self.assertRaises(RuntimeError, helpers._recv_frame, self.receiver)
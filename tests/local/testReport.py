@@ -0,0 +1,64 @@
+'''
+Ensures correctness for the availability reports servers send and how
+helpers._Scheduler uses them, using the PyUnit (unittest) package
+'''
+
+import json # encodes the reports
+import collections # counts the chunks each server gets
+import unittest # our test package
+from parallelogram import helpers # exposes the functions to test
+
+class TestReport(unittest.TestCase):
+
+	def test_report_1(self):
+		'''
+		Test that reports are read, and that servers which only send their
+		avaliability metric are still understood
+		'''
+		report = {'avaliability': -3, 'cores': 4, 'memory': 2**30}
+		self.assertEqual(helpers._parse_report(json.dumps(report)), 
+			(-3, report))
+		self.assertEqual(helpers._parse_report('-2'), (-2, None))
+		self.assertRaises(ValueError, helpers._parse_report, 'busy')
+		self.assertEqual(helpers._report(('a', -2, 0.001)), None)
+		self.assertTrue(helpers._benchmark(0.01) > 0)
+
+	def test_report_2(self):
+		'''
+		Ensure that a server scoring twice as high in its benchmark gets 
+		twice as many chunks until it has been measured
+		'''
+		scheduler = helpers._Scheduler([
+			('a', -2, 0.001, {'avaliability': -2, 'score': 100.0}),
+			('b', -2, 0.001, {'avaliability': -2, 'score': 200.0})])
+		counts = collections.Counter(scheduler.assign(index, 10) 
+			for index in xrange(30))
+		self.assertEqual(counts, {'a': 10, 'b': 20})
+
+	def test_report_3(self):
+		'''
+		Ensure that a server short on memory gets fewer chunks than its free
+		workers would suggest
+		'''
+		scheduler = helpers._Scheduler([
+			('a', -4, 0.001, {'avaliability': -4, 
+				'memory': helpers.MEMORY_PER_SLOT}),
+			('b', -4, 0.001, {'avaliability': -4, 
+				'memory': 16 * helpers.MEMORY_PER_SLOT})])
+		counts = collections.Counter(scheduler.assign(index, 10) 
+			for index in xrange(25))
+		self.assertEqual(counts, {'a': 5, 'b': 20})
+		self.assertEqual(scheduler.assign(25, 10, exclude = ['b'], 
+			idle = True), None)
+
+	def test_report_4(self):
+		'''
+		Ensure that a server still running its benchmark gets chunks like
+		a server of average speed
+		'''
+		scheduler = helpers._Scheduler([
+			('a', -2, 0.001, {'avaliability': -2, 'score': None}),
+			('b', -2, 0.001, {'avaliability': -2, 'score': 100.0})])
+		counts = collections.Counter(scheduler.assign(index, 10) 
+			for index in xrange(30))
+		self.assertEqual(counts, {'a': 15, 'b': 15})
@@ -0,0 +1,53 @@
+'''
+Ensures correctness for helpers._Scheduler using the PyUnit (unittest) 
+package
+'''
+
+import collections # counts the chunks each server gets
+import unittest # our test package
+from parallelogram import helpers # exposes the class to test
+
+class TestScheduler(unittest.TestCase):
+
+	def test_scheduler_1(self):
+		'''
+		Ensure that, before anything is measured, servers get chunks in 
+		proportion to their free workers, and busy servers get fewer
+		'''
+		scheduler = helpers._Scheduler([('a', -1, 0.001), ('b', -3, 0.001)])
+		counts = collections.Counter(scheduler.assign(index, 10) 
+			for index in xrange(8))
+		self.assertEqual(counts, {'a': 2, 'b': 6})
+		scheduler = helpers._Scheduler([('a', 2, 0.001), ('b', -1, 0.001)])
+		self.assertEqual(scheduler.assign(0, 10), 'b')
+		self.assertEqual(scheduler.assign(1, 10), 'b')
+
+	def test_scheduler_2(self):
+		'''
+		Test that a server measured to be faster gets more of the chunks
+		'''
+		scheduler = helpers._Scheduler([('a', -1, 0.001), ('b', -1, 0.001)])
+		for index in xrange(2):
+			server = scheduler.assign(index, 10)
+			scheduler.finished(server, index, 0.1 if server == 'a' else 1.0)
+		counts = collections.Counter()
+		for index in xrange(2, 24):
+			server = scheduler.assign(index, 10)
+			counts[server] += 1
+		self.assertEqual(counts, {'a': 20, 'b': 2})
+
+	def test_scheduler_3(self):
+		'''
+		Test that excluded, busy and removed servers don't get chunks
+		'''
+		scheduler = helpers._Scheduler([('a', -1, 0.001), ('b', -1, 0.001)])
+		self.assertEqual(scheduler.assign(0, 10), 'a')
+		self.assertEqual(scheduler.assign(1, 10, exclude = ['a']), 'b')
+		self.assertEqual(scheduler.assign(2, 10, idle = True), None)
+		scheduler.finished('b', 1)
+		self.assertEqual(scheduler.assign(0, 10, exclude = ['a'], 
+			idle = True), 'b')
+		scheduler.remove('b')
+		self.assertEqual(len(scheduler), 1)
+		self.assertFalse('b' in scheduler)
+		self.assertEqual(scheduler.assign(3, 10), 'a')
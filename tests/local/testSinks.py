@@ -0,0 +1,77 @@
+'''
+Ensures correctness for writing results to disk as they arrive (sinks.Npy,
+sinks.Lines and sinks.Writer) using the PyUnit (unittest) package
+'''
+
+import os # builds the paths of the files to write
+import shutil # cleans up the files
+import tempfile # gives us a directory to write files to
+import unittest # our test package
+import numpy # reads the .npy files back
+from parallelogram import parallelogram # runs the jobs writing to sinks
+from parallelogram import sinks # the classes to test
+
+class TestSinks(unittest.TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	def test_sinks_1(self):
+		'''
+		Test that chunks of a map written out of order land at their place
+		in the .npy file, and that a filter's are written one after another
+		'''
+		path = os.path.join(self.directory, 'map.npy')
+		sink = sinks.Npy(path)
+		sink.start(6)
+		self.assertFalse(sink.ordered)
+		sink.write(4, numpy.array([[4, 40], [5, 50]]))
+		sink.write(0, [[0, 0], [1, 10], [2, 20], [3, 30]])
+		sink.close()
+		self.assertTrue((numpy.load(path) ==
+			numpy.array([[elt, elt * 10] for elt in range(6)])).all())
+		sink = sinks.Npy(path)
+		sink.start(None)
+		self.assertTrue(sink.ordered)
+		for chunk in ([], [1.5, 2.5], [], [3.5]):
+			sink.write(None, chunk)
+		sink.close()
+		self.assertEqual(list(numpy.load(path)), [1.5, 2.5, 3.5])
+
+	def test_sinks_2(self):
+		'''
+		Ensure that jobs write what they would have returned to a text file,
+		a .npy file or a function, and give back how much they wrote
+		'''
+		path = os.path.join(self.directory, 'map.txt')
+		self.assertEqual(parallelogram.p_map(lambda elt, index: elt * 2,
+			range(1000), 1001, 10, backend = 'local', out = path), 1000)
+		with open(path) as written:
+			self.assertEqual(written.read().split('\n'),
+				[str(elt * 2) for elt in range(1000)] + [''])
+		path = os.path.join(self.directory, 'filter.npy')
+		data = numpy.arange(10000)
+		self.assertEqual(parallelogram.p_filter(lambda chunk, indices:
+			chunk % 3 == 0, data, 1001, 10, backend = 'local', batch = True,
+			out = path), 3334)
+		self.assertTrue((numpy.load(path) == data[data % 3 == 0]).all())
+		chunks = list()
+		parallelogram.p_map(lambda elt, index: elt, range(1000), 1001, 10,
+			backend = 'local', out = chunks.append)
+		self.assertEqual(sum(chunks, []), range(1000))
+
+	def test_sinks_3(self):
+		'''
+		Ensure that results a .npy file can't hold raise a ValueError, and
+		that anything but a path, Sink or function can't be written to
+		'''
+		sink = sinks.Npy(os.path.join(self.directory, 'objects.npy'))
+		sink.start(None)
+		self.assertRaises(ValueError, sink.write, None, [{}, {}])
+		sink.write(None, [1, 2])
+		self.assertRaises(ValueError, sink.write, None, [[1, 2]])
+		sink.close()
+		self.assertRaises(TypeError, sinks._sink, 5)
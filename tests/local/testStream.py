@@ -0,0 +1,53 @@
+'''
+Ensures correctness for p_imap(), p_ifilter() and the _Chunker they cut
+chunks with using the PyUnit (unittest) package
+'''
+
+import itertools # lets us stream data of unknown length
+import unittest # our test package
+from parallelogram import helpers # exposes the class to test
+from parallelogram import planner # sizes the chunks
+from parallelogram.config import PORT # port the p_* functions are given
+from parallelogram import parallelogram # library methods
+
+def foo_1(elt, index):
+	'''
+	Pairs an element with its index
+	'''
+	return (index, elt)
+
+class TestStream(unittest.TestCase):
+
+	def test_stream_1(self):
+		'''
+		Test that mapping over a generator yields every element in order
+		'''
+		output = parallelogram.p_imap(foo_1, (elt * 2 for elt in xrange(1000)), 
+			PORT, 10, backend = 'local')
+		self.assertEqual(list(output), [(elt, elt * 2) for elt in range(1000)])
+
+	def test_stream_2(self):
+		'''
+		Test that an unordered stream only takes what it needs from an 
+		endless iterator, and that filtering an xrange works
+		'''
+		output = parallelogram.p_imap(foo_1, itertools.count(), PORT, 10, 
+			window = 2, ordered = False, backend = 'local')
+		self.assertEqual(len(list(itertools.islice(output, 500))), 500)
+		output = parallelogram.p_ifilter(lambda elt, index: elt % 3 == 0, 
+			xrange(100), PORT, 10, backend = 'local')
+		self.assertEqual(list(output), range(0, 100, 3))
+
+	def test_stream_3(self):
+		'''
+		Ensure that chunks cut from a list and from a generator cover the 
+		data exactly once
+		'''
+		plan = planner.Plan(foo_1, range(100), 'map')
+		for data in (range(100), iter(range(100))):
+			chunker = helpers._Chunker(data)
+			chunks = list(iter(lambda: chunker.next_chunk(plan), None))
+			self.assertEqual(helpers._flatten(chunk for _, chunk in chunks), 
+				range(100))
+			self.assertEqual([start for start, _ in chunks][0], 0)
+			self.assertEqual(chunker.remaining, 0)
@@ -0,0 +1,94 @@
+'''
+Ensures correctness for breaking down where the time of a job went
+(timing.JobStats) using the PyUnit (unittest) package
+'''
+
+import json # checks that summaries are plain values
+import unittest # our test package
+import cloudpickle as pickle # pickles chunk messages like clients do
+from parallelogram import helpers # processes chunks like servers do
+from parallelogram import parallelogram # runs the jobs to time
+from parallelogram import timing # the class to test
+
+class TestTiming(unittest.TestCase):
+
+	def test_timing_1(self):
+		'''
+		Test that stats count chunks per server, add up the times servers
+		report and summarize round trips into percentiles
+		'''
+		stats = timing.JobStats()
+		for seconds in (0.1, 0.2, 0.3, 0.4):
+			stats.chunk('10.0.0.1', 10, seconds)
+		stats.chunk(None, 5, 0.5)
+		stats.failed('10.0.0.2')
+		stats.served({'queue': 1.0, 'compute': 2.0})
+		stats.served({'queue': 0.5, 'loading': 0.25})
+		stats.count('retries')
+		stats.count('bytes_sent', 100)
+		stats.finish()
+		summary = stats.summary()
+		self.assertEqual(summary['chunks'], 5)
+		self.assertEqual(summary['retries'], 1)
+		self.assertEqual(summary['bytes_sent'], 100)
+		self.assertEqual(summary['phases']['queue'], 1.5)
+		self.assertEqual(summary['phases']['loading'], 0.25)
+		self.assertEqual(summary['phases']['compute'], 2.0)
+		self.assertEqual(summary['phases']['local'], 0.5)
+		self.assertEqual(summary['servers']['10.0.0.1']['chunks'], 4)
+		self.assertEqual(summary['servers']['10.0.0.1']['elements'], 40)
+		self.assertEqual(summary['servers']['10.0.0.1']['seconds_p50'], 0.3)
+		self.assertEqual(summary['servers']['10.0.0.1']['seconds_max'], 0.4)
+		self.assertEqual(summary['servers']['10.0.0.2']['failures'], 1)
+		self.assertEqual(summary['servers']['10.0.0.2']['seconds_p99'], None)
+		self.assertTrue(summary['seconds'] >= 0)
+		json.dumps(summary)
+		self.assertTrue('10.0.0.1' in str(stats))
+
+	def test_timing_2(self):
+		'''
+		Test that jobs return their stats after their result (and plan) when
+		asked for them
+		'''
+		data = range(100)
+		result, stats = parallelogram.p_map(lambda elt, index: elt * 2, 
+			data, 1001, 10, backend = 'local', stats = True)
+		self.assertEqual(result, [elt * 2 for elt in range(100)])
+		self.assertTrue(isinstance(stats, timing.JobStats))
+		self.assertTrue(stats.chunks >= 1)
+		self.assertTrue(stats.seconds > 0)
+		self.assertTrue(stats.phases['planning'] > 0)
+		result, plan, stats = parallelogram.p_filter(
+			lambda elt, index: elt % 2, range(100), 1001, 10, 
+			explain = True, backend = 'local', stats = True)
+		self.assertEqual(len(result), 50)
+		self.assertTrue(stats is plan.stats)
+		result, stats = parallelogram.p_reduce(lambda a, b: a + b, 
+			range(100), 1001, 10, backend = 'local', stats = True)
+		self.assertEqual(result, sum(range(100)))
+		self.assertEqual(parallelogram.p_map(lambda elt, index: elt, [1], 
+			1001, 10, backend = 'local'), [1])
+
+	def test_timing_3(self):
+		'''
+		Test that servers report how long a chunk waited for a worker, 
+		how long unpickling it took and how long foo() ran on it
+		'''
+		func_bytes, digest = helpers._pickle_func(lambda elt, index: elt + 1)
+		envelope = {'func': None, 'func_digest': digest, 'op': 'map',
+			'index': 3, 'start': 0, 'batch': False, 'keep': False,
+			'dataset': None, 'cached': False, 'source': None, 'raw': False,
+			'profile': False}
+		payload = helpers._join_parts([pickle.dumps(envelope)] + 
+			helpers._dump_parts([1, 2, 3]))
+		received = helpers.timeit.default_timer()
+		response = helpers._load_parts(helpers._process_chunk(digest, 
+			func_bytes, payload, received)[0])
+		self.assertEqual(response['chunk'], [2, 3, 4])
+		self.assertEqual(sorted(response['timing']), 
+			['compute', 'loading', 'queue'])
+		for seconds in response['timing'].values():
+			self.assertTrue(seconds >= 0)
+
+if __name__ == '__main__':
+	unittest.main()
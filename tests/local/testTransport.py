@@ -0,0 +1,58 @@
+'''
+Ensures correctness for _dump_parts() and _load_parts() using the PyUnit
+(unittest) package
+'''
+
+import numpy # arrays are sent out of band
+import unittest # our test package
+import cStringIO # lets us read several objects out of one message
+import cloudpickle as pickle # pickles the envelope in front of a chunk
+from parallelogram import helpers # exposes the functions to test
+
+class TestTransport(unittest.TestCase):
+
+	def test_transport_1(self):
+		'''
+		Test that big arrays are rebuilt as views of the receive buffer
+		'''
+		array = numpy.arange(100000, dtype = numpy.float32).reshape(1000, 100)
+		parts = helpers._dump_parts({'chunk': array, 'index': 3})
+		payload = bytearray(helpers._join_parts(parts))
+		# the pickle itself stays small
+		self.assertTrue(len(parts[1]) < 1000)
+		output = helpers._load_parts(payload)
+		self.assertEqual(output['index'], 3)
+		self.assertTrue(numpy.array_equal(output['chunk'], array))
+		self.assertEqual(output['chunk'].dtype, numpy.float32)
+		output['chunk'][0, 0] = -1
+		self.assertEqual(output['chunk'][0, 0], -1)
+		self.assertTrue(numpy.may_share_memory(output['chunk'], 
+			numpy.frombuffer(payload, numpy.uint8)))
+
+	def test_transport_2(self):
+		'''
+		Ensure that data cPickle can't pickle falls back to cloudpickle, and
+		that small arrays and views with gaps are pickled as usual
+		'''
+		array = numpy.arange(10000)[::2]
+		chunk = [lambda elt: elt + 1, array, numpy.arange(3)]
+		output = helpers._load_parts(helpers._join_parts(
+			helpers._dump_parts(chunk)))
+		self.assertEqual(output[0](1), 2)
+		self.assertTrue(numpy.array_equal(output[1], array))
+		self.assertTrue(numpy.array_equal(output[2], numpy.arange(3)))
+
+	def test_transport_3(self):
+		'''
+		Test that a chunk is read from behind its envelope and that the 
+		stream is left where the chunk ends
+		'''
+		parts = [pickle.dumps('envelope')]
+		parts += helpers._dump_parts(numpy.arange(5000))
+		parts += helpers._dump_parts(range(3))
+		payload = helpers._join_parts(parts)
+		stream = cStringIO.StringIO(payload)
+		self.assertEqual(pickle.load(stream), 'envelope')
+		output = helpers._load_parts(payload, stream)
+		self.assertEqual(output.tolist(), range(5000))
+		self.assertEqual(helpers._load_parts(payload, stream), range(3))
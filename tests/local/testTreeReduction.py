@@ -0,0 +1,91 @@
+'''
+Ensures correctness for how the client collects tree reductions 
+(_collect_tree()) and how servers keep their part of them, using the PyUnit
+(unittest) package
+'''
+
+import unittest # our test package
+from parallelogram import helpers # exposes the function to test
+from parallelogram import planner # plans the reductions
+from parallelogram import parallelogram # runs the rounds of reductions
+from parallelogram import parallelogram_server # exposes the server to test
+
+class TestTreeReduction(unittest.TestCase):
+
+	def setUp(self):
+		self.send_collect = helpers._send_collect
+		self.run = parallelogram._run
+		self.reduce = parallelogram.p_reduce
+
+	def tearDown(self):
+		helpers._send_collect = self.send_collect
+		parallelogram._run = self.run
+		parallelogram.p_reduce = self.reduce
+
+	def reply(self, replies):
+		'''
+		Makes the servers answer the collect messages with replies, a dict
+		of server -> reply, rather than being asked over the network
+		'''
+		def send_collect(queue, server, port, job_id, message, timeout):
+			queue.put((server, replies[server]))
+		helpers._send_collect = send_collect
+
+	def test_tree_reduction_1(self):
+		'''
+		Test that the root's runs are returned, and that a job without any
+		chunks has nothing to collect
+		'''
+		self.reply({'10.0.0.1': {'runs': [(0, 2, 6)]},
+			'10.0.0.2': {'runs': None}})
+		self.assertEqual(helpers._collect_tree((None, 'digest'), 1, 
+			['10.0.0.2', '10.0.0.1', '10.0.0.2'], 0, 1, False), [6])
+		self.assertEqual(helpers._collect_tree((None, 'digest'), 1, [], 0, 1,
+			False), [])
+
+	def test_tree_reduction_2(self):
+		'''
+		Ensure that a root sending back no runs raises an error naming it
+		'''
+		self.reply({'10.0.0.1': {'runs': None}, '10.0.0.2': {'runs': None}})
+		with self.assertRaises(RuntimeError) as raised:
+			helpers._collect_tree((None, 'digest'), 1, 
+				['10.0.0.1', '10.0.0.2'], 0, 1, False)
+		self.assertTrue('10.0.0.1' in str(raised.exception))
+
+	def test_tree_reduction_3(self):
+		'''
+		Test that a server drops the partial reductions of jobs it hasn't
+		heard from in a while, but not those of jobs still going
+		'''
+		server = parallelogram_server.Server(0)
+		server.reduction(1).partials[0] = 'stale'
+		server.reduction(2).partials[0] = 'fresh'
+		server.reductions[1].touched -= \
+			parallelogram_server.REDUCTION_SECONDS + 1
+		server.reduction(3)
+		self.assertEqual(sorted(server.reductions), [2, 3])
+		self.assertEqual(server.reduction(2).partials, {0: 'fresh'})
+
+	def test_tree_reduction_4(self):
+		'''
+		Ensure that the partial reductions a distributed job leaves are 
+		reduced again the way the caller asked for
+		'''
+		def run(foo, data, port, op, timeout, plan, backend, associative,
+			commutative):
+			plan.backend = 'distributed'
+			return [1, 2]
+		rounds = list()
+		def reduce_again(foo, data, port, timeout, **arguments):
+			rounds.append((data, arguments))
+			return sum(data)
+		parallelogram._run = run
+		parallelogram.p_reduce = reduce_again
+		foo = lambda elt1, elt2: elt1 + elt2
+		plan = planner.Plan(foo, range(10), 'reduce')
+		self.assertEqual(parallelogram._reduce(foo, range(10), 0, 1, plan,
+			'distributed', True, True), 3)
+		self.assertEqual(rounds, [([1, 2], {'associative': True, 
+			'commutative': True, 'backend': 'distributed', 
+			'compression': plan.compression})])